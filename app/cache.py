@@ -0,0 +1,66 @@
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+
+#In-process menu cache for GET /foods.
+#Every food write (create, availability change, stock change) calls
+#menu_cache.invalidate() after commit, which bumps the version and drops the
+#stored body. Readers only store a body if the version they read under is
+#still current, so a slow reader can never put a stale menu back.
+
+# Upper bound on how long a body is served, so other worker processes
+# (which do not see our invalidations) converge on fresh data
+MENU_CACHE_TTL = 30
+
+
+@dataclass(frozen=True)
+class CachedBody:
+    version: int
+    etag: str
+    body: bytes
+    stored_at: float
+
+
+class MenuCache:
+    def __init__(self, ttl: float = MENU_CACHE_TTL):
+        self.ttl = ttl
+        self.version = 0
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        entry = self._entry
+        if entry is None or entry.version != self.version:
+            return None
+        if time.monotonic() - entry.stored_at > self.ttl:
+            return None
+        return entry
+
+    def store(self, version: int, body: bytes) -> CachedBody:
+        # ETag is derived from the body so every worker agrees on it
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        entry = CachedBody(version, etag, body, time.monotonic())
+
+        with self._lock:
+            if version == self.version:
+                self._entry = entry
+
+        return entry
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._entry = None
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates
+
+
+menu_cache = MenuCache()
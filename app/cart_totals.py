@@ -0,0 +1,121 @@
+import sys
+
+from sqlalchemy import func, select, update
+
+from app.models import Cart, CartItem, Food
+
+#Carts carry item_count (sum of quantities) and total (sum of quantity x
+#current food price), kept up to date by the cart routes in the same
+#transaction as the item change, so the cart summary is one row read.
+#Changes are applied as "col = col + delta" in SQL, never read-modify-write,
+#so two concurrent requests on one cart cannot lose an update.
+#
+#The stored numbers drift when something changes underneath them: a food's
+#price, or a write that skipped these helpers. reconcile_cart_totals
+#recomputes carts from their items and repairs the ones that differ; the
+#import path runs it for carts holding repriced foods, and
+#    python -m app.cart_totals
+#checks every cart.
+
+RECONCILE_BATCH_SIZE = 1000
+TOTAL_TOLERANCE = 0.005  # float sums of prices may differ in the last digits
+
+
+def adjust_cart_totals(cart: Cart, quantity_delta: int, amount_delta: float):
+    #Applied on flush as UPDATE carts SET item_count = item_count + ?, ...
+    if not quantity_delta and not amount_delta:
+        return
+    cart.item_count = Cart.item_count + quantity_delta
+    cart.total = Cart.total + amount_delta
+
+
+def reset_cart_totals(db, cart_id: int):
+    db.execute(
+        update(Cart)
+        .where(Cart.id == cart_id)
+        .values(item_count=0, total=0)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _actual_count():
+    return select(func.coalesce(func.sum(CartItem.quantity), 0)).where(
+        CartItem.cart_id == Cart.id
+    ).scalar_subquery()
+
+
+def _actual_total():
+    return select(func.coalesce(func.sum(CartItem.quantity * Food.price), 0.0)).join(
+        Food, Food.id == CartItem.food_id
+    ).where(CartItem.cart_id == Cart.id).scalar_subquery()
+
+
+def recompute_cart_totals(db, cart_ids):
+    #Rewrites the stored totals of cart_ids from their items, in one UPDATE
+    db.execute(
+        update(Cart)
+        .where(Cart.id.in_(cart_ids))
+        .values(item_count=_actual_count(), total=_actual_total())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _drifted(cart_ids):
+    #Carts among cart_ids whose stored totals no longer match their items
+    actual_count = _actual_count()
+    actual_total = _actual_total()
+    return select(Cart.id).where(
+        Cart.id.in_(cart_ids),
+        (Cart.item_count != actual_count)
+        | (func.abs(Cart.total - actual_total) > TOTAL_TOLERANCE)
+    )
+
+
+def reconcile_cart_totals(db, food_ids=None, batch_size: int = RECONCILE_BATCH_SIZE) -> dict:
+    """Recompute stored cart totals and repair the ones that drifted.
+
+    Works on a Session or a Connection; the caller commits. Walks carts in
+    id order, batch_size at a time (only carts holding one of food_ids,
+    when given), and rewrites drifted carts with one set-based UPDATE per
+    batch. Returns {"checked": n, "repaired": n}.
+    """
+    checked = repaired = 0
+    after = 0
+
+    while True:
+        query = select(Cart.id).where(Cart.id > after).order_by(Cart.id).limit(batch_size)
+        if food_ids is not None:
+            query = query.where(Cart.id.in_(
+                select(CartItem.cart_id).where(CartItem.food_id.in_(list(food_ids)))
+            ))
+
+        cart_ids = list(db.execute(query).scalars())
+        if not cart_ids:
+            break
+
+        drifted = list(db.execute(_drifted(cart_ids)).scalars())
+        if drifted:
+            recompute_cart_totals(db, drifted)
+
+        checked += len(cart_ids)
+        repaired += len(drifted)
+        after = cart_ids[-1]
+
+    return {"checked": checked, "repaired": repaired}
+
+
+def main() -> int:
+    from app.database import engine
+    from app import migrations
+
+    migrations.ensure_schema(engine)
+
+    with engine.begin() as conn:
+        result = reconcile_cart_totals(conn)
+
+    print(f"checked {result['checked']} carts, repaired {result['repaired']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+import os
+from dataclasses import dataclass
+
+#Application settings, read from environment variables so each deployment
+#(and each benchmark run) can tune them without code changes.
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass
+class Settings:
+    # Database (any SQLAlchemy URL, e.g. postgresql+psycopg2://user:pw@host/db)
+    database_url: str = "sqlite:///./chuks_database.db"
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: int = 30  # seconds to wait for a pooled connection
+    # "sync": session work runs in the threadpool (capped at its size)
+    # "async": AsyncSession on aiosqlite/asyncpg, no thread per request
+    db_mode: str = "sync"
+    async_database_url: str = ""  # derived from database_url when empty
+    # Create tables / apply migrations at startup when the schema is behind;
+    # turn off when deploys run `python -m app.migrations` first
+    db_auto_migrate: bool = True
+
+    # SQLite only, applied on every new connection
+    sqlite_wal: bool = True  # readers no longer wait behind the writer
+    sqlite_synchronous: str = "NORMAL"  # safe with WAL, one fsync per checkpoint
+    sqlite_busy_timeout_ms: int = 5000  # wait for the write lock instead of "database is locked"
+    sqlite_cache_size_kb: int = 65536
+    sqlite_mmap_size: int = 268435456
+    # One writer thread serves cart/signup writes in arrival order, for a
+    # bounded p99 under write contention (not more throughput), see app/write_queue.py
+    sqlite_serial_writes: bool = False
+    write_batch_size: int = 64  # units of work per transaction at most
+
+    # Password hashing
+    bcrypt_rounds: int = 12  # work factor; older hashes are upgraded on login
+    hash_workers: int = 2  # threads dedicated to bcrypt
+    hash_queue_limit: int = 16  # hashes running + waiting before we answer 503
+
+    # Session tokens, see app/utils/tokens.py
+    token_keys: str = ""  # "kid:secret,..." first one signs; empty = random key, development only
+    app_env: str = "development"  # anything else requires TOKEN_KEYS
+    token_ttl_seconds: int = 3600
+    token_revocation_size: int = 10000  # revoked token ids kept in memory
+
+    # Rate limits on /signup, /login and /verify, see app/rate_limit.py
+    rate_limit_enabled: bool = True
+    rate_limit_backend: str = "memory"
+    rate_limit_max_keys: int = 100000  # buckets kept in memory, LRU
+    rate_limit_ip_per_minute: int = 30  # per client IP and route; 0 = no limit
+    rate_limit_ip_burst: int = 20
+    rate_limit_email_per_minute: int = 5  # per email and route; 0 = no limit
+    rate_limit_email_burst: int = 10
+
+    # Pending orders never paid are cancelled after this, see app/order_sweeper.py
+    pending_order_ttl_seconds: int = 1800
+    order_sweep_interval_seconds: int = 60  # 0 turns the sweeper off
+    order_sweep_batch_size: int = 500
+
+    # Idempotency-Key on /order/create and /pay, see app/idempotency.py
+    idempotency_ttl_seconds: int = 86400  # how long a key's stored result is replayed
+    idempotency_cache_size: int = 10000  # results also kept in memory, LRU
+    idempotency_cache_ttl_seconds: int = 600
+
+    # Background jobs, see app/jobs.py
+    job_workers: int = 2  # worker threads per process; 0 leaves jobs in the outbox
+    job_max_attempts: int = 5  # then the job is marked failed
+    job_backoff_seconds: int = 2  # retry n waits job_backoff_seconds * 2**(n-1)
+    job_poll_seconds: int = 5  # idle workers look for due retries this often
+    job_lease_seconds: int = 60  # a running job not finished by then is retried
+    notify_transport: str = "console"  # "console" prints messages, "stub" keeps them in memory
+
+    # JSON responses, see app/responses.py
+    orjson_responses: bool = False  # orjson as the app's default response class
+
+    # Observability
+    metrics_enabled: bool = True  # request/SQL metrics at /metrics
+    db_diagnostics: bool = False  # slow query log + N+1 detector, see app/diagnostics.py
+    slow_query_ms: int = 100  # log statements slower than this, with their plan
+    n_plus_one_threshold: int = 5  # warn when one statement shape runs more often per request
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            database_url=os.getenv("DATABASE_URL", cls.database_url),
+            db_pool_size=_env_int("DB_POOL_SIZE", cls.db_pool_size),
+            db_max_overflow=_env_int("DB_MAX_OVERFLOW", cls.db_max_overflow),
+            db_pool_timeout=_env_int("DB_POOL_TIMEOUT", cls.db_pool_timeout),
+            db_mode=os.getenv("DB_MODE", cls.db_mode).strip().lower(),
+            async_database_url=os.getenv("ASYNC_DATABASE_URL", cls.async_database_url),
+            db_auto_migrate=_env_bool("DB_AUTO_MIGRATE", cls.db_auto_migrate),
+            sqlite_wal=_env_bool("SQLITE_WAL", cls.sqlite_wal),
+            sqlite_synchronous=os.getenv("SQLITE_SYNCHRONOUS", cls.sqlite_synchronous),
+            sqlite_busy_timeout_ms=_env_int("SQLITE_BUSY_TIMEOUT_MS", cls.sqlite_busy_timeout_ms),
+            sqlite_cache_size_kb=_env_int("SQLITE_CACHE_SIZE_KB", cls.sqlite_cache_size_kb),
+            sqlite_mmap_size=_env_int("SQLITE_MMAP_SIZE", cls.sqlite_mmap_size),
+            sqlite_serial_writes=_env_bool("SQLITE_SERIAL_WRITES", cls.sqlite_serial_writes),
+            write_batch_size=_env_int("WRITE_BATCH_SIZE", cls.write_batch_size),
+            bcrypt_rounds=_env_int("BCRYPT_ROUNDS", cls.bcrypt_rounds),
+            hash_workers=_env_int("HASH_WORKERS", cls.hash_workers),
+            hash_queue_limit=_env_int("HASH_QUEUE_LIMIT", cls.hash_queue_limit),
+            token_keys=os.getenv("TOKEN_KEYS", cls.token_keys),
+            app_env=os.getenv("APP_ENV", cls.app_env).strip().lower(),
+            token_ttl_seconds=_env_int("TOKEN_TTL_SECONDS", cls.token_ttl_seconds),
+            token_revocation_size=_env_int("TOKEN_REVOCATION_SIZE", cls.token_revocation_size),
+            rate_limit_enabled=_env_bool("RATE_LIMIT_ENABLED", cls.rate_limit_enabled),
+            rate_limit_backend=os.getenv("RATE_LIMIT_BACKEND", cls.rate_limit_backend).strip().lower(),
+            rate_limit_max_keys=_env_int("RATE_LIMIT_MAX_KEYS", cls.rate_limit_max_keys),
+            rate_limit_ip_per_minute=_env_int("RATE_LIMIT_IP_PER_MINUTE", cls.rate_limit_ip_per_minute),
+            rate_limit_ip_burst=_env_int("RATE_LIMIT_IP_BURST", cls.rate_limit_ip_burst),
+            rate_limit_email_per_minute=_env_int("RATE_LIMIT_EMAIL_PER_MINUTE", cls.rate_limit_email_per_minute),
+            rate_limit_email_burst=_env_int("RATE_LIMIT_EMAIL_BURST", cls.rate_limit_email_burst),
+            pending_order_ttl_seconds=_env_int("PENDING_ORDER_TTL_SECONDS", cls.pending_order_ttl_seconds),
+            order_sweep_interval_seconds=_env_int("ORDER_SWEEP_INTERVAL_SECONDS", cls.order_sweep_interval_seconds),
+            order_sweep_batch_size=_env_int("ORDER_SWEEP_BATCH_SIZE", cls.order_sweep_batch_size),
+            idempotency_ttl_seconds=_env_int("IDEMPOTENCY_TTL_SECONDS", cls.idempotency_ttl_seconds),
+            idempotency_cache_size=_env_int("IDEMPOTENCY_CACHE_SIZE", cls.idempotency_cache_size),
+            idempotency_cache_ttl_seconds=_env_int("IDEMPOTENCY_CACHE_TTL_SECONDS", cls.idempotency_cache_ttl_seconds),
+            job_workers=_env_int("JOB_WORKERS", cls.job_workers),
+            job_max_attempts=_env_int("JOB_MAX_ATTEMPTS", cls.job_max_attempts),
+            job_backoff_seconds=_env_int("JOB_BACKOFF_SECONDS", cls.job_backoff_seconds),
+            job_poll_seconds=_env_int("JOB_POLL_SECONDS", cls.job_poll_seconds),
+            job_lease_seconds=_env_int("JOB_LEASE_SECONDS", cls.job_lease_seconds),
+            notify_transport=os.getenv("NOTIFY_TRANSPORT", cls.notify_transport).strip().lower(),
+            orjson_responses=_env_bool("ORJSON_RESPONSES", cls.orjson_responses),
+            metrics_enabled=_env_bool("METRICS_ENABLED", cls.metrics_enabled),
+            db_diagnostics=_env_bool("DB_DIAGNOSTICS", cls.db_diagnostics),
+            slow_query_ms=_env_int("SLOW_QUERY_MS", cls.slow_query_ms),
+            n_plus_one_threshold=_env_int("N_PLUS_ONE_THRESHOLD", cls.n_plus_one_threshold),
+        )
+
+
+settings = Settings.from_env()
@@ -1,27 +1,134 @@
-from sqlalchemy import create_engine
+import anyio
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import StaticPool
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-#sql Database file path, creates database and setups into the file chuks_kitchen.db
+from app.config import settings
+from app.metrics import instrument_engine
+from app import diagnostics
+
+#Database URL comes from settings (DATABASE_URL); the default is still the
+#local file chuks_database.db. PostgreSQL works with the same models, just
+#point DATABASE_URL at it.
+
+DATABASE_URL = settings.database_url
+
+
+def _is_sqlite(url) -> bool:
+    return url.get_backend_name() == "sqlite"
+
+
+def _is_memory_sqlite(url) -> bool:
+    return _is_sqlite(url) and url.database in (None, "", ":memory:")
+
+
+def _apply_sqlite_pragmas(settings):
+    #WAL lets /foods and /cart readers run while a write is in progress;
+    #busy_timeout makes writers queue for the lock instead of failing with
+    #"database is locked". These are per-connection, so run them on connect.
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if settings.sqlite_wal:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+        cursor.execute(f"PRAGMA cache_size=-{int(settings.sqlite_cache_size_kb)}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+        cursor.close()
+
+    return on_connect
+
+
+def _engine_kwargs(url, settings, engine_kwargs):
+    kwargs = dict(engine_kwargs)
+
+    if _is_sqlite(url):
+        #disabale same thread restrictions of the database
+        kwargs.setdefault("connect_args", {"check_same_thread": False})
+
+    # In-memory SQLite must share one connection across threads, or every
+    # thread would see its own empty database; pool sizing does not apply
+    if _is_memory_sqlite(url):
+        kwargs.setdefault("poolclass", StaticPool)
+    else:
+        kwargs.setdefault("pool_size", settings.db_pool_size)
+        kwargs.setdefault("max_overflow", settings.db_max_overflow)
+        kwargs.setdefault("pool_timeout", settings.db_pool_timeout)
+
+    if not _is_sqlite(url):
+        kwargs.setdefault("pool_pre_ping", True)
+
+    return kwargs
 
-DATABASE_URL = "sqlite:///./chuks_database.db"
 
 #creates engine( links the python to the database)
+def build_engine(settings, **engine_kwargs):
+    url = make_url(settings.database_url)
+    new_engine = create_engine(url, **_engine_kwargs(url, settings, engine_kwargs))
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread":False} #disabale same thread restrictions of the database
+    if _is_sqlite(url):
+        event.listen(new_engine, "connect", _apply_sqlite_pragmas(settings))
 
-)
+    if settings.metrics_enabled:
+        instrument_engine(new_engine)
+
+    if settings.db_diagnostics:
+        diagnostics.instrument_engine(new_engine, settings.slow_query_ms)
+
+    return new_engine
+
+
+# Async drivers for the backends we run on: aiosqlite locally, asyncpg in production
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def async_url_for(settings):
+    if settings.async_database_url:
+        return make_url(settings.async_database_url)
+
+    url = make_url(settings.database_url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    return url.set(drivername=driver) if driver else url
+
+
+def build_async_engine(settings, **engine_kwargs):
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = async_url_for(settings)
+    new_engine = create_async_engine(url, **_engine_kwargs(url, settings, engine_kwargs))
+
+    if _is_sqlite(url):
+        event.listen(new_engine.sync_engine, "connect", _apply_sqlite_pragmas(settings))
+
+    if settings.metrics_enabled:
+        instrument_engine(new_engine.sync_engine)
+
+    if settings.db_diagnostics:
+        diagnostics.instrument_engine(new_engine.sync_engine, settings.slow_query_ms)
+
+    return new_engine
+
+
+class _SessionFactory(sessionmaker):
+    #Binds itself to the engine on first use, see init_engine
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            get_engine()
+        return super().__call__(**local_kw)
 
 
 #This is how we talk to the database,Every API request will:Open session,Query database,Commit changes and Close session
-SessionLocal = sessionmaker(
+SessionLocal = _SessionFactory(
 
     autocommit=False,#disabale autocommit
 
     autoflush=False,#disable autoflush
-    
-    bind=engine
 )
 
 #Base class for models
@@ -33,4 +140,118 @@ def get_db():
     try:
         yield db  # yield the session
     finally:
-        db.close()  # always close session
\ No newline at end of file
+        db.close()  # always close session
+
+
+#Engines are built on first use, not at import: importing the app (a test,
+#a CLI, each uvicorn worker before it serves) opens no connection.
+#create_app's lifespan calls init_engine(settings); anything else gets the
+#engine for the global settings through get_engine(), or the module
+#attributes `engine` / `async_engine`.
+_engine = None
+_async_engine = None
+_engine_settings = None
+
+#Async session, only built when DB_MODE=async so aiosqlite/asyncpg stay optional
+AsyncSessionLocal = None
+
+
+def init_engine(engine_settings=settings):
+    global _engine, _async_engine, _engine_settings, AsyncSessionLocal
+
+    if _engine is not None and _engine_settings is engine_settings:
+        return _engine
+
+    if engine_settings.db_mode not in ("sync", "async"):
+        raise ValueError(f"DB_MODE must be 'sync' or 'async', got {engine_settings.db_mode!r}")
+
+    _engine = build_engine(engine_settings)
+    SessionLocal.configure(bind=_engine)
+
+    if engine_settings.db_mode == "async":
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        _async_engine = build_async_engine(engine_settings)
+        AsyncSessionLocal = async_sessionmaker(_async_engine, autoflush=False)
+    else:
+        _async_engine = None
+        AsyncSessionLocal = None
+
+    _engine_settings = engine_settings
+    return _engine
+
+
+def get_engine():
+    return _engine if _engine is not None else init_engine()
+
+
+def __getattr__(name):
+    if name == "engine":
+        return get_engine()
+    if name == "async_engine":
+        get_engine()
+        return _async_engine
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+"""Routes are async def and keep their database logic in plain functions
+that take a Session. A SessionRunner runs such a function for the route:
+
+SyncSessionRunner  -> blocking Session in the threadpool (DB_MODE=sync)
+AsyncSessionRunner -> AsyncSession.run_sync, so the same ORM code does its
+                      IO through aiosqlite/asyncpg on the event loop (DB_MODE=async)
+
+    return await db.run(_get_cart, user_id)
+
+Writes can go through db.write(fn, ...) instead: with SQLITE_SERIAL_WRITES=1
+the function runs on the app's SQLite writer thread (app.state.write_queue,
+see app/write_queue.py); otherwise it is the same as run."""
+
+class _Runner:
+    writer = None  # the app's running WriteQueue, if any
+
+    async def write(self, fn, *args, **kwargs):
+        if self.writer is not None and self.writer.running:
+            return await self.writer.write(fn, *args, **kwargs)
+        return await self.run(fn, *args, **kwargs)
+
+
+class SyncSessionRunner(_Runner):
+    def __init__(self, session, writer=None):
+        self.session = session
+        self.writer = writer
+
+    async def run(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.session, *args, **kwargs)
+
+
+class AsyncSessionRunner(_Runner):
+    def __init__(self, session, writer=None):
+        self.session = session
+        self.writer = writer
+
+    async def run(self, fn, *args, **kwargs):
+        return await self.session.run_sync(fn, *args, **kwargs)
+
+
+SessionRunner = SyncSessionRunner | AsyncSessionRunner
+
+_close_limiter = anyio.CapacityLimiter(4)
+
+
+async def get_runner(request: Request):
+    get_engine()
+    writer = request.app.state.write_queue
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as db:
+            yield AsyncSessionRunner(db, writer)
+        return
+
+    db = SessionLocal()
+    try:
+        yield SyncSessionRunner(db, writer)
+    finally:
+        # Close on its own limiter, not the request threadpool: if every pool
+        # thread is waiting for a connection, the close that would hand ours
+        # back must not queue behind them (same as FastAPI does for get_db)
+        await anyio.to_thread.run_sync(db.close, limiter=_close_limiter)
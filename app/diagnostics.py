@@ -0,0 +1,175 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+
+#Diagnostic mode for the engine (DB_DIAGNOSTICS=1), for development, CI and
+#chasing a production incident; the always-on numbers live in app/metrics.py.
+#
+#Slow query log: any statement slower than SLOW_QUERY_MS is logged with its
+#bound parameters and the database's query plan.
+#N+1 detector: DiagnosticsMiddleware counts statement shapes per request
+#and warns when one shape runs more than N_PLUS_ONE_THRESHOLD times (a
+#lazy load inside a loop), or when a route runs more queries than its
+#@query_budget. Every finished request is also handed to `observers`,
+#which is how app/pytest_plugin.py fails tests that go over budget.
+
+logger = logging.getLogger(__name__)
+
+# Prefix that turns a statement into a plan query, per dialect
+EXPLAIN_PREFIXES = {
+    "sqlite": "EXPLAIN QUERY PLAN ",
+    "postgresql": "EXPLAIN ",
+}
+
+# "IN (?, ?, ?)" and "IN (?)" are the same shape
+_PLACEHOLDER = r"(?:\?|%s|%\(\w+\)s|\$\d+|:\w+)"
+_PLACEHOLDER_LIST = re.compile(rf"\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+_SAVEPOINT = re.compile(r"(?:SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT)\s", re.IGNORECASE)
+
+
+def statement_shape(statement: str) -> str:
+    return _PLACEHOLDER_LIST.sub("(?)", _WHITESPACE.sub(" ", statement).strip())
+
+
+def is_savepoint_statement(statement: str) -> bool:
+    #SAVEPOINT / RELEASE / ROLLBACK TO are transaction bookkeeping, like the
+    #BEGIN and COMMIT the driver sends itself: not a route's queries
+    return _SAVEPOINT.match(statement) is not None
+
+
+def query_budget(max_queries: int):
+    """Declare how many SQL statements one request to this route may run.
+
+        @router.get("/cart")
+        @query_budget(3)
+        async def get_cart(...):
+    """
+    def declare(endpoint):
+        endpoint.query_budget = max_queries
+        return endpoint
+    return declare
+
+
+@dataclass
+class RequestTrace:
+    shapes: Counter = field(default_factory=Counter)
+    queries: int = 0
+
+
+@dataclass
+class RequestReport:
+    method: str
+    route: str
+    queries: int
+    budget: int | None
+    repeated: dict  # statement shape -> times run, for shapes over the threshold
+
+    @property
+    def over_budget(self) -> bool:
+        return self.budget is not None and self.queries > self.budget
+
+
+current_trace: ContextVar = ContextVar("current_trace", default=None)
+
+observers = []  # callables taking a RequestReport
+
+
+def _explain(conn, statement, parameters) -> list:
+    prefix = EXPLAIN_PREFIXES.get(conn.dialect.name)
+    if prefix is None:
+        return []
+
+    # Raw DBAPI cursor, so the plan query does not go back through the events
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return [str(row[-1]) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def instrument_engine(engine, slow_query_ms: int):
+    #For an AsyncEngine pass engine.sync_engine
+    threshold = slow_query_ms / 1000
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("diagnostics_start", []).append(time.perf_counter())
+
+        trace = current_trace.get()
+        if trace is not None and not is_savepoint_statement(statement):
+            trace.queries += 1
+            trace.shapes[statement_shape(statement)] += 1
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["diagnostics_start"].pop()
+        if elapsed < threshold:
+            return
+
+        plan = []
+        if not executemany:
+            try:
+                plan = _explain(conn, statement, parameters)
+            except Exception as exc:
+                plan = [f"(no plan: {exc})"]
+
+        logger.warning(
+            "slow query %.1fms%s\n%s\nparams: %r\nplan:\n  %s",
+            elapsed * 1000,
+            " (executemany)" if executemany else "",
+            statement,
+            parameters,
+            "\n  ".join(plan) or "(none)",
+        )
+
+    return engine
+
+
+class DiagnosticsMiddleware:
+    def __init__(self, app, repeat_threshold: int):
+        self.app = app
+        self.repeat_threshold = repeat_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace()
+        token = current_trace.set(trace)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_trace.reset(token)
+            self.report(scope, trace)
+
+    def report(self, scope, trace: RequestTrace):
+        route = scope.get("route")
+        report = RequestReport(
+            method=scope["method"],
+            route=getattr(route, "path", scope["path"]),
+            queries=trace.queries,
+            budget=getattr(getattr(route, "endpoint", None), "query_budget", None),
+            repeated={
+                shape: count for shape, count in trace.shapes.items()
+                if count > self.repeat_threshold
+            },
+        )
+
+        for shape, count in report.repeated.items():
+            logger.warning("possible N+1 in %s %s: statement ran %d times\n%s",
+                           report.method, report.route, count, shape)
+
+        if report.over_budget:
+            logger.warning("%s %s ran %d queries, budget is %d",
+                           report.method, report.route, report.queries, report.budget)
+
+        for observer in observers:
+            observer(report)
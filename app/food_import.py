@@ -0,0 +1,168 @@
+import csv
+import io
+import json
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from app.models import Food
+from app.schemas import FoodImportRow
+from app.cart_totals import reconcile_cart_totals
+
+#Bulk menu import: parse a CSV or NDJSON upload of FoodImportRow rows,
+#validate everything before touching the database, resolve existing names
+#with one set-based query, then write with batched executemany statements
+#in a single transaction.
+
+IMPORT_MODES = ("insert", "upsert")
+CSV_TYPES = ("text/csv", "application/csv")
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+BATCH_SIZE = 500  # rows per INSERT/UPDATE batch and per name IN (...) lookup
+
+# Same stock a dish gets from create_food, so every insert row has the same keys
+DEFAULT_STOCK = Food.__table__.c.stock.default.arg
+
+
+def parse_rows(body: bytes, content_type: str):
+    #Returns [(row_number, dict)] where dict is None if the line could not be parsed
+    media_type = (content_type or "").split(";")[0].strip().lower()
+
+    if media_type not in CSV_TYPES + NDJSON_TYPES:
+        raise HTTPException(
+            status_code=415,
+            detail="Upload must be text/csv or application/x-ndjson"
+        )
+
+    try:
+        text = body.decode("utf-8-sig")
+    except UnicodeDecodeError as exc:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Upload must be UTF-8 encoded (invalid byte at offset {exc.start})"
+        )
+
+    if media_type in CSV_TYPES:
+        reader = csv.DictReader(io.StringIO(text))
+        return [(number, dict(row)) for number, row in enumerate(reader, start=1)]
+
+    rows = []
+    lines = [line for line in text.splitlines() if line.strip()]
+    for number, line in enumerate(lines, start=1):
+        try:
+            data = json.loads(line)
+        except ValueError:
+            data = None
+        rows.append((number, data if isinstance(data, dict) else None))
+    return rows
+
+
+def _clean_csv_values(data: dict) -> dict:
+    #Empty CSV cells mean "not given"
+    return {key: value for key, value in data.items() if key and value not in ("", None)}
+
+
+def validate_rows(parsed):
+    """Validate every row up front.
+
+    Returns (valid, report): valid is [(row_number, FoodImportRow)], report
+    holds an error entry for each bad row, including repeated names.
+    """
+    valid = []
+    report = []
+    seen_names = set()
+
+    for number, data in parsed:
+        if data is None:
+            report.append({"row": number, "status": "error", "detail": "Row is not a valid JSON object"})
+            continue
+
+        try:
+            row = FoodImportRow.model_validate(_clean_csv_values(data))
+        except ValidationError as exc:
+            errors = "; ".join(
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+                for error in exc.errors()
+            )
+            report.append({"row": number, "name": data.get("name"), "status": "error", "detail": errors})
+            continue
+
+        if row.name in seen_names:
+            report.append({"row": number, "name": row.name, "status": "error", "detail": "Duplicate name in upload"})
+            continue
+
+        seen_names.add(row.name)
+        valid.append((number, row))
+
+    return valid, report
+
+
+def _existing_ids_by_name(db: Session, names) -> dict:
+    existing = {}
+    names = list(names)
+    for start in range(0, len(names), BATCH_SIZE):
+        chunk = names[start:start + BATCH_SIZE]
+        for food_id, name in db.query(Food.id, Food.name).filter(Food.name.in_(chunk)):
+            existing[name] = food_id
+    return existing
+
+
+def _in_batches(rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        yield rows[start:start + BATCH_SIZE]
+
+
+def import_foods(db: Session, valid, mode: str):
+    """Write validated rows in one transaction, returning the per-row report.
+
+    insert: new names are created, existing names are skipped.
+    upsert: new names are created, existing names get their price (and
+            stock, when the row has one) updated, and carts holding them
+            get their totals reconciled.
+    """
+    existing = _existing_ids_by_name(db, (row.name for _, row in valid))
+
+    to_insert = []
+    to_update = []
+    report = []
+
+    for number, row in valid:
+        food_id = existing.get(row.name)
+
+        if food_id is None:
+            to_insert.append({
+                "name": row.name,
+                "description": row.description,
+                "price": row.price,
+                "is_available": True,
+                "stock": DEFAULT_STOCK if row.stock is None else row.stock,
+            })
+            report.append({"row": number, "name": row.name, "status": "created"})
+
+        elif mode == "upsert":
+            values = {"id": food_id, "price": row.price}
+            if row.stock is not None:
+                values["stock"] = row.stock
+            to_update.append(values)
+            report.append({"row": number, "name": row.name, "status": "updated", "id": food_id})
+
+        else:
+            report.append({"row": number, "name": row.name, "status": "skipped",
+                           "id": food_id, "detail": "Food with this name already exists"})
+
+    for batch in _in_batches(to_insert):
+        db.execute(insert(Food), batch)
+
+    # ORM bulk UPDATE by primary key, grouped by the keys present
+    for batch in _in_batches(to_update):
+        db.execute(update(Food), batch)
+
+    # Carts holding a repriced dish get their stored totals recomputed
+    if to_update:
+        reconcile_cart_totals(db, food_ids=[values["id"] for values in to_update])
+
+    db.commit()
+
+    return report
@@ -0,0 +1,245 @@
+import asyncio
+import hashlib
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from fastapi import Header, HTTPException, Response
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from app.config import settings
+from app.models import IdempotencyRecord
+
+#Idempotency-Key support for /order/create and /pay, so a client retrying
+#after a timeout gets the first call's answer instead of a second order or
+#payment.
+#
+#A keyed request is answered, in order, from:
+#  1. the in-memory LRU of recent results (no SQL at all)
+#  2. the request with the same key already running in this process: we
+#     wait for it instead of running twice
+#  3. the idempotency_keys table (one primary key lookup; other processes
+#     and restarts)
+#  4. running the route, which stores its result with remember() in the
+#     same transaction as the order or payment
+#If the route fails because another process handled the same key first
+#(its order claim fails, or our insert of the key conflicts), the stored
+#result is returned instead. Only successful results are stored: a failed
+#request changed nothing, so retrying it is safe.
+#Keys are scoped to the user and route. Reusing a key with different
+#parameters is a 422. Replayed responses carry Idempotent-Replayed: true.
+#
+#    python -m app.idempotency
+#deletes stored keys older than IDEMPOTENCY_TTL_SECONDS.
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+PURGE_BATCH_SIZE = 5000
+
+
+@dataclass(frozen=True)
+class IdempotentRequest:
+    user_id: int
+    route: str
+    key: str
+    fingerprint: str
+
+    @property
+    def scope(self):
+        return (self.user_id, self.route, self.key)
+
+
+@dataclass(frozen=True)
+class StoredResult:
+    fingerprint: str
+    body: dict
+    stored_at: float  # time.monotonic(), for the memory TTL
+
+
+def fingerprint(**params) -> str:
+    raw = json.dumps(params, sort_keys=True, default=str).encode()
+    return hashlib.sha256(raw).hexdigest()
+
+
+def idempotency_key(key: str | None = Header(None, alias=IDEMPOTENCY_HEADER)):
+    #Dependency: the request's Idempotency-Key, or None
+    if key is not None and not 0 < len(key) <= MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters"
+        )
+    return key
+
+
+class IdempotencyCache:
+    """Recent results (LRU, bounded, with a TTL) plus requests in flight.
+
+    In-flight requests are concurrent.futures.Futures rather than asyncio
+    ones, so a duplicate can wait on them from any thread or event loop.
+    stored_ttl is how long results in the idempotency_keys table are
+    replayed (IDEMPOTENCY_TTL_SECONDS of the app that owns the cache).
+    """
+
+    def __init__(self, max_entries: int, ttl: float, stored_ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stored_ttl = stored_ttl
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def get(self, scope):
+        with self._lock:
+            entry = self._entries.get(scope)
+            if entry is None:
+                return None
+            if time.monotonic() - entry.stored_at > self.ttl:
+                del self._entries[scope]
+                return None
+            self._entries.move_to_end(scope)
+            return entry
+
+    def put(self, scope, entry: StoredResult):
+        with self._lock:
+            self._entries[scope] = entry
+            self._entries.move_to_end(scope)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def claim(self, scope):
+        #Returns (future, True) for the first caller, (its future, False) for the rest
+        with self._lock:
+            future = self._in_flight.get(scope)
+            if future is not None:
+                return future, False
+            future = self._in_flight[scope] = Future()
+            return future, True
+
+    def release(self, scope):
+        with self._lock:
+            self._in_flight.pop(scope, None)
+
+
+def build_idempotency_cache(config=settings) -> IdempotencyCache:
+    return IdempotencyCache(config.idempotency_cache_size, config.idempotency_cache_ttl_seconds,
+                            config.idempotency_ttl_seconds)
+
+
+def remember(db, request: IdempotentRequest, body: dict):
+    #Called by the route before it commits, so the key and the change land together
+    db.execute(insert(IdempotencyRecord).values(
+        user_id=request.user_id,
+        route=request.route,
+        key=request.key,
+        fingerprint=request.fingerprint,
+        response=json.dumps(body, default=str),
+    ))
+
+
+def _load_stored(db, request: IdempotentRequest, ttl_seconds: float):
+    db.rollback()  # the route may have failed mid-transaction
+    row = db.execute(
+        select(IdempotencyRecord.fingerprint, IdempotencyRecord.response).where(
+            IdempotencyRecord.user_id == request.user_id,
+            IdempotencyRecord.route == request.route,
+            IdempotencyRecord.key == request.key,
+            IdempotencyRecord.created_at >= datetime.utcnow() - timedelta(seconds=ttl_seconds),
+        )
+    ).first()
+    db.rollback()
+    if row is None:
+        return None
+    return StoredResult(row.fingerprint, json.loads(row.response), time.monotonic())
+
+
+async def _first_result(db, request: IdempotentRequest, ttl_seconds: float, fn, args):
+    #Returns (result, replayed)
+    stored = await db.run(_load_stored, request, ttl_seconds)
+    if stored is not None:
+        return stored, True
+
+    try:
+        body = await db.run(fn, *args, idempotent=request)
+    except (HTTPException, IntegrityError):
+        # Another process may have handled this key between our lookup and now
+        stored = await db.run(_load_stored, request, ttl_seconds)
+        if stored is None:
+            raise
+        return stored, True
+
+    return StoredResult(request.fingerprint, body, time.monotonic()), False
+
+
+async def run_idempotent(db, cache: IdempotencyCache, request: IdempotentRequest, response: Response, fn, *args):
+    """Run fn(session, *args, idempotent=request) at most once per key.
+
+    cache is the app's IdempotencyCache (app.state.idempotency_cache).
+    fn must call remember(db, idempotent, body) before it commits.
+    """
+    replayed = True
+    stored = cache.get(request.scope)
+
+    if stored is None:
+        future, owner = cache.claim(request.scope)
+        if not owner:
+            # Same key in flight here: wait for it, success or error
+            stored = await asyncio.wrap_future(future)
+        else:
+            try:
+                stored, replayed = await _first_result(db, request, cache.stored_ttl, fn, args)
+                cache.put(request.scope, stored)
+                future.set_result(stored)
+            except BaseException as error:
+                future.set_exception(error)
+                raise
+            finally:
+                cache.release(request.scope)
+
+    if stored.fingerprint != request.fingerprint:
+        raise HTTPException(
+            status_code=422,
+            detail=f"{IDEMPOTENCY_HEADER} was already used with different parameters"
+        )
+
+    if replayed:
+        response.headers[REPLAYED_HEADER] = "true"
+    return stored.body
+
+
+def purge_expired(db, ttl_seconds: float, batch_size: int = PURGE_BATCH_SIZE) -> int:
+    #Deletes keys older than ttl_seconds in batches, committing each; returns how many
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl_seconds)
+    purged = 0
+    while True:
+        expired = select(IdempotencyRecord.created_at).where(
+            IdempotencyRecord.created_at < cutoff
+        ).order_by(IdempotencyRecord.created_at).limit(batch_size).subquery()
+        boundary = db.execute(select(expired.c.created_at).order_by(expired.c.created_at.desc()).limit(1)).scalar()
+        if boundary is None:
+            return purged
+        purged += db.execute(
+            delete(IdempotencyRecord).where(IdempotencyRecord.created_at <= boundary)
+        ).rowcount
+        db.commit()
+
+
+def main() -> int:
+    from app.database import engine, SessionLocal
+    from app import migrations
+
+    migrations.ensure_schema(engine)
+
+    with SessionLocal() as db:
+        print(f"purged {purge_expired(db, settings.idempotency_ttl_seconds)} idempotency keys")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
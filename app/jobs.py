@@ -0,0 +1,290 @@
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import weakref
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, event, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import OutboxJob, User
+from app.notifications import Message, build_transport
+from app.write_queue import on_durable_commit
+
+#Background jobs for work that does not have to finish before the response:
+#OTP and receipt delivery.
+#
+#A route calls enqueue(db, kind, payload) before it commits. That adds a row
+#to job_outbox in the route's own transaction, so the job exists exactly
+#when the change that caused it does, and survives a restart. When the
+#session commits, the worker threads of this process are woken; jobs left
+#behind by a crash or another process are found by polling.
+#Each app has its own JobQueue and transport (create_app puts them on
+#app.state); a commit wakes every started queue in the process.
+#
+#Workers claim a job with a conditional UPDATE (status and run_after must be
+#what they read), so with several workers or processes each job runs once
+#at a time. While running, run_after is the lease expiry: a job whose worker
+#died is claimed again once the lease runs out. The handler runs in its own
+#session and the job row is deleted in that same transaction, so a
+#handler's database writes apply exactly once; deliveries are at-least-once.
+#A handler that raises is retried after job_backoff_seconds * 2**(n-1)
+#(plus jitter); after job_max_attempts it is left as status "failed" with
+#last_error for someone to look at.
+#
+#    python -m app.jobs
+#runs every due job once in the foreground, e.g. with JOB_WORKERS=0.
+
+logger = logging.getLogger("app.jobs")
+
+HANDLERS = {}
+CLAIM_CANDIDATES = 8  # due jobs read per claim attempt, raced for by the workers
+MAX_BACKOFF_SECONDS = 600
+_WAKE_KEY = "wake_job_workers"
+
+
+def job(kind: str):
+    #Register fn(db, payload, transport) as the handler for kind
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def enqueue(db, kind: str, payload: dict, delay_seconds: float = 0):
+    #Adds the job to the caller's transaction; the caller commits
+    if kind not in HANDLERS:
+        raise ValueError(f"no job handler for {kind!r}")
+    db.execute(insert(OutboxJob).values(
+        kind=kind,
+        payload=json.dumps(payload, default=str),
+        status="pending",
+        attempts=0,
+        run_after=datetime.utcnow() + timedelta(seconds=delay_seconds),
+    ))
+    db.info[_WAKE_KEY] = True
+
+
+_started = weakref.WeakSet()  # JobQueues whose workers are running
+
+
+def wake_workers():
+    for queue in list(_started):
+        queue.wake()
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(session):
+    if session.info.pop(_WAKE_KEY, False):
+        # For a write queue unit this commit is only its SAVEPOINT
+        on_durable_commit(session, wake_workers)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop(_WAKE_KEY, None)
+
+
+class JobQueue:
+    def __init__(self, session_factory, transport, workers: int, max_attempts: int,
+                 backoff_seconds: float, poll_seconds: float, lease_seconds: float):
+        self.session_factory = session_factory
+        self.transport = transport
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._next_retry = None  # monotonic time of the earliest retry this process scheduled
+
+    def start(self):
+        if self._threads or self.workers <= 0:
+            return
+        self._stopping.clear()
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"jobs-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        _started.add(self)
+        self.wake()  # pick up whatever the last run left in the outbox
+
+    def stop(self, timeout: float = 10):
+        #Lets running jobs finish; unstarted ones stay in the outbox
+        _started.discard(self)
+        self._stopping.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def wake(self):
+        self._wake.set()
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                if self.run_one():
+                    continue
+            except Exception:
+                logger.exception("job worker error")
+            self._wake.wait(self._idle_timeout())
+            self._wake.clear()
+
+    def _idle_timeout(self) -> float:
+        #Sleep until the next poll, or our own next retry if that comes first
+        timeout = self.poll_seconds
+        if self._next_retry is not None:
+            until_retry = self._next_retry - time.monotonic()
+            if until_retry <= 0:
+                self._next_retry = None
+            timeout = max(min(timeout, until_retry), 0)
+        return timeout
+
+    def run_pending(self) -> int:
+        #Run due jobs in the calling thread until none are left; returns how many ran
+        ran = 0
+        while self.run_one():
+            ran += 1
+        return ran
+
+    def run_one(self) -> bool:
+        claimed = self._claim()
+        if claimed is None:
+            return False
+        job_id, kind, payload, attempts = claimed
+        self._wake.set()  # there may be more: let an idle worker look too
+
+        db = self.session_factory()
+        try:
+            HANDLERS[kind](db, json.loads(payload), self.transport)
+            db.execute(delete(OutboxJob).where(OutboxJob.id == job_id))
+            db.commit()
+        except Exception as error:
+            db.rollback()
+            self._record_failure(db, job_id, kind, attempts, error)
+        finally:
+            db.close()
+        return True
+
+    def _claim(self):
+        now = datetime.utcnow()
+        with self.session_factory() as db:
+            due = db.execute(
+                select(OutboxJob.id, OutboxJob.kind, OutboxJob.payload, OutboxJob.attempts,
+                       OutboxJob.status, OutboxJob.run_after)
+                .where(OutboxJob.status.in_(("pending", "running")), OutboxJob.run_after <= now)
+                .order_by(OutboxJob.run_after, OutboxJob.id)
+                .limit(CLAIM_CANDIDATES)
+            ).all()
+            # End the read before writing: on SQLite a write from a stale
+            # read snapshot fails instead of waiting for the lock
+            db.rollback()
+
+            for row in due:
+                claimed = db.execute(
+                    update(OutboxJob)
+                    .where(OutboxJob.id == row.id, OutboxJob.status == row.status,
+                           OutboxJob.run_after == row.run_after)
+                    .values(status="running", attempts=OutboxJob.attempts + 1,
+                            run_after=now + timedelta(seconds=self.lease_seconds))
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                db.commit()
+                if claimed:
+                    return row.id, row.kind, row.payload, row.attempts + 1
+        return None
+
+    def _record_failure(self, db, job_id: int, kind: str, attempts: int, error: Exception):
+        if attempts >= self.max_attempts:
+            values = {"status": "failed"}
+            logger.error("job %s (%s) failed after %d attempts: %r", job_id, kind, attempts, error)
+        else:
+            delay = min(self.backoff_seconds * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+            delay *= random.uniform(1, 1.1)  # spread out the retries of one outage
+            values = {"status": "pending", "run_after": datetime.utcnow() + timedelta(seconds=delay)}
+            now = time.monotonic()
+            if self._next_retry is None or not now < self._next_retry < now + delay:
+                self._next_retry = now + delay
+            logger.warning("job %s (%s) attempt %d failed, retrying in %.1fs: %r",
+                           job_id, kind, attempts, delay, error)
+
+        db.execute(
+            update(OutboxJob)
+            .where(OutboxJob.id == job_id, OutboxJob.status == "running")
+            .values(last_error=repr(error)[:500], **values)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+
+
+def build_job_queue(config=settings, transport=None) -> JobQueue:
+    return JobQueue(
+        SessionLocal,
+        transport if transport is not None else build_transport(config),
+        workers=config.job_workers,
+        max_attempts=config.job_max_attempts,
+        backoff_seconds=config.job_backoff_seconds,
+        poll_seconds=config.job_poll_seconds,
+        lease_seconds=config.job_lease_seconds,
+    )
+
+
+# Side effects of the auth and order routes
+
+@job("send_otp")
+def send_otp(db, payload, transport):
+    transport.send(Message(
+        to=payload["email"],
+        subject="Your Chuks Kitchen verification code",
+        body=f"Your verification code is {payload['otp']}",
+    ))
+
+
+@job("send_welcome")
+def send_welcome(db, payload, transport):
+    transport.send(Message(
+        to=payload["email"],
+        subject="Welcome to Chuks Kitchen",
+        body="Your account is verified. You can now order.",
+    ))
+
+
+@job("send_receipt")
+def send_receipt(db, payload, transport):
+    email = db.execute(select(User.email).where(User.id == payload["user_id"])).scalar()
+    if email is None:
+        return
+
+    lines = [
+        f"{item['quantity']} x {item['food_name']} @ {item['price_per_unit']:.2f} = {item['subtotal']:.2f}"
+        for item in payload["items"]
+    ]
+    lines.append(f"Total paid: {payload['total']:.2f}")
+    lines.append(f"Reference: {payload['transaction_reference']}")
+    transport.send(Message(
+        to=email,
+        subject=f"Receipt for order {payload['order_id']}",
+        body="\n".join(lines),
+    ))
+
+
+def main() -> int:
+    from app.database import engine
+    from app import migrations
+
+    migrations.ensure_schema(engine)
+
+    print(f"ran {build_job_queue().run_pending()} jobs")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
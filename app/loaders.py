@@ -0,0 +1,69 @@
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session, selectinload, joinedload
+
+from app.models import Cart, CartItem, Order, OrderItem
+
+#Loader layer: fetches a cart or an order together with its items and foods
+#in two round-trips (parent row + one SELECT for items joined to foods),
+#so looping over items never fires a lazy load per line.
+
+
+def load_cart(db: Session, user_id: int):
+    return db.query(Cart).options(
+        selectinload(Cart.items).joinedload(CartItem.food)
+    ).filter(
+        Cart.user_id == user_id
+    ).first()
+
+
+def load_order(db: Session, order_id: int, user_id: int = None):
+    query = db.query(Order).options(
+        selectinload(Order.items).joinedload(OrderItem.food)
+    ).filter(Order.id == order_id)
+
+    if user_id is not None:
+        query = query.filter(Order.user_id == user_id)
+
+    return query.first()
+
+
+def load_order_history(db: Session, user_id: int, status: str = None, before=None, limit: int = 20):
+    """Up to limit of a user's orders, newest first.
+
+    Keyset on (created_at, id) < before, served by ix_orders_user_created.
+    Items are not loaded here: callers trim the page first, then fetch the
+    items of every order on it with load_order_items (one more query).
+    """
+    query = db.query(Order).filter(Order.user_id == user_id)
+
+    if status is not None:
+        query = query.filter(Order.status == status)
+
+    if before is not None:
+        query = query.filter(tuple_(Order.created_at, Order.id) < tuple_(*before))
+
+    return query.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit).all()
+
+
+def load_order_items(db: Session, order_ids) -> dict:
+    #order_id -> [OrderItem with .food loaded], one query for all orders
+    items_by_order = {order_id: [] for order_id in order_ids}
+    if not items_by_order:
+        return items_by_order
+
+    items = db.query(OrderItem).options(
+        joinedload(OrderItem.food)
+    ).filter(
+        OrderItem.order_id.in_(items_by_order.keys())
+    ).order_by(OrderItem.order_id, OrderItem.id)
+
+    for item in items:
+        items_by_order[item.order_id].append(item)
+    return items_by_order
+
+
+def clear_cart_items(db: Session, cart_id: int):
+    #One DELETE for the whole cart instead of loading and deleting each item
+    return db.query(CartItem).filter(
+        CartItem.cart_id == cart_id
+    ).delete(synchronize_session=False)
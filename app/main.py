@@ -1,15 +1,98 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
 
-from .database import engine
-from . import models
-from app.routes import auth
+from fastapi import FastAPI, Response
 
+from app import database, migrations
+from app.config import settings as default_settings
+from app.metrics import MetricsMiddleware, registry, PROMETHEUS_CONTENT_TYPE
+from app.diagnostics import DiagnosticsMiddleware
+from app.responses import default_response_class
+from app.jobs import build_job_queue
+from app.order_sweeper import build_order_sweeper
+from app.write_queue import build_write_queue
+from app.notifications import build_transport
+from app.rate_limit import build_rate_limiter
+from app.idempotency import build_idempotency_cache
+from app.utils.tokens import build_token_signer
+from app.utils.security import build_hashing_pool
+from app.routes import auth, reports
 
-models.Base.metadata.create_all(bind=engine)
+#create_app builds the application without touching the database. The
+#engine is created, and the schema checked, in the lifespan: when a worker
+#starts, before it serves, not when the module is imported. ensure_schema
+#is one SELECT once the database is current, so after the first start of a
+#deployment (or `python -m app.migrations` in the deploy step) the other
+#workers do no DDL. Run with
+#    TOKEN_KEYS=kid:secret uvicorn app.main:app --workers 4
+#or  uvicorn --factory app.main:create_app
+#(several workers need a shared TOKEN_KEYS, see app/utils/tokens.py)
+#
+#Everything that holds per-app state or reads settings at request time
+#(job queue and transport, order sweeper, rate limiter, token signer,
+#hashing pool, idempotency cache, SQLite serial writer) is built here from the settings passed
+#in and kept on app.state, so create_app(Settings(...)) gives an isolated
+#app, e.g. in tests. Routes reach them through request.app.state.
 
-app = FastAPI()
-app.include_router(auth.router)
 
-@app.get("/")
-def start_up_info():
-    return("chuks_kitchen server is running")
+def _build_state(app: FastAPI, settings):
+    app.state.settings = settings
+    app.state.transport = build_transport(settings)
+    app.state.job_queue = build_job_queue(settings, app.state.transport)
+    app.state.order_sweeper = build_order_sweeper(settings)
+    app.state.rate_limiter = build_rate_limiter(settings)
+    app.state.token_signer = build_token_signer(settings)
+    app.state.hashing_pool = build_hashing_pool(settings)
+    app.state.idempotency_cache = build_idempotency_cache(settings)
+    app.state.write_queue = build_write_queue(settings)
+
+
+def create_app(settings=default_settings) -> FastAPI:
+    @asynccontextmanager
+    async def lifespan(app):
+        engine = database.init_engine(settings)
+        if settings.db_auto_migrate:
+            migrations.ensure_schema(engine)
+
+        # SQLite serial writer (app/write_queue.py), background job workers
+        # (app/jobs.py) and the stale order sweeper
+        write_queue = app.state.write_queue
+        if write_queue is not None:
+            write_queue.start()
+        app.state.job_queue.start()
+        app.state.order_sweeper.start()
+        yield
+        app.state.order_sweeper.stop()
+        app.state.job_queue.stop()
+        if write_queue is not None:
+            write_queue.stop()
+        app.state.hashing_pool.shutdown()
+
+    # ORJSON_RESPONSES=1 swaps the default response class, see app/responses.py
+    app_options = {}
+    response_class = default_response_class(settings)
+    if response_class is not None:
+        app_options["default_response_class"] = response_class
+
+    app = FastAPI(lifespan=lifespan, **app_options)
+    _build_state(app, settings)
+    app.include_router(auth.router)
+    app.include_router(reports.router)
+
+    if settings.metrics_enabled:
+        app.add_middleware(MetricsMiddleware)
+
+        @app.get("/metrics", include_in_schema=False)
+        def metrics():
+            return Response(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+    if settings.db_diagnostics:
+        app.add_middleware(DiagnosticsMiddleware, repeat_threshold=settings.n_plus_one_threshold)
+
+    @app.get("/")
+    def start_up_info():
+        return("chuks_kitchen server is running")
+
+    return app
+
+
+app = create_app()
@@ -0,0 +1,325 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from app.diagnostics import is_savepoint_statement
+
+#Request and SQL metrics, rendered in Prometheus text format at /metrics.
+#MetricsMiddleware times every request and keys it by route template
+#(/cart, not /cart?user_id=7) so the label set stays small. While a request
+#runs, its RequestStats sits in a ContextVar; the engine events below add
+#each query, its time and any pool checkout wait to it. The ContextVar
+#follows the request into the threadpool (SyncSessionRunner) and into
+#run_sync (AsyncSessionRunner), so no session plumbing is needed.
+#Queries outside a request (startup, migrations) and savepoint statements
+#only count towards the totals.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestStats:
+    __slots__ = ("queries", "query_seconds", "pool_wait_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+
+
+current_request: ContextVar = ContextVar("current_request", default=None)
+
+
+class Registry:
+    def __init__(self):
+        self.latency = {}  # (method, route) -> Histogram
+        self.queries = {}  # (method, route) -> Histogram
+        self.query_seconds = {}  # (method, route) -> Histogram
+        self.pool_wait = {}  # (method, route) -> Histogram
+        self.responses = {}  # (method, route, status) -> count
+        self.in_flight = 0
+
+        # Engine-wide totals; engine events fire on worker threads
+        self._lock = threading.Lock()
+        self.total_queries = 0
+        self.total_query_seconds = 0.0
+        self.total_pool_wait_seconds = 0.0
+        self.pool_timeouts = 0
+        self.engines = []
+
+        # Background order sweeper, see app/order_sweeper.py
+        self.order_sweeps = 0
+        self.orders_expired = 0
+        self.order_sweep_seconds = 0.0
+
+        # SQLite serial writer batches, see app/write_queue.py
+        self.write_batches = 0
+        self.write_units = 0
+        self.write_batch_seconds = 0.0
+
+        # Rate limits on the auth routes, see app/rate_limit.py
+        self.rate_limit_allowed = {}  # route -> requests let through
+        self.rate_limit_rejected = {}  # (route, "ip" / "email") -> requests answered 429
+        self.rate_limit_evictions = 0
+
+    def record_request(self, method, route, status, seconds, stats: RequestStats):
+        #Only called from the event loop, so no lock is needed here
+        key = (method, route)
+        latency = self.latency.get(key)
+        if latency is None:
+            latency = self.latency[key] = Histogram(LATENCY_BUCKETS)
+            self.queries[key] = Histogram(QUERY_COUNT_BUCKETS)
+            self.query_seconds[key] = Histogram(LATENCY_BUCKETS)
+            self.pool_wait[key] = Histogram(LATENCY_BUCKETS)
+
+        latency.observe(seconds)
+        self.queries[key].observe(stats.queries)
+        self.query_seconds[key].observe(stats.query_seconds)
+        self.pool_wait[key].observe(stats.pool_wait_seconds)
+
+        status_key = (method, route, status)
+        self.responses[status_key] = self.responses.get(status_key, 0) + 1
+
+    def record_query(self, seconds, per_request=True):
+        stats = current_request.get()
+        if stats is not None and per_request:
+            stats.queries += 1
+            stats.query_seconds += seconds
+        with self._lock:
+            self.total_queries += 1
+            self.total_query_seconds += seconds
+
+    def record_pool_wait(self, seconds, timed_out=False):
+        stats = current_request.get()
+        if stats is not None:
+            stats.pool_wait_seconds += seconds
+        with self._lock:
+            self.total_pool_wait_seconds += seconds
+            if timed_out:
+                self.pool_timeouts += 1
+
+    def record_order_sweep(self, expired, seconds):
+        with self._lock:
+            self.order_sweeps += 1
+            self.orders_expired += expired
+            self.order_sweep_seconds += seconds
+
+    def record_write_batch(self, units, seconds):
+        with self._lock:
+            self.write_batches += 1
+            self.write_units += units
+            self.write_batch_seconds += seconds
+
+    def record_rate_limit(self, route, rejected_by=None):
+        with self._lock:
+            if rejected_by is None:
+                self.rate_limit_allowed[route] = self.rate_limit_allowed.get(route, 0) + 1
+            else:
+                key = (route, rejected_by)
+                self.rate_limit_rejected[key] = self.rate_limit_rejected.get(key, 0) + 1
+
+    def record_rate_limit_evictions(self, count):
+        with self._lock:
+            self.rate_limit_evictions += count
+
+    def render(self) -> str:
+        lines = []
+        _render_histograms(lines, "http_request_duration_seconds",
+                           "Request latency by route template", self.latency)
+        _render_histograms(lines, "http_request_db_queries",
+                           "SQL statements executed per request", self.queries)
+        _render_histograms(lines, "http_request_db_query_seconds",
+                           "Time spent executing SQL per request", self.query_seconds)
+        _render_histograms(lines, "http_request_db_pool_wait_seconds",
+                           "Time spent waiting for a pooled connection per request", self.pool_wait)
+
+        lines.append("# HELP http_responses_total Responses by route template and status code")
+        lines.append("# TYPE http_responses_total counter")
+        for (method, route, status), count in sorted(self.responses.items()):
+            lines.append(f'http_responses_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {count}')
+
+        lines.append("# HELP http_requests_in_flight Requests currently being handled")
+        lines.append("# TYPE http_requests_in_flight gauge")
+        lines.append(f"http_requests_in_flight {self.in_flight}")
+
+        with self._lock:
+            totals = (
+                ("db_queries_total", "SQL statements executed", self.total_queries),
+                ("db_query_seconds_total", "Time spent executing SQL", self.total_query_seconds),
+                ("db_pool_wait_seconds_total", "Time spent waiting for a pooled connection",
+                 self.total_pool_wait_seconds),
+                ("db_pool_timeouts_total", "Pool checkouts that timed out", self.pool_timeouts),
+                ("order_sweeps_total", "Runs of the stale pending order sweeper", self.order_sweeps),
+                ("orders_expired_total", "Pending orders cancelled by the sweeper", self.orders_expired),
+                ("order_sweep_seconds_total", "Time spent sweeping stale pending orders",
+                 self.order_sweep_seconds),
+                ("write_batches_total", "Transactions committed by the write queue", self.write_batches),
+                ("write_units_total", "Units of work committed by the write queue", self.write_units),
+                ("write_batch_seconds_total", "Time the write queue spent in write transactions",
+                 self.write_batch_seconds),
+                ("rate_limit_evictions_total", "Rate limit buckets dropped to stay within RATE_LIMIT_MAX_KEYS",
+                 self.rate_limit_evictions),
+            )
+            allowed = sorted(self.rate_limit_allowed.items())
+            rejected = sorted(self.rate_limit_rejected.items())
+        for name, help_text, value in totals:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {value}")
+
+        lines.append("# HELP rate_limit_allowed_total Rate limited requests let through, by route")
+        lines.append("# TYPE rate_limit_allowed_total counter")
+        for route, count in allowed:
+            lines.append(f'rate_limit_allowed_total{{route="{_escape(route)}"}} {count}')
+        lines.append("# HELP rate_limit_rejected_total Requests answered 429, by route and the key whose bucket was empty")
+        lines.append("# TYPE rate_limit_rejected_total counter")
+        for (route, key), count in rejected:
+            lines.append(f'rate_limit_rejected_total{{route="{_escape(route)}",key="{key}"}} {count}')
+
+        _render_pools(lines, self.engines)
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _format_bound(bound) -> str:
+    return repr(float(bound))
+
+
+def _render_histograms(lines, name, help_text, histograms):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for (method, route), histogram in sorted(histograms.items()):
+        labels = f'method="{method}",route="{_escape(route)}"'
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{_format_bound(bound)}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+
+def _render_pools(lines, engines):
+    #Gauges read straight off each QueuePool at scrape time
+    pools = [(engine.url.render_as_string(hide_password=True), engine.pool) for engine in engines]
+    pools = [(url, pool) for url, pool in pools if hasattr(pool, "checkedout")]
+    for name, help_text, read in (
+        ("db_pool_checked_out", "Connections currently checked out", lambda pool: pool.checkedout()),
+        ("db_pool_idle", "Idle connections in the pool", lambda pool: pool.checkedin()),
+        ("db_pool_overflow", "Connections open beyond pool_size", lambda pool: max(pool.overflow(), 0)),
+    ):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for url, pool in pools:
+            lines.append(f'{name}{{engine="{_escape(url)}"}} {read(pool)}')
+
+
+registry = Registry()
+
+
+def _time_checkouts(pool):
+    #There is no "before checkout" pool event, so time Pool.connect itself
+    connect = pool.connect
+
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            connection = connect()
+        except Exception as exc:
+            registry.record_pool_wait(time.perf_counter() - start, timed_out=_is_pool_timeout(exc))
+            raise
+        registry.record_pool_wait(time.perf_counter() - start)
+        return connection
+
+    pool.connect = timed_connect
+
+
+def _is_pool_timeout(exc) -> bool:
+    from sqlalchemy.exc import TimeoutError as PoolTimeout
+    return isinstance(exc, PoolTimeout)
+
+
+def instrument_engine(engine):
+    #Attach query timing and pool wait tracking to a (sync) Engine;
+    #for an AsyncEngine pass engine.sync_engine
+    _time_checkouts(engine.pool)
+    registry.engines.append(engine)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        registry.record_query(time.perf_counter() - conn.info["query_start_time"].pop(),
+                              per_request=not is_savepoint_statement(statement))
+
+    # dispose() swaps in a fresh pool
+    @event.listens_for(engine, "engine_disposed")
+    def engine_disposed(engine):
+        _time_checkouts(engine.pool)
+
+    return engine
+
+
+class MetricsMiddleware:
+    #Plain ASGI middleware (BaseHTTPMiddleware would add a task and a
+    #memory stream to every request)
+
+    def __init__(self, app, registry: Registry = registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = 500
+        registry = self.registry
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        registry.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            registry.in_flight -= 1
+            current_request.reset(token)
+            route = scope.get("route")
+            registry.record_request(
+                scope["method"], getattr(route, "path", UNMATCHED_ROUTE), status, elapsed, stats
+            )
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
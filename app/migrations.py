@@ -0,0 +1,273 @@
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.exc import IntegrityError
+
+from app import models
+
+#Schema migrations for databases that already exist.
+#create_all only creates missing tables, it never adds indexes or columns
+#to a table that is already there, so every schema change to an existing
+#table gets a numbered migration here. Applied versions are recorded in
+#schema_version; upgrade() runs whatever is missing, each in its own
+#transaction. Migrations must be safe on a fresh database too (where
+#create_all has already built the latest schema).
+#New tables get a migration as well: ensure_schema() skips create_all
+#once the newest migration is recorded, which makes a worker's startup
+#check one SELECT on schema_version. Run the setup once per deployment,
+#before starting the workers, with
+#    python -m app.migrations
+#(each worker still runs it if anything is missing, unless DB_AUTO_MIGRATE=0).
+
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+MIGRATIONS = []
+
+
+class _AppliedElsewhere(Exception):
+    pass
+
+
+def migration(version: int, name: str):
+    def register(fn):
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return fn
+    return register
+
+
+def _model_index(model, name: str):
+    return next(index for index in model.__table__.indexes if index.name == name)
+
+
+@migration(1, "hot lookup indexes")
+def _hot_lookup_indexes(conn):
+    # carts.user_id becomes unique: fold extra carts into the user's oldest one
+    conn.execute(text("""
+        UPDATE cart_item SET cart_id = (
+            SELECT MIN(keeper.id) FROM carts keeper
+            WHERE keeper.user_id = (SELECT c.user_id FROM carts c WHERE c.id = cart_item.cart_id)
+        )
+        WHERE cart_id IN (
+            SELECT id FROM carts
+            WHERE user_id IS NOT NULL
+              AND id NOT IN (SELECT MIN(id) FROM carts WHERE user_id IS NOT NULL GROUP BY user_id)
+        )
+    """))
+    conn.execute(text("""
+        DELETE FROM carts
+        WHERE user_id IS NOT NULL
+          AND id NOT IN (SELECT MIN(id) FROM carts WHERE user_id IS NOT NULL GROUP BY user_id)
+    """))
+
+    # cart_item(cart_id, food_id) becomes unique: merge repeated lines
+    conn.execute(text("""
+        UPDATE cart_item SET quantity = (
+            SELECT SUM(other.quantity) FROM cart_item other
+            WHERE other.cart_id = cart_item.cart_id AND other.food_id = cart_item.food_id
+        )
+        WHERE id IN (
+            SELECT MIN(id) FROM cart_item
+            WHERE cart_id IS NOT NULL AND food_id IS NOT NULL
+            GROUP BY cart_id, food_id HAVING COUNT(*) > 1
+        )
+    """))
+    conn.execute(text("""
+        DELETE FROM cart_item
+        WHERE cart_id IS NOT NULL AND food_id IS NOT NULL
+          AND id NOT IN (
+            SELECT MIN(id) FROM cart_item
+            WHERE cart_id IS NOT NULL AND food_id IS NOT NULL
+            GROUP BY cart_id, food_id
+          )
+    """))
+
+    for model, name in (
+        (models.Cart, "ix_carts_user_id"),
+        (models.CartItem, "ux_cart_item_cart_food"),
+        (models.Order, "ix_orders_user_status"),
+        (models.OrderItem, "ix_order_items_order_id"),
+        (models.Payment, "ix_payments_order_id"),
+        (models.Food, "ix_foods_is_available"),
+        (models.Food, "ix_foods_name"),
+    ):
+        _model_index(model, name).create(conn, checkfirst=True)
+
+
+def _add_missing_columns(conn, model, names):
+    #ALTER TABLE ADD COLUMN for model columns the existing table lacks
+    existing = {column["name"] for column in inspect(conn).get_columns(model.__tablename__)}
+    for name in names:
+        if name in existing:
+            continue
+        column = model.__table__.c[name]
+        column_type = column.type.compile(dialect=conn.dialect)
+        default = f" DEFAULT {column.server_default.arg}" if column.server_default is not None else ""
+        not_null = " NOT NULL" if not column.nullable else ""
+        conn.execute(text(f"ALTER TABLE {model.__tablename__} ADD COLUMN {name} {column_type}{not_null}{default}"))
+
+
+@migration(2, "cart totals")
+def _cart_totals(conn):
+    from app.cart_totals import reconcile_cart_totals
+
+    _add_missing_columns(conn, models.Cart, ("item_count", "total"))
+    reconcile_cart_totals(conn)
+
+
+@migration(3, "order created_at")
+def _order_created_at(conn):
+    from sqlalchemy import func, update
+
+    _add_missing_columns(conn, models.Order, ("created_at",))
+
+    # Existing orders get their first payment's time, or now; bound as a
+    # datetime so the stored format matches what the ORM writes
+    first_payment = select(func.min(models.Payment.created_at)).where(
+        models.Payment.order_id == models.Order.id
+    ).scalar_subquery()
+    conn.execute(
+        update(models.Order)
+        .where(models.Order.created_at.is_(None))
+        .values(created_at=func.coalesce(first_payment, datetime.utcnow()))
+    )
+
+    _model_index(models.Order, "ix_orders_user_created").create(conn, checkfirst=True)
+
+
+@migration(4, "sales summary")
+def _sales_summary(conn):
+    from app.sales_summary import rebuild_sales_summary
+
+    models.DailySales.__table__.create(conn, checkfirst=True)
+    models.DailyFoodSales.__table__.create(conn, checkfirst=True)
+    rebuild_sales_summary(conn)
+
+
+@migration(5, "order sweeper index")
+def _order_sweeper_index(conn):
+    _model_index(models.Order, "ix_orders_status_created").create(conn, checkfirst=True)
+
+
+@migration(6, "job outbox and idempotency keys")
+def _outbox_and_idempotency_tables(conn):
+    models.OutboxJob.__table__.create(conn, checkfirst=True)
+    models.IdempotencyRecord.__table__.create(conn, checkfirst=True)
+
+
+@migration(7, "food search index")
+def _food_search_index(conn):
+    from app.search import create_search_index
+
+    # SQLite only: foods_fts plus the triggers that keep it in sync
+    create_search_index(conn)
+
+
+def applied_versions(engine) -> set:
+    schema_version.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        return set(conn.scalars(select(schema_version.c.version)))
+
+
+def upgrade(engine) -> list:
+    #Apply pending migrations; returns the versions applied by this call
+    done = applied_versions(engine)
+    applied_now = []
+
+    for version, name, fn in MIGRATIONS:
+        if version in done:
+            continue
+
+        try:
+            with engine.begin() as conn:
+                fn(conn)
+                try:
+                    conn.execute(schema_version.insert().values(
+                        version=version, name=name, applied_at=datetime.utcnow()
+                    ))
+                except IntegrityError:
+                    raise _AppliedElsewhere()
+        except _AppliedElsewhere:
+            # Another worker recorded this version first; ours is rolled back
+            continue
+
+        applied_now.append(version)
+
+    return applied_now
+
+
+# pg_advisory_lock key for schema setup (any constant shared by all workers)
+SCHEMA_LOCK_KEY = 7_420_117
+
+
+@contextmanager
+def _schema_lock(engine):
+    #Held by one process at a time while it sets up the schema: workers
+    #starting together would otherwise race each other's CREATE TABLEs
+    backend = engine.url.get_backend_name()
+    database = engine.url.database
+
+    if backend == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": SCHEMA_LOCK_KEY})
+        return
+
+    if backend == "sqlite" and database not in (None, "", ":memory:"):
+        try:
+            import fcntl
+        except ImportError:  # Windows: no flock, run workers one at a time there
+            yield
+            return
+        with open(f"{database}.schema-lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return
+
+    yield
+
+
+def _is_current(engine) -> bool:
+    #Read-only check, safe outside the lock
+    with engine.connect() as conn:
+        if not inspect(conn).has_table(schema_version.name):
+            return False
+        applied = set(conn.scalars(select(schema_version.c.version)))
+    return applied >= {version for version, _, _ in MIGRATIONS}
+
+
+def ensure_schema(engine) -> list:
+    #Create tables and apply migrations unless the database is already current
+    if _is_current(engine):
+        return []
+    with _schema_lock(engine):
+        if _is_current(engine):  # another worker got there first
+            return []
+        models.Base.metadata.create_all(bind=engine)
+        return upgrade(engine)
+
+
+def main() -> int:
+    from app.database import engine
+
+    applied = ensure_schema(engine)
+    print(f"applied migrations {applied}" if applied else "schema is up to date")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,4 @@
-from sqlalchemy import String, Integer, Boolean, Column, ForeignKey, Float, DateTime
+from sqlalchemy import String, Integer, Boolean, Column, ForeignKey, Float, DateTime, Date, Index, Text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -21,24 +21,31 @@ class Food(Base):
     __tablename__ = "foods"
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, nullable=False)
+    name = Column(String, nullable=False, index=True)
     description = Column(String)
     price = Column(Float, nullable=False)
-    is_available = Column(Boolean, default=True)
+    is_available = Column(Boolean, default=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     stock = Column(Integer, default=20)
 
 class Cart(Base):
     __tablename__ = "carts"
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), unique=True, index=True)  # one cart per user
     is_active = Column(Boolean, default=True)
+    # Maintained by app/cart_totals.py in the same transaction as item changes
+    item_count = Column(Integer, nullable=False, default=0, server_default="0")
+    total = Column(Float, nullable=False, default=0, server_default="0")
     user = relationship("User", back_populates="cart")
     items = relationship("CartItem", back_populates="cart", cascade="all, delete")
 
 
 class CartItem(Base):
     __tablename__ = "cart_item"
+    __table_args__ = (
+        # one line per food in a cart; also serves lookups by cart_id alone
+        Index("ux_cart_item_cart_food", "cart_id", "food_id", unique=True),
+    )
     id = Column(Integer, primary_key=True, index=True)
     cart_id = Column(Integer, ForeignKey("carts.id"))
     food_id =  Column(Integer, ForeignKey("foods.id"))
@@ -48,11 +55,19 @@ class CartItem(Base):
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        Index("ix_orders_user_status", "user_id", "status"),
+        # order history: a user's orders newest first, keyset on (created_at, id)
+        Index("ix_orders_user_created", "user_id", "created_at", "id"),
+        # stale pending orders for the sweeper, oldest first
+        Index("ix_orders_status_created", "status", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     total_price = Column(Float)
     status = Column(String, default="pending")
+    created_at = Column(DateTime, default=datetime.utcnow)
 
     user = relationship("User")
     items = relationship("OrderItem", back_populates="order", cascade="all, delete")
@@ -62,7 +77,7 @@ class OrderItem(Base):
     __tablename__ = "order_items"
 
     id = Column(Integer, primary_key=True)
-    order_id = Column(Integer, ForeignKey("orders.id"))
+    order_id = Column(Integer, ForeignKey("orders.id"), index=True)
     food_id = Column(Integer, ForeignKey("foods.id"))
     quantity = Column(Integer)
     price_at_purchase = Column(Float)
@@ -74,7 +89,7 @@ class Payment(Base):
     __tablename__ = "payments"
 
     id = Column(Integer, primary_key=True)
-    order_id = Column(Integer, ForeignKey("orders.id"))
+    order_id = Column(Integer, ForeignKey("orders.id"), index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
 
     payment_method = Column(String)
@@ -84,3 +99,55 @@ class Payment(Base):
     status = Column(String, default="success")
 
     created_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Sales summary, maintained by app/sales_summary.py; reports read only these
+class DailySales(Base):
+    __tablename__ = "daily_sales"
+
+    day = Column(Date, primary_key=True)
+    orders_paid = Column(Integer, nullable=False, default=0)
+    items_sold = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+    orders_cancelled = Column(Integer, nullable=False, default=0)
+
+
+class DailyFoodSales(Base):
+    __tablename__ = "daily_food_sales"
+
+    day = Column(Date, primary_key=True)
+    food_id = Column(Integer, ForeignKey("foods.id"), primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+    quantity_cancelled = Column(Integer, nullable=False, default=0)
+
+
+# Outbox of background jobs (app/jobs.py), written in the same transaction
+# as the change that caused them
+class OutboxJob(Base):
+    __tablename__ = "job_outbox"
+    __table_args__ = (
+        Index("ix_job_outbox_due", "status", "run_after"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)  # JSON
+    status = Column(String, nullable=False, default="pending")  # pending, running, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)  # lease expiry while running
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Results of /order/create and /pay requests sent with an Idempotency-Key,
+# written in the same transaction as the order or payment (app/idempotency.py)
+class IdempotencyRecord(Base):
+    __tablename__ = "idempotency_keys"
+
+    user_id = Column(Integer, primary_key=True)
+    route = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    fingerprint = Column(String, nullable=False)  # hash of the request parameters
+    response = Column(Text, nullable=False)  # JSON body
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
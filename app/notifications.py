@@ -0,0 +1,59 @@
+import threading
+from dataclasses import dataclass
+
+from app.config import settings
+
+#Outgoing email/SMS. Jobs in app/jobs.py hand a Message to their app's
+#transport (app.state.transport, see create_app), chosen by NOTIFY_TRANSPORT:
+#  console: prints the message, what the app did before it had delivery
+#  stub:    keeps messages in memory for tests (see the sent_messages
+#           fixture in app/pytest_plugin.py) and can be told to fail
+#A real provider only needs a send(message) that raises on failure; the
+#job is then retried with backoff.
+
+
+@dataclass(frozen=True)
+class Message:
+    to: str
+    subject: str
+    body: str
+
+
+class TransportError(Exception):
+    pass
+
+
+class ConsoleTransport:
+    def send(self, message: Message):
+        print(f"To: {message.to} | {message.subject}\n{message.body}")
+
+
+class StubTransport:
+    def __init__(self):
+        self.sent = []
+        self.fail_next = 0  # number of upcoming sends that raise TransportError
+        self._lock = threading.Lock()
+
+    def send(self, message: Message):
+        with self._lock:
+            if self.fail_next:
+                self.fail_next -= 1
+                raise TransportError(f"stub failure sending to {message.to}")
+            self.sent.append(message)
+
+    def clear(self):
+        with self._lock:
+            self.sent.clear()
+            self.fail_next = 0
+
+
+TRANSPORTS = {
+    "console": ConsoleTransport,
+    "stub": StubTransport,
+}
+
+
+def build_transport(config=settings):
+    if config.notify_transport not in TRANSPORTS:
+        raise ValueError(f"NOTIFY_TRANSPORT must be one of {sorted(TRANSPORTS)}, got {config.notify_transport!r}")
+    return TRANSPORTS[config.notify_transport]()
@@ -0,0 +1,161 @@
+import logging
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, tuple_, update
+
+from app.config import settings
+from app.database import SessionLocal
+from app.metrics import registry
+from app.models import Order, OrderItem
+from app.sales_summary import record_cancellations
+
+#Cancels pending orders nobody paid for within pending_order_ttl_seconds, so
+#the user can order again. Stock is only taken when an order is paid
+#(_pay_for_order), so a pending order holds none and there is none to put
+#back.
+#
+#A background thread runs sweep() every order_sweep_interval_seconds (first
+#run at a random point within one interval, so several worker processes
+#spread out). A sweep walks stale pending orders oldest first along
+#ix_orders_status_created, order_sweep_batch_size at a time, keyset on
+#(created_at, id). Each batch is one transaction of set-based statements:
+#  UPDATE orders SET status = 'cancelled' WHERE id IN (...) AND status = 'pending'
+#      RETURNING id, created_at
+#  SELECT food_id, quantity for the orders actually claimed
+#  the sales summary upserts for the cancellations
+#The status condition makes the sweeper lose cleanly to a /pay or
+#/order/cancel that claimed the same order first.
+#
+#    python -m app.order_sweeper
+#runs one sweep in the foreground.
+
+logger = logging.getLogger("app.order_sweeper")
+
+
+def expire_batch(db, cutoff: datetime, after, batch_size: int):
+    """Cancel up to batch_size pending orders created before cutoff.
+
+    after is the (created_at, id) keyset cursor of the previous batch, or
+    None. Returns (expired, next cursor or None when done). Commits.
+    """
+    query = select(Order.id, Order.created_at).where(
+        Order.status == "pending", Order.created_at < cutoff
+    )
+    if after is not None:
+        query = query.where(tuple_(Order.created_at, Order.id) > after)
+    candidates = db.execute(
+        query.order_by(Order.created_at, Order.id).limit(batch_size)
+    ).all()
+    # End the read before writing: on SQLite a write from a stale read
+    # snapshot fails instead of waiting; the status check covers the gap
+    db.rollback()
+    if not candidates:
+        return 0, None
+
+    claimed = db.execute(
+        update(Order)
+        .where(Order.id.in_([row.id for row in candidates]), Order.status == "pending")
+        .values(status="cancelled")
+        .returning(Order.id, Order.created_at)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    if claimed:
+        day_by_order = {row.id: (row.created_at or cutoff).date() for row in claimed}
+        cancelled_by_day = {}
+        cancelled_by_day_food = {}
+        for day in day_by_order.values():
+            cancelled_by_day[day] = cancelled_by_day.get(day, 0) + 1
+
+        items = db.execute(
+            select(OrderItem.order_id, OrderItem.food_id, func.sum(OrderItem.quantity))
+            .where(OrderItem.order_id.in_(day_by_order.keys()))
+            .group_by(OrderItem.order_id, OrderItem.food_id)
+        )
+        for order_id, food_id, quantity in items:
+            key = (day_by_order[order_id], food_id)
+            cancelled_by_day_food[key] = cancelled_by_day_food.get(key, 0) + quantity
+
+        record_cancellations(db, cancelled_by_day, cancelled_by_day_food)
+
+    db.commit()
+
+    last = candidates[-1]
+    next_after = (last.created_at, last.id) if len(candidates) == batch_size else None
+    return len(claimed), next_after
+
+
+def sweep(session_factory=SessionLocal, ttl_seconds: int = None, batch_size: int = None) -> int:
+    #One pass over every stale pending order; returns how many were cancelled
+    ttl_seconds = settings.pending_order_ttl_seconds if ttl_seconds is None else ttl_seconds
+    batch_size = batch_size or settings.order_sweep_batch_size
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl_seconds)
+
+    start = time.perf_counter()
+    expired = 0
+    after = None
+    with session_factory() as db:
+        while True:
+            count, after = expire_batch(db, cutoff, after, batch_size)
+            expired += count
+            if after is None:
+                break
+
+    if expired:
+        logger.info("expired %d pending orders older than %ds", expired, ttl_seconds)
+    registry.record_order_sweep(expired, time.perf_counter() - start)
+    return expired
+
+
+class OrderSweeper:
+    def __init__(self, interval_seconds: float, ttl_seconds: int = None, batch_size: int = None):
+        self.interval_seconds = interval_seconds
+        self.ttl_seconds = ttl_seconds
+        self.batch_size = batch_size
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None or self.interval_seconds <= 0:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="order-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        delay = random.uniform(0, self.interval_seconds)
+        while not self._stopping.wait(delay):
+            try:
+                sweep(ttl_seconds=self.ttl_seconds, batch_size=self.batch_size)
+            except Exception:
+                logger.exception("order sweep failed")
+            delay = self.interval_seconds
+
+
+def build_order_sweeper(config=settings) -> OrderSweeper:
+    return OrderSweeper(config.order_sweep_interval_seconds, config.pending_order_ttl_seconds,
+                        config.order_sweep_batch_size)
+
+
+def main() -> int:
+    from app.database import engine
+    from app import migrations
+
+    migrations.ensure_schema(engine)
+
+    print(f"expired {sweep()} pending orders")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from app import database
+
+#Keyset (cursor) pagination on the primary key, and streamed JSON export.
+#A page is "WHERE id > :after ORDER BY id LIMIT :limit", so page 10,000 costs
+#the same as page 1. The cursor is opaque to clients: base64 of {"id": n}.
+#Lists ordered by time use (created_at, id) instead: {"at": iso time, "id": n}.
+#Search results use (score, id): {"score": relevance, "id": n}.
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 500
+
+# Header carrying the cursor for the next page; absent on the last page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _encode(**fields) -> str:
+    raw = json.dumps(fields, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode(cursor: str, **fields):
+    #fields maps each key to the type it is read as; returns their values in
+    #that order, or None for no cursor
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded))
+        return tuple(read(data[key]) for key, read in fields.items())
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def encode_cursor(last_id: int) -> str:
+    return _encode(id=last_id)
+
+
+def decode_cursor(cursor: str):
+    decoded = _decode(cursor, id=int)
+    return None if decoded is None else decoded[0]
+
+
+def encode_time_cursor(created_at: datetime, last_id: int) -> str:
+    return _encode(at=created_at.isoformat(), id=last_id)
+
+
+def decode_time_cursor(cursor: str):
+    #Returns (created_at, id) or None
+    return _decode(cursor, at=datetime.fromisoformat, id=int)
+
+
+def encode_search_cursor(score: float, last_id: int) -> str:
+    return _encode(score=score, id=last_id)
+
+
+def decode_search_cursor(cursor: str):
+    #Returns (score, id) or None
+    return _decode(cursor, score=float, id=int)
+
+
+def keyset_page(query, id_column, after: str, limit: int):
+    #Returns (rows, next_cursor); one extra row tells us if there is a next page
+    after_id = decode_cursor(after)
+    if after_id is not None:
+        query = query.filter(id_column > after_id)
+
+    rows = query.order_by(id_column).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].id)
+
+    return rows, next_cursor
+
+
+def stream_json_array(model, id_column, list_adapter, *criteria, after: str = None,
+                      chunk_size: int = STREAM_CHUNK_SIZE):
+    """Yield a JSON array of every matching row, chunk_size rows at a time.
+
+    Rows are fetched with yield_per, so only one chunk is held in memory and
+    each chunk is encoded as soon as it arrives. The generator owns its own
+    session because it outlives the request handler; with DB_MODE=async that
+    is an AsyncSession streaming through the async driver.
+    """
+    after_id = decode_cursor(after)
+    statement = select(model).where(*criteria).order_by(id_column)
+    if after_id is not None:
+        statement = statement.where(id_column > after_id)
+
+    def encode(rows, first):
+        body = list_adapter.dump_json(list_adapter.validate_python(rows, from_attributes=True))
+        return (b"" if first else b",") + body[1:-1]
+
+    def generate():
+        db = database.SessionLocal()
+        try:
+            yield b"["
+            first = True
+            result = db.scalars(statement, execution_options={"yield_per": chunk_size})
+            for rows in result.partitions():
+                yield encode(rows, first)
+                first = False
+            yield b"]"
+        finally:
+            db.close()
+
+    async def generate_async():
+        async with database.AsyncSessionLocal() as db:
+            yield b"["
+            first = True
+            result = await db.stream_scalars(statement, execution_options={"yield_per": chunk_size})
+            async for rows in result.partitions():
+                yield encode(rows, first)
+                first = False
+            yield b"]"
+
+    if database.AsyncSessionLocal is not None:
+        return generate_async()
+    return generate()
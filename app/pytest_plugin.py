@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+#pytest plugin that fails a test when a request it makes runs more SQL
+#statements than the route's @query_budget (see app/diagnostics.py), so an
+#N+1 in app/routes/auth.py shows up in CI.
+#Load it before anything imports the app, it switches DB_DIAGNOSTICS on:
+#    pytest -p app.pytest_plugin
+#or in conftest.py:
+#    pytest_plugins = ["app.pytest_plugin"]
+#A test can tighten or loosen the budget for every request it makes with
+#    @pytest.mark.query_budget(5)
+#It also swaps email/SMS for the in-memory stub transport (app/notifications.py);
+#the sent_messages fixture runs an app's queued jobs and returns what it sent.
+
+os.environ.setdefault("DB_DIAGNOSTICS", "1")
+os.environ.setdefault("NOTIFY_TRANSPORT", "stub")
+
+from app import diagnostics  # noqa: E402
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "query_budget(max_queries): per-request query budget overriding the route's own",
+    )
+
+
+def _budget_for(report, override):
+    return override if override is not None else report.budget
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_call(item):
+    reports = []
+    diagnostics.observers.append(reports.append)
+    try:
+        result = yield
+    finally:
+        diagnostics.observers.remove(reports.append)
+
+    marker = item.get_closest_marker("query_budget")
+    override = marker.args[0] if marker else None
+
+    over = []
+    for report in reports:
+        budget = _budget_for(report, override)
+        if budget is not None and report.queries > budget:
+            over.append(f"{report.method} {report.route}: {report.queries} queries, budget {budget}")
+            over.extend(f"    x{count}: {shape}" for shape, count in report.repeated.items())
+
+    if over:
+        pytest.fail("query budget exceeded\n" + "\n".join(over), pytrace=False)
+
+    return result
+
+
+@pytest.fixture
+def query_reports():
+    #RequestReports for every request the test makes, for finer assertions
+    reports = []
+    diagnostics.observers.append(reports.append)
+    yield reports
+    diagnostics.observers.remove(reports.append)
+
+
+@pytest.fixture
+def sent_messages():
+    """Messages an app's stub transport delivered during the test.
+
+    Call it after the requests: sent_messages(app) runs every due background
+    job of that app first (see app/jobs.py) and returns the list of Messages.
+    """
+    transports = []
+
+    def deliver(app):
+        if app.state.transport not in transports:
+            transports.append(app.state.transport)
+        app.state.job_queue.run_pending()
+        return list(app.state.transport.sent)
+
+    yield deliver
+    for transport in transports:
+        transport.clear()
@@ -0,0 +1,72 @@
+import sys
+
+from sqlalchemy import select, text
+
+from app.models import Cart, CartItem, Food, Order, OrderItem, Payment, User
+
+#EXPLAIN QUERY PLAN checks for the hot lookups in app/routes/auth.py.
+#Each query must be answered with an index SEARCH; a plain SCAN of a table
+#means an index was dropped or a query stopped matching it.
+#Run against any SQLite database (CI uses a fresh one):
+#    DATABASE_URL=sqlite:///./ci.db python -m app.query_plans
+
+HOT_QUERIES = {
+    "user by email": select(User.id).where(User.email == "a@example.com"),
+    "cart by user": select(Cart).where(Cart.user_id == 1),
+    "cart item by cart and food": select(CartItem).where(CartItem.cart_id == 1, CartItem.food_id == 1),
+    "cart items by cart": select(CartItem).where(CartItem.cart_id.in_([1, 2])),
+    "pending order by user": select(Order).where(Order.user_id == 1, Order.status == "pending"),
+    "order history by user": select(Order).where(Order.user_id == 1).order_by(
+        Order.created_at.desc(), Order.id.desc()
+    ).limit(20),
+    "order items by order": select(OrderItem).where(OrderItem.order_id.in_([1, 2])),
+    "payment by order": select(Payment).where(Payment.order_id == 1),
+    "available foods": select(Food).where(Food.is_available == True),
+    "food by name": select(Food.id).where(Food.name == "jollof"),
+}
+
+
+def explain(conn, statement) -> list:
+    compiled = statement.compile(conn.engine, compile_kwargs={"literal_binds": True})
+    return [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))]
+
+
+def is_full_scan(detail: str) -> bool:
+    #"SCAN foods" is a table scan; "SEARCH foods USING INDEX ..." is fine.
+    #A SCAN of a covering index still reads every entry, so it counts too.
+    return detail.startswith("SCAN")
+
+
+def check_query_plans(engine) -> dict:
+    #Returns {query name: [plan lines]} for every hot query that scans
+    regressions = {}
+    with engine.connect() as conn:
+        for name, statement in HOT_QUERIES.items():
+            plan = explain(conn, statement)
+            if any(is_full_scan(detail) for detail in plan):
+                regressions[name] = plan
+    return regressions
+
+
+def main() -> int:
+    from app.database import engine
+    from app import migrations
+
+    if engine.dialect.name != "sqlite":
+        print("query plan checks only run on SQLite")
+        return 0
+
+    migrations.ensure_schema(engine)
+
+    regressions = check_query_plans(engine)
+    for name, plan in regressions.items():
+        print(f"SCAN regression in '{name}': {' | '.join(plan)}")
+
+    if not regressions:
+        print(f"all {len(HOT_QUERIES)} hot queries use an index")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
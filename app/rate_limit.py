@@ -0,0 +1,157 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Protocol
+
+from fastapi import HTTPException
+
+from app.config import settings
+from app.metrics import registry
+
+#Token bucket rate limits for the routes an anonymous client can make us
+#spend CPU or guesses on: /signup and /login (one bcrypt hash each) and
+#/verify (a 6-digit OTP). Each route checks two buckets before it touches
+#the database or the hashing pool, one for the client IP and one for the
+#email in the body, so neither many emails from one address nor many
+#addresses against one email get through. A bucket holds up to burst
+#tokens and refills at per_minute; a request takes one token, and an empty
+#bucket is a 429 with Retry-After. Buckets are per route.
+#
+#Buckets live in a BucketBackend chosen by RATE_LIMIT_BACKEND:
+#  memory: this process only, LRU-bounded (MemoryBuckets)
+#With several processes each one enforces its own limit, so production
+#behind several workers wants a shared backend (Redis, say): implement
+#BucketBackend and add a factory to BACKENDS.
+#Behind a proxy, run uvicorn with --proxy-headers so the client IP is the
+#caller's and not the proxy's.
+
+
+@dataclass(frozen=True)
+class Limit:
+    per_minute: float
+    burst: int
+
+    @property
+    def rate(self) -> float:
+        return self.per_minute / 60  # tokens per second
+
+
+class RateLimited(HTTPException):
+    def __init__(self, retry_after: float):
+        super().__init__(
+            status_code=429,
+            detail="Too many requests, please retry later",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+
+class BucketBackend(Protocol):
+    """Where the token buckets live.
+
+    take must, atomically for key: refill the bucket at rate tokens per
+    second up to burst (a key never seen starts full), then take one token
+    if there is one. It returns 0 when a token was taken, otherwise the
+    seconds until one will be available (nothing is taken). Called on the
+    event loop, so a networked backend must not block it.
+    """
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        ...
+
+
+class MemoryBuckets(BucketBackend):
+    """Token buckets in process memory, least recently used dropped first.
+
+    A bucket is a (tokens, updated_at) tuple in one OrderedDict, so
+    max_keys bounds the memory. An evicted client starts again with a full
+    bucket, so max_keys should comfortably exceed the clients seen within
+    the time a bucket takes to refill.
+    """
+
+    def __init__(self, max_keys: int, clock: Callable[[], float] = time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()  # key -> (tokens, clock time)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config) -> "MemoryBuckets":
+        return cls(config.rate_limit_max_keys)
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        now = self.clock()
+        evicted = 0
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = burst
+            else:
+                tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                self._buckets.move_to_end(key)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                evicted += 1
+        if evicted:
+            registry.record_rate_limit_evictions(evicted)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+# RATE_LIMIT_BACKEND -> factory(settings) returning a BucketBackend
+BACKENDS: dict[str, Callable[..., BucketBackend]] = {
+    "memory": MemoryBuckets.from_config,
+}
+
+
+class RateLimiter:
+    def __init__(self, backend: BucketBackend, limits: dict, enabled: bool = True):
+        self.backend = backend
+        self.limits = limits  # "ip" / "email" -> Limit
+        self.enabled = enabled
+
+    async def check(self, route: str, ip: str | None, email: str | None = None):
+        #Raises RateLimited when either bucket is empty; call before any other work
+        if not self.enabled:
+            return
+        for kind, value in (("ip", ip), ("email", email and email.strip().lower())):
+            limit = self.limits.get(kind)
+            if not value or limit is None:
+                continue
+            wait = await self.backend.take(f"{route}:{kind}:{value}", limit.rate, limit.burst)
+            if wait:
+                registry.record_rate_limit(route, kind)
+                raise RateLimited(wait)
+        registry.record_rate_limit(route, None)
+
+
+def client_ip(request) -> str | None:
+    return request.client.host if request.client else None
+
+
+def build_rate_limiter(config=settings) -> RateLimiter:
+    if config.rate_limit_backend not in BACKENDS:
+        raise ValueError(f"RATE_LIMIT_BACKEND must be one of {sorted(BACKENDS)}, got {config.rate_limit_backend!r}")
+
+    limits = {
+        "ip": Limit(config.rate_limit_ip_per_minute, config.rate_limit_ip_burst),
+        "email": Limit(config.rate_limit_email_per_minute, config.rate_limit_email_burst),
+    }
+    return RateLimiter(
+        BACKENDS[config.rate_limit_backend](config),
+        limits={kind: limit for kind, limit in limits.items() if limit.per_minute > 0},  # 0 = no limit
+        enabled=config.rate_limit_enabled,
+    )
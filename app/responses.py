@@ -0,0 +1,36 @@
+from functools import cache
+
+from fastapi.responses import JSONResponse
+
+#Opt-in orjson responses (ORJSON_RESPONSES=1), for routes that return plain
+#dicts and lists. orjson is an optional dependency: pip install orjson.
+#
+#Routes with a response_model don't need it and are better off without it.
+#With the default response class FastAPI validates their result and
+#serializes it straight to JSON bytes in pydantic-core. Any other response
+#class, this one included, makes FastAPI dump the model to Python objects
+#first and hand those to render(). benchmarks/serialization.py measures
+#both paths.
+
+
+@cache
+def _orjson():
+    try:
+        import orjson
+    except ImportError:
+        raise RuntimeError("ORJSON_RESPONSES=1 needs orjson installed (pip install orjson)")
+    return orjson
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        orjson = _orjson()
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def default_response_class(settings):
+    #For FastAPI(default_response_class=...); None keeps FastAPI's own
+    if not settings.orjson_responses:
+        return None
+    _orjson()  # fail at startup, not on the first request
+    return ORJSONResponse
@@ -1,20 +1,108 @@
+import logging
 import random
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-
-from app.database import get_db
+import uuid
+from datetime import datetime
+from functools import wraps
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
+
+from app.database import SessionRunner, get_runner
 from app import models, schemas
-from app.utils.security import verify_password
-from app.utils.security import hash_password
-from app.models import User, Cart, CartItem, Order, OrderItem, Food, Payment
+from app.utils.security import verify_and_update_password
+from app.utils.security import hash_password_async
+from app.utils.tokens import TokenSigner, TokenUser, current_user, verified_user
+from app.loaders import load_cart, load_order, clear_cart_items
+from app.loaders import load_order_history, load_order_items
+from app.cache import menu_cache, etag_matches
+from app.stock import order_quantities, reserve_stock, transition_order
+from app.stock import first_short_food
+from app.cart_totals import adjust_cart_totals, reset_cart_totals, recompute_cart_totals
+from app.sales_summary import record_sale, record_cancellation
+from app.pagination import keyset_page, stream_json_array, NEXT_CURSOR_HEADER
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.pagination import encode_time_cursor, decode_time_cursor
+from app import food_import, search
+from app.search import DEFAULT_SEARCH_PAGE_SIZE, MAX_SEARCH_PAGE_SIZE, ranking_cache
+from app.jobs import enqueue
+from app.idempotency import IdempotentRequest, idempotency_key, fingerprint, remember, run_idempotent
+from app.diagnostics import query_budget
+from app.rate_limit import client_ip
+from app.models import Cart, CartItem, Order, OrderItem, Food, Payment
 
 router = APIRouter()
+logger = logging.getLogger("app.routes")
+
+food_list_adapter = TypeAdapter(list[schemas.FoodResponse])
+user_list_adapter = TypeAdapter(list[schemas.GetUser])
+receipt_lines_adapter = TypeAdapter(list[schemas.ReceiptLine])
+
+# Every route is async def and hands its database logic (a plain function
+# taking a Session) to the SessionRunner, see app/database.py.
+# signup and login await bcrypt on the hashing pool between their database
+# steps; the read transaction is ended before hashing so no pool connection
+# is held while we wait on bcrypt.
+# @query_budget(n) is the most SQL statements one request may run; the
+# pytest plugin (app/pytest_plugin.py) fails tests that go over it.
+# Cart, order and pay routes identify the caller by the bearer token that
+# /login and /verify issue (app/utils/tokens.py): current_user checks it
+# without touching the database, verified_user also requires the verified
+# claim. So those routes no longer look the user up.
+# The rate limiter, token signer, hashing pool and idempotency cache belong
+# to the app (request.app.state, see create_app in app/main.py).
+# signup, login and verify are rate limited per client IP and per email
+# (app/rate_limit.py); the check comes first so a rejected request costs
+# no query and no hash.
+
+def _email_taken(db: Session, email: str) -> bool:
+    existing_user = db.query(models.User.id).filter(models.User.email == email).first()
+    db.rollback()
+    return existing_user is not None
+
+def _create_user(db: Session, user: schemas.UserCreate, hashed_password: str, otp: str):
+    new_user = models.User(
+        email=user.email,
+        phone=user.phone,
+        hashed_password=hashed_password,
+        is_verified=False,
+        otp=otp
+    )
+    db.add(new_user)
+    db.flush()
+
+    new_cart = models.Cart(
+        user_id=new_user.id,
+    )
+    db.add(new_cart)
+    # Delivered by a background job once this commits, see app/jobs.py
+    enqueue(db, "send_otp", {"email": user.email, "phone": user.phone, "otp": otp})
+    db.commit()
+
+def _get_login_user(db: Session, email: str):
+    row = db.query(models.User.id, models.User.hashed_password, models.User.is_verified).filter(
+        models.User.email == email
+    ).first()
+    db.rollback()
+    return row
+
+def _update_password_hash(db: Session, user_id: int, new_hash: str):
+    db.query(models.User).filter(models.User.id == user_id).update(
+        {models.User.hashed_password: new_hash}, synchronize_session=False
+    )
+    db.commit()
 
 @router.post("/signup")
-def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(models.User).filter(models.User.email == user.email).first()
+@query_budget(4)
+async def signup(request: Request, user: schemas.UserCreate, db: SessionRunner = Depends(get_runner)):
+    state = request.app.state
+    await state.rate_limiter.check("/signup", client_ip(request), user.email)
 
-    if existing_user:
+    if await db.run(_email_taken, user.email):
         raise HTTPException(
             status_code=400,
             detail="Email already Registered"
@@ -25,51 +113,59 @@ def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
             status_code=400,
             detail="Password must be at least 6 characters"
         )
-    hashed_password = hash_password(user.password)
+    hashed_password = await hash_password_async(state.hashing_pool, user.password)
     otp = str(random.randint(100000, 999999))
 
-    new_user = models.User(
-        email=user.email,
-        phone=user.phone,
-        hashed_password=hashed_password,
-        is_verified=False,
-        otp=otp
-    )
-    db.add(new_user)
-    db.commit()
-    print("User OTP:", otp)
-    db.refresh(new_user)
-
-    new_cart = models.Cart(
-        user_id=new_user.id,
-    )
-    db.add(new_cart)
-    db.commit()
+    await db.write(_create_user, user, hashed_password, otp)
 
     return {"message": "User created successfully"}
 
+# 3 when the stored hash is upgraded to the current work factor
 @router.post("/login")
-def login(login_data: schemas.UserLogin, db: Session = Depends(get_db)):
+@query_budget(3)
+async def login(request: Request, login_data: schemas.UserLogin, db: SessionRunner = Depends(get_runner)):
+    state = request.app.state
+    await state.rate_limiter.check("/login", client_ip(request), login_data.email)
 
-    db_user = db.query(models.User).filter(
-        models.User.email == login_data.email
-    ).first()
+    db_user = await db.run(_get_login_user, login_data.email)
 
     if not db_user:
         raise HTTPException(
             status_code=404, 
             detail="User not found")
 
-    if not verify_password(login_data.password, db_user.hashed_password):
+    is_valid, new_hash = await verify_and_update_password(
+        state.hashing_pool, login_data.password, db_user.hashed_password
+    )
+
+    if not is_valid:
         raise HTTPException(
             status_code=401, 
             detail="Incorrect password")
 
-    return {"message": "Login successful"}
+    # Stored hash used an outdated work factor: upgrade it transparently
+    if new_hash:
+        await db.run(_update_password_hash, db_user.id, new_hash)
 
+    return {
+        "message": "Login successful",
+        **_token_response(state.token_signer, db_user.id, bool(db_user.is_verified))
+    }
 
-@router.post("/verify")
-def verify_user(data: schemas.VerifyUser, db: Session = Depends(get_db)):
+def _token_response(signer: TokenSigner, user_id: int, verified: bool) -> dict:
+    return {
+        "access_token": signer.issue(user_id, verified),
+        "token_type": "bearer",
+        "expires_in": signer.ttl_seconds
+    }
+
+@router.post("/logout")
+async def logout(request: Request, user: TokenUser = Depends(current_user)):
+    request.app.state.token_signer.revoke(user)
+    return {"message": "Logged out"}
+
+
+def _verify_user(db: Session, data: schemas.VerifyUser, signer: TokenSigner):
     user = db.query(models.User).filter(models.User.email == data.email).first()
 
     if not user:
@@ -89,17 +185,48 @@ def verify_user(data: schemas.VerifyUser, db: Session = Depends(get_db)):
     
     user.is_verified = True
     user.otp = None
+    user_id = user.id
+    enqueue(db, "send_welcome", {"email": user.email})
     db.commit()
-    return {"message": "ACCOUNT VERIFICATION SUCCESSFUL"}
+    return {"message": "ACCOUNT VERIFICATION SUCCESSFUL", **_token_response(signer, user_id, True)}
+
+@router.post("/verify")
+@query_budget(3)
+async def verify_user(request: Request, data: schemas.VerifyUser, db: SessionRunner = Depends(get_runner)):
+    state = request.app.state
+    await state.rate_limiter.check("/verify", client_ip(request), data.email)
+    return await db.run(_verify_user, data, state.token_signer)
+
+"""List endpoints are keyset-paginated on id: pass the X-Next-Cursor header
+of one page as ?after= to get the next. ?stream=true returns every row
+(starting after the cursor) as one streamed JSON array instead."""
+
+def _get_users(db: Session, after: str, limit: int):
+    return keyset_page(db.query(models.User), models.User.id, after, limit)
 
 @router.get("/users", response_model=list[schemas.GetUser])
-def get_users(db: Session = Depends(get_db)):
-    users = db.query(models.User).all()
+@query_budget(1)
+async def get_users(
+    response: Response,
+    after: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    stream: bool = False,
+    db: SessionRunner = Depends(get_runner)
+):
+    if stream:
+        return StreamingResponse(
+            stream_json_array(models.User, models.User.id, user_list_adapter, after=after),
+            media_type="application/json"
+        )
+
+    users, next_cursor = await db.run(_get_users, after, limit)
+
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
 
     return users
 
-@router.post("/food")
-def create_food(food: schemas.FoodCreate, db: Session = Depends(get_db)):
+def _create_food(db: Session, food: schemas.FoodCreate):
     existing_food = db.query(models.Food).filter(models.Food.name == food.name).first()
 
     if existing_food:
@@ -117,50 +244,176 @@ def create_food(food: schemas.FoodCreate, db: Session = Depends(get_db)):
   
     db.add(new_food)
     db.commit()
+    menu_cache.invalidate()
+    ranking_cache.invalidate()
     db.refresh(new_food)
    
-    return new_food
+    return schemas.FoodResponse.model_validate(new_food)
+
+@router.post("/food", response_model=schemas.FoodResponse)
+@query_budget(3)
+async def create_food(food: schemas.FoodCreate, db: SessionRunner = Depends(get_runner)):
+    return await db.run(_create_food, food)
+
+"""Bulk menu import:
+Body is CSV (Content-Type: text/csv, header name,description,price[,stock])
+or NDJSON (application/x-ndjson, one FoodImportRow object per line)
+Every row is validated first; any invalid row → 400 with the report, nothing written
+mode=insert → new dishes created, existing names skipped
+mode=upsert → new dishes created, existing names get price (and stock) updated
+All writes happen in one transaction"""
+
+def _import_foods(db: Session, valid, mode: str):
+    report = food_import.import_foods(db, valid, mode)
+    menu_cache.invalidate()
+    ranking_cache.invalidate()
+    return report
+
+# No @query_budget: statements grow with the upload, one per BATCH_SIZE rows
+@router.post("/food/import")
+async def bulk_import_foods(
+    request: Request,
+    mode: str = "insert",
+    db: SessionRunner = Depends(get_runner)
+):
+    if mode not in food_import.IMPORT_MODES:
+        raise HTTPException(status_code=400, detail="mode must be 'insert' or 'upsert'")
 
-@router.get("/foods", response_model=list[schemas.FoodResponse])
-def get_foods(db: Session = Depends(get_db)):
+    parsed = food_import.parse_rows(await request.body(), request.headers.get("content-type"))
+
+    if not parsed:
+        raise HTTPException(status_code=400, detail="Upload is empty")
+
+    valid, errors = food_import.validate_rows(parsed)
+
+    if errors:
+        raise HTTPException(
+            status_code=400,
+            detail={"message": "No rows were imported", "errors": len(errors), "rows": errors}
+        )
+
+    report = await db.run(_import_foods, valid, mode)
+
+    counts = {"created": 0, "updated": 0, "skipped": 0}
+    for row in report:
+        counts[row["status"]] += 1
+
+    return {"message": "Import complete", "mode": mode, **counts, "rows": report}
+
+def _menu_body(db: Session) -> bytes:
     foods = db.query(models.Food).filter(models.Food.is_available == True).all()
+    return food_list_adapter.dump_json(
+        food_list_adapter.validate_python(foods, from_attributes=True)
+    )
+
+def _get_foods_page(db: Session, after: str, limit: int):
+    query = db.query(models.Food).filter(models.Food.is_available == True)
+    return keyset_page(query, models.Food.id, after, limit)
+
+@router.get("/foods", response_model=list[schemas.FoodResponse])
+@query_budget(1)
+async def get_foods(
+    request: Request,
+    response: Response,
+    after: str | None = None,
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    stream: bool = False,
+    db: SessionRunner = Depends(get_runner)
+):
+    if stream:
+        return StreamingResponse(
+            stream_json_array(
+                models.Food, models.Food.id, food_list_adapter,
+                models.Food.is_available == True, after=after
+            ),
+            media_type="application/json"
+        )
+
+    # Paged reads go to the database; the full menu is served from the cache
+    if limit is not None or after is not None:
+        foods, next_cursor = await db.run(_get_foods_page, after, limit or DEFAULT_PAGE_SIZE)
+
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+        return foods
+
+    # Serve the pre-serialized menu; only a cache miss touches the database
+    cached = menu_cache.get()
+
+    if cached is None:
+        version = menu_cache.version
+        cached = menu_cache.store(version, await db.run(_menu_body))
+
+    headers = {"ETag": cached.etag}
+
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+"""Menu search: every word of q must start a word of the dish's name or
+description ("jol ri" finds Jollof Rice), best matches first. Backed by the
+foods_fts index on SQLite (see app/search.py), LIKE elsewhere. Paged with
+X-Next-Cursor / ?after= like the other lists.
+One query per page once the query's ranking is cached, two the first time"""
+
+@router.get("/foods/search", response_model=list[schemas.FoodResponse])
+@query_budget(2)
+async def search_foods(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    after: str | None = None,
+    limit: int = Query(DEFAULT_SEARCH_PAGE_SIZE, ge=1, le=MAX_SEARCH_PAGE_SIZE),
+    db: SessionRunner = Depends(get_runner)
+):
+    if not search.search_terms(q):
+        raise HTTPException(status_code=400, detail="Search query must contain a letter or digit")
+
+    foods, next_cursor = await db.run(search.search_foods, q, after, limit)
+
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
 
     return foods
 
 
+def _retry_on_conflict(fn):
+    """Run a cart write again if it lost an insert race.
+
+    Two requests adding the same food to one cart can both find no line
+    and both insert it; ux_cart_item_cart_food (and carts.user_id) stops
+    the second. That one rolls back and runs once more, now seeing the
+    other's row. Losing twice is a 409.
+    """
+    @wraps(fn)
+    def run(db: Session, *args):
+        try:
+            return fn(db, *args)
+        except IntegrityError:
+            db.rollback()
+        try:
+            return fn(db, *args)
+        except IntegrityError:
+            db.rollback()
+            raise HTTPException(status_code=409, detail="Cart was changed by another request, please retry")
+    return run
 
 """Flow for adding to cart:
 1️⃣ Check user exists(user mot found checks)
 2️⃣ Check user verified(user not verified checks)
+   (both now done by the verified_user token dependency)
 3️⃣ Check food exists(food not found checks)
 4️⃣ Check food availability(food unavailable checks)
 5️⃣ Check quantity(quantity must be greater than zero checks)
 6️⃣ Get user cart(cart not found checks)
 7️⃣ Check if item already in cart(Duplicate cart item checks)
 8️⃣ If exists, update quantity(Add new quantity to existing quantity)
-9️⃣ If not, create new cart item(Add new item to cart)"""
-
-@router.post("/cart/add")
-def add_to_cart(data: schemas.cartAdd, db: Session = Depends(get_db)):
-
-    # 1️⃣ Check user exists
-    user = db.query(models.User).filter(
-        models.User.id == data.user_id
-    ).first()
-
-    if not user:
-        raise HTTPException(
-            status_code=404,
-            detail="User not found"
-        )
-
-    # 2️⃣ Check user verified
-    if not user.is_verified:
-        raise HTTPException(
-            status_code=400,
-            detail="User not verified"
-        )
+9️⃣ If not, create new cart item(Add new item to cart)
+🔟 Add the quantity and amount to the cart's running totals"""
 
+@_retry_on_conflict
+def _add_to_cart(db: Session, user_id: int, data: schemas.cartAdd):
     # 3️⃣ Check food exists
     food = db.query(models.Food).filter(
         models.Food.id == data.food_id
@@ -188,12 +441,12 @@ def add_to_cart(data: schemas.cartAdd, db: Session = Depends(get_db)):
 
     # 6️⃣ Get user cart
     cart = db.query(models.Cart).filter(
-        models.Cart.user_id == user.id
+        models.Cart.user_id == user_id
     ).first()
 
     if not cart:
        cart = models.Cart(
-        user_id=user.id,
+        user_id=user_id,
        )
        db.add(cart)
        db.commit()
@@ -230,26 +483,31 @@ def add_to_cart(data: schemas.cartAdd, db: Session = Depends(get_db)):
             quantity=data.quantity,
             )
         db.add(new_item)
-            
+
+    # 🔟 Keep the cart summary in step, same transaction
+    adjust_cart_totals(cart, data.quantity, data.quantity * food.price)
+
     db.commit()
 
     return {"message": "Item added to cart"}
 
-@router.delete("/cart/item")
-def remove_cart_item(
-    user_id: int,
-    food_id: int,
-    db: Session = Depends(get_db)
+@router.post("/cart/add")
+@query_budget(5)
+async def add_to_cart(
+    data: schemas.cartAdd,
+    user: TokenUser = Depends(verified_user),
+    db: SessionRunner = Depends(get_runner)
 ):
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    return await db.write(_add_to_cart, user.id, data)
 
-    cart = db.query(Cart).filter(Cart.user_id == user.id).first()
+def _remove_cart_item(db: Session, user_id: int, food_id: int):
+    cart = db.query(Cart).filter(Cart.user_id == user_id).first()
     if not cart:
         raise HTTPException(status_code=404, detail="Cart not found")
 
-    item = db.query(CartItem).filter(
+    item = db.query(CartItem).options(
+        joinedload(CartItem.food)
+    ).filter(
         CartItem.cart_id == cart.id,
         CartItem.food_id == food_id
     ).first()
@@ -257,30 +515,32 @@ def remove_cart_item(
     if not item:
         raise HTTPException(status_code=404, detail="Item not in cart")
 
+    adjust_cart_totals(cart, -item.quantity, -item.quantity * item.food.price)
     db.delete(item)
     db.commit()
 
     return {"message": "Item removed from cart"}
 
-@router.put("/cart/update")
-def update_cart_quantity(
-    user_id: int,
+@router.delete("/cart/item")
+@query_budget(4)
+async def remove_cart_item(
     food_id: int,
-    quantity: int,
-    db: Session = Depends(get_db)
+    user: TokenUser = Depends(current_user),
+    db: SessionRunner = Depends(get_runner)
 ):
+    return await db.write(_remove_cart_item, user.id, food_id)
+
+def _update_cart_quantity(db: Session, user_id: int, food_id: int, quantity: int):
     if quantity <= 0:
         raise HTTPException(status_code=400, detail="Quantity must be greater than 0")
 
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    cart = db.query(Cart).filter(Cart.user_id == user.id).first()
+    cart = db.query(Cart).filter(Cart.user_id == user_id).first()
     if not cart:
         raise HTTPException(status_code=404, detail="Cart not found")
 
-    item = db.query(CartItem).filter(
+    item = db.query(CartItem).options(
+        joinedload(CartItem.food)
+    ).filter(
         CartItem.cart_id == cart.id,
         CartItem.food_id == food_id
     ).first()
@@ -291,79 +551,209 @@ def update_cart_quantity(
     if quantity > item.food.stock:
         raise HTTPException(status_code=400, detail="Not enough stock available")
 
+    delta = quantity - item.quantity
+    adjust_cart_totals(cart, delta, delta * item.food.price)
     item.quantity = quantity
 
     db.commit()
 
     return {"message": "Cart updated successfully"}
 
-@router.delete("/cart/clear")
-def clear_cart(
-    user_id: int,
-    db: Session = Depends(get_db)
+@router.put("/cart/update")
+@query_budget(4)
+async def update_cart_quantity(
+    food_id: int,
+    quantity: int,
+    user: TokenUser = Depends(current_user),
+    db: SessionRunner = Depends(get_runner)
 ):
+    return await db.write(_update_cart_quantity, user.id, food_id, quantity)
+
+"""Batch cart mutation (POST /cart/batch):
+Load the cart once
+Load every referenced food and existing cart item with one IN (...) query each
+Run the operations in order against that in-memory state
+Invalid lines are reported and skipped, valid lines are applied
+Net quantity and amount changes go to the cart totals
+One commit for the whole batch"""
+
+def _apply_cart_operation(op: schemas.CartOperation, food, current: int | None):
+    #Returns (new_quantity, error); new_quantity None means "not in cart"
+    if op.op == "remove":
+        if current is None:
+            return current, "Item not in cart"
+        return None, None
+
+    if op.quantity <= 0:
+        return current, "Quantity must be greater than zero"
+
+    if not food:
+        return current, "Food not found"
+
+    if op.op == "update":
+        if current is None:
+            return current, "Item not found"
+        new_quantity = op.quantity
+    else:
+        if not food.is_available:
+            return current, "Food is currently unavailable"
+        new_quantity = (current or 0) + op.quantity
+
+    if new_quantity > food.stock:
+        return current, "Not enough stock available"
+
+    return new_quantity, None
+
+@_retry_on_conflict
+def _cart_batch(db: Session, user_id: int, data: schemas.CartBatch):
     cart = db.query(Cart).filter(Cart.user_id == user_id).first()
 
     if not cart:
-        return {"message": "Cart already empty"}
+        cart = Cart(user_id=user_id)
+        db.add(cart)
+        db.flush()
+
+    food_ids = {op.food_id for op in data.operations}
+    foods = {
+        food.id: food
+        for food in db.query(Food).filter(Food.id.in_(food_ids))
+    }
+    items = {
+        item.food_id: item
+        for item in db.query(CartItem).filter(
+            CartItem.cart_id == cart.id,
+            CartItem.food_id.in_(food_ids)
+        )
+    }
 
-    for item in cart.items:
-        db.delete(item)
+    # food_id -> quantity after all operations (None = not in cart)
+    quantities = {food_id: item.quantity for food_id, item in items.items()}
+    lines = []
+
+    for line, op in enumerate(data.operations, start=1):
+        new_quantity, error = _apply_cart_operation(op, foods.get(op.food_id), quantities.get(op.food_id))
+
+        if error:
+            lines.append({"line": line, "op": op.op, "food_id": op.food_id, "status": "error", "detail": error})
+            continue
+
+        quantities[op.food_id] = new_quantity
+        lines.append({"line": line, "op": op.op, "food_id": op.food_id, "status": "ok", "quantity": new_quantity})
+
+    # Write only the net changes: updates/deletes go out as executemany on
+    # flush, new lines as one bulk INSERT (no RETURNING, so it stays batched)
+    new_items = []
+    count_delta = 0
+    amount_delta = 0
+    unpriced = []  # changed lines whose food row is gone (only "remove" gets here)
+    for food_id, quantity in quantities.items():
+        item = items.get(food_id)
+
+        delta = (quantity or 0) - (item.quantity if item else 0)
+        count_delta += delta
+        if food_id in foods:
+            amount_delta += delta * foods[food_id].price
+        elif delta:
+            unpriced.append(food_id)
+
+        if quantity is None:
+            if item:
+                db.delete(item)
+        elif item:
+            item.quantity = quantity
+        else:
+            new_items.append({"cart_id": cart.id, "food_id": food_id, "quantity": quantity})
+
+    if new_items:
+        db.execute(insert(CartItem), new_items)
+
+    if unpriced:
+        # No price to take off the stored total: rebuild it from the items left
+        logger.warning("cart %s: foods %s not found, recomputing cart totals", cart.id, unpriced)
+        db.flush()
+        recompute_cart_totals(db, [cart.id])
+    else:
+        adjust_cart_totals(cart, count_delta, amount_delta)
 
     db.commit()
 
-    return {"message": "Cart cleared"}
+    errors = sum(1 for line in lines if line["status"] == "error")
 
+    return {
+        "message": "Cart updated",
+        "applied": len(lines) - errors,
+        "errors": errors,
+        "lines": lines
+    }
 
-@router.get("/cart")
-def get_cart(
-    user_id: int,
-    db: Session = Depends(get_db)
-    ):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+@router.post("/cart/batch")
+@query_budget(7)
+async def cart_batch(
+    data: schemas.CartBatch,
+    user: TokenUser = Depends(verified_user),
+    db: SessionRunner = Depends(get_runner)
+):
+    return await db.write(_cart_batch, user.id, data)
 
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+def _clear_cart(db: Session, user_id: int):
+    cart = db.query(Cart).filter(Cart.user_id == user_id).first()
+
+    if not cart:
+        return {"message": "Cart already empty"}
 
-    if not user.is_verified:
-        raise HTTPException(status_code=400, detail="User not verified")
+    clear_cart_items(db, cart.id)
+    reset_cart_totals(db, cart.id)
 
+    db.commit()
 
-    cart = db.query(models.Cart).filter(
-        models.Cart.user_id == user.id
-    ).first()
+    return {"message": "Cart cleared"}
+
+@router.delete("/cart/clear")
+@query_budget(3)
+async def clear_cart(
+    user: TokenUser = Depends(current_user),
+    db: SessionRunner = Depends(get_runner)
+):
+    return await db.write(_clear_cart, user.id)
+
+
+def _get_cart(db: Session, user_id: int):
+    cart = load_cart(db, user_id)
 
     if not cart:
         raise HTTPException(status_code=404, detail="Cart not found")
 
-    if not cart.items:
-        return {
-            "items": [],
-            "total": 0
-        }
+    # Totals are maintained on the cart row, see app/cart_totals.py
+    return schemas.CartResponse.model_validate(cart)
 
-    items_response = []
-    total = 0
+@router.get("/cart", response_model=schemas.CartResponse)
+@query_budget(2)
+async def get_cart(
+    user: TokenUser = Depends(verified_user),
+    db: SessionRunner = Depends(get_runner)
+):
+    return await db.run(_get_cart, user.id)
 
-    for item in cart.items:
-        subtotal = item.food.price * item.quantity
-        total += subtotal
+def _get_cart_summary(db: Session, user_id: int):
+    summary = db.query(Cart.item_count, Cart.total).filter(Cart.user_id == user_id).first()
 
-        items_response.append({
-            "food_name": item.food.name,
-            "price": item.food.price,
-            "quantity": item.quantity,
-            "subtotal": subtotal
-        })
+    if not summary:
+        raise HTTPException(status_code=404, detail="Cart not found")
 
-    return {
-        "items": items_response,
-        "total": total
-    }
+    return schemas.CartSummary.model_validate(summary)
+
+@router.get("/cart/summary", response_model=schemas.CartSummary)
+@query_budget(1)
+async def get_cart_summary(
+    user: TokenUser = Depends(verified_user),
+    db: SessionRunner = Depends(get_runner)
+):
+    return await db.run(_get_cart_summary, user.id)
 
 """System must:
 Check user exists
 Check verified
+(both from the token, see verified_user)
 Check no existing pending order
 Get cart
 If empty → error
@@ -371,28 +761,13 @@ Validate stock for ALL items
 Compute total
 Create Order (status = "pending")
 Create OrderItems
-Reduce stock
 Commit
+Stock is not taken here but at /pay, so a pending order holds none.
 All inside one transaction."""
 
-@router.post("/order/create")
-def create_order(
-    user_id: int,
-    db: Session = Depends(get_db)
-):
-
-    user = db.query(User).filter(User.id == user_id).first()
-
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    if not user.is_verified:
-        raise HTTPException(
-            status_code=400, 
-            detail="User not verified")
-
+def _create_order(db: Session, user_id: int, idempotent: IdempotentRequest | None = None):
     existing_order = db.query(Order).filter(
-    Order.user_id == user.id,
+    Order.user_id == user_id,
     Order.status == "pending").first()
 
     if existing_order:
@@ -401,7 +776,7 @@ def create_order(
             detail="You already have a pending order"
         )
 
-    cart = db.query(Cart).filter(Cart.user_id == user.id).first()
+    cart = load_cart(db, user_id)
 
     if not cart or not cart.items:
         raise HTTPException(
@@ -409,6 +784,9 @@ def create_order(
             detail="Cart is empty"
         )
 
+    # Validate stock, compute total and build order item rows in a single pass
+    total = 0
+    order_items = []
     for item in cart.items:
         if item.quantity > item.food.stock:
             raise HTTPException(
@@ -416,12 +794,15 @@ def create_order(
                 detail=f"Not enough stock for {item.food.name}"
             )
 
-    total = 0
-    for item in cart.items:
         total += item.food.price * item.quantity
+        order_items.append({
+            "food_id": item.food_id,
+            "quantity": item.quantity,
+            "price_at_purchase": item.food.price
+        })
 
     new_order = Order(
-    user_id=user.id,
+    user_id=user_id,
     total_price=total,
     status="pending"
     )
@@ -429,55 +810,113 @@ def create_order(
     db.add(new_order)
     db.flush()
 
-    for item in cart.items:
-        order_item = OrderItem(
-            order_id=new_order.id,
-            food_id=item.food.id,
-            quantity=item.quantity,
-            price_at_purchase=item.food.price
-        )
+    order_id = new_order.id
+
+    # One executemany for the lines; ORM adds would insert them one at a time
+    for row in order_items:
+        row["order_id"] = order_id
+    db.execute(insert(OrderItem), order_items)
+
+    result = schemas.OrderCreated(
+        message="Order created successfully",
+        order_id=order_id,
+        total_price=total,
+        status="pending"
+    )
+
+    if idempotent:
+        remember(db, idempotent, result.model_dump())
 
-        db.add(order_item)
     db.commit()
 
-    return {
-    "message": "Order created successfully",
-    "order_id": new_order.id,
-    "total_price": total,
-    "status": new_order.status
-    }
+    return result
+
+# With an Idempotency-Key header, a retry gets the first call's result back
+# instead of running again; see app/idempotency.py
+@router.post("/order/create", response_model=schemas.OrderCreated)
+@query_budget(7)
+async def create_order(
+    request: Request,
+    response: Response,
+    user: TokenUser = Depends(verified_user),
+    key: str | None = Depends(idempotency_key),
+    db: SessionRunner = Depends(get_runner)
+):
+    if key is None:
+        return await db.run(_create_order, user.id)
+
+    idempotent = IdempotentRequest(user.id, "/order/create", key, fingerprint())
+    return await run_idempotent(db, request.app.state.idempotency_cache, idempotent, response,
+                                _create_order, user.id)
+
+"""Order history (GET /orders):
+The caller's orders, newest first, optionally only one status
+Keyset-paginated on (created_at, id): X-Next-Cursor → ?after=
+One query for the page of orders, one for all their items and foods"""
+
+ORDER_HISTORY_PAGE_SIZE = 20
+
+def _get_orders(db: Session, user_id: int, status: str | None, after: str | None, limit: int):
+    orders = load_order_history(db, user_id, status, decode_time_cursor(after), limit + 1)
+
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        next_cursor = encode_time_cursor(orders[-1].created_at, orders[-1].id)
+
+    items_by_order = load_order_items(db, [order.id for order in orders])
+
+    history = [
+        schemas.OrderHistoryEntry(
+            order_id=order.id,
+            status=order.status,
+            total_price=order.total_price,
+            created_at=order.created_at,
+            items=items_by_order[order.id]
+        )
+        for order in orders
+    ]
+
+    return history, next_cursor
+
+@router.get("/orders", response_model=list[schemas.OrderHistoryEntry])
+@query_budget(2)
+async def get_orders(
+    response: Response,
+    status: Literal["pending", "paid", "cancelled"] | None = None,
+    after: str | None = None,
+    limit: int = Query(ORDER_HISTORY_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    user: TokenUser = Depends(current_user),
+    db: SessionRunner = Depends(get_runner)
+):
+    history, next_cursor = await db.run(_get_orders, user.id, status, after, limit)
+
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+    return history
 
 """CANCEL ORDER LOGIC
 This endpoint must:
 Check user exists
 Check verified
+(both from the token, see verified_user)
 Find the order
 Ensure it belongs to that user
 Ensure status is "pending"
-Restore stock
 Change status to "cancelled"
 Commit
 We do NOT delete the order.
-We just change status."""
-
-@router.post("/order/cancel")
-def cancel_order(
-    user_id: int,
-    order_id: int,
-    db: Session = Depends(get_db)
-):
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+We just change status.
+A pending order has not taken any stock (that happens at /pay),
+so there is none to restore."""
 
-    if not user.is_verified:
-        raise HTTPException(status_code=400, detail="User not verified")
-
-    order = db.query(Order).filter(Order.id == order_id).first()
+def _cancel_order(db: Session, user_id: int, order_id: int):
+    order = load_order(db, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
 
-    if order.user_id != user.id:
+    if order.user_id != user_id:
         raise HTTPException(status_code=403, detail="Not allowed")
 
     if order.status != "pending":
@@ -486,18 +925,33 @@ def cancel_order(
             detail="Only pending orders can be cancelled"
         )
 
-    for item in order.items:
-        item.food.stock += item.quantity
+    # Claim the order so a concurrent cancel/pay cannot also act on it
+    if not transition_order(db, order.id, "pending", "cancelled"):
+        db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail="Only pending orders can be cancelled"
+        )
 
-    order.status = "cancelled"
+    # Cancellations count on the day the order was placed, as in the backfill
+    record_cancellation(db, (order.created_at or datetime.utcnow()).date(), order.items)
 
     db.commit()
 
-    return {
-        "message": "Order cancelled successfully",
-        "order_id": order.id,
-        "status": order.status
-    }
+    return schemas.OrderCancelled(
+        message="Order cancelled successfully",
+        order_id=order_id,
+        status="cancelled"
+    )
+
+@router.post("/order/cancel", response_model=schemas.OrderCancelled)
+@query_budget(5)
+async def cancel_order(
+    order_id: int,
+    user: TokenUser = Depends(verified_user),
+    db: SessionRunner = Depends(get_runner)
+):
+    return await db.run(_cancel_order, user.id, order_id)
 
 """POST /pay
 Logic Flow:
@@ -508,22 +962,13 @@ Check order status is pending
 Create payment record
 Mark order as paid
 Reduce stock (if not already reduced)
-Clear cart
+Empty the cart
+Queue the receipt email (background job)
 Return receipt"""
 
-@router.post("/pay")
-def pay_for_order(
-    user_id: int,
-    order_id: int,
-    payment_method: str,
-    db: Session = Depends(get_db)
-):
-    import uuid
-
-    order = db.query(Order).filter(
-        Order.id == order_id,
-        Order.user_id == user_id
-    ).first()
+def _pay_for_order(db: Session, user_id: int, order_id: int, payment_method: str,
+                   idempotent: IdempotentRequest | None = None):
+    order = load_order(db, order_id, user_id)
 
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -531,61 +976,98 @@ def pay_for_order(
     if order.status == "paid":
         raise HTTPException(status_code=400, detail="Order already paid")
 
-    # 🔥 RECHECK STOCK BEFORE PAYMENT
-    for item in order.items:
-        if item.food.stock < item.quantity:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Not enough stock for {item.food.name}"
-            )
+    # 🔥 CLAIM THE ORDER: only one concurrent /pay can move it out of pending
+    if not transition_order(db, order.id, "pending", "paid"):
+        db.rollback()
+        status = db.query(Order.status).filter(Order.id == order_id).scalar()
+        if status == "paid":
+            raise HTTPException(status_code=400, detail="Order already paid")
+        raise HTTPException(status_code=400, detail="Only pending orders can be paid")
+
+    # 🔥 RESERVE STOCK ATOMICALLY: one conditional UPDATE for all items,
+    # nothing is decremented unless every item has enough
+    quantities = order_quantities(order.items)
+    if not reserve_stock(db, quantities):
+        db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail=f"Not enough stock for {first_short_food(db, quantities)}"
+        )
 
-    # 🔥 REDUCE STOCK PERMANENTLY
-    for item in order.items:
-        item.food.stock -= item.quantity
-    total = 0
-    for item in order.items:
-        total += item.quantity * item.price_at_purchase
-        
+    # Build the receipt lines
+    purchased_items = receipt_lines_adapter.validate_python(order.items)
+    total = sum(line.subtotal for line in purchased_items)
 
     # Create payment
+    paid_at = datetime.utcnow()
     payment = Payment(
         order_id=order.id,
         user_id=user_id,
         payment_method=payment_method,
         transaction_ref=str(uuid.uuid4()),
         amount=total,
-        status="success"
+        status="success",
+        created_at=paid_at
     )
 
     db.add(payment)
 
-    # Mark order as paid
-    order.status = "paid"
+    # Add to the sales summary in the same transaction as the payment
+    record_sale(db, paid_at.date(), order.items)
+
+    # Empty the cart in the same transaction, so it cannot be ordered again
+    # and nothing added after this commits is lost
+    cart_id = db.query(Cart.id).filter(Cart.user_id == user_id).scalar()
+    if cart_id is not None:
+        clear_cart_items(db, cart_id)
+        reset_cart_totals(db, cart_id)
+
+    # Emailing the receipt runs as a background job after this commits,
+    # see app/jobs.py
+    transaction_ref = payment.transaction_ref
+    enqueue(db, "send_receipt", {
+        "user_id": user_id,
+        "order_id": order_id,
+        "transaction_reference": transaction_ref,
+        "items": [line.model_dump() for line in purchased_items],
+        "total": total
+    })
+
+    # 🔥 RECEIPT RESPONSE (built before commit so nothing is reloaded)
+    receipt = schemas.Receipt(
+        message="Payment successful",
+        transaction_reference=transaction_ref,
+        order_id=order_id,
+        items_paid_for=purchased_items,
+        total_paid=total,
+        status="paid"
+    )
 
-    # Clear cart
-    cart = db.query(Cart).filter(Cart.user_id == user_id).first()
-    if cart:
-        for item in cart.items:
-            db.delete(item)
+    if idempotent:
+        remember(db, idempotent, receipt.model_dump())
 
     db.commit()
+    menu_cache.invalidate()
 
-    # 🔥 BUILD RECEIPT RESPONSE
-    purchased_items = []
+    return receipt
 
-    for item in order.items:
-        purchased_items.append({
-            "food_name": item.food.name,
-            "quantity": item.quantity,
-            "price_per_unit": item.price_at_purchase,
-            "subtotal": item.quantity * item.price_at_purchase
-        })
+# 13 with an Idempotency-Key: the key lookup and storing the result
+@router.post("/pay", response_model=schemas.Receipt)
+@query_budget(13)
+async def pay_for_order(
+    order_id: int,
+    payment_method: str,
+    request: Request,
+    response: Response,
+    user: TokenUser = Depends(current_user),
+    key: str | None = Depends(idempotency_key),
+    db: SessionRunner = Depends(get_runner)
+):
+    if key is None:
+        return await db.run(_pay_for_order, user.id, order_id, payment_method)
 
-    return {
-        "message": "Payment successful",
-        "transaction_reference": payment.transaction_ref,
-        "order_id": order.id,
-        "items_paid_for": purchased_items,
-        "total_paid": payment.amount,
-        "status": "paid"
-    }
+    idempotent = IdempotentRequest(
+        user.id, "/pay", key, fingerprint(order_id=order_id, payment_method=payment_method)
+    )
+    return await run_idempotent(db, request.app.state.idempotency_cache, idempotent, response,
+                                _pay_for_order, user.id, order_id, payment_method)
@@ -0,0 +1,86 @@
+from datetime import date
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app.database import SessionRunner, get_runner
+from app.diagnostics import query_budget
+from app.sales_summary import report_range, revenue_by_day, top_dishes, average_basket
+
+router = APIRouter(prefix="/reports")
+
+# Sales reports read only the summary tables (app/sales_summary.py), never
+# the order history, so their cost depends on the date range and menu size
+# alone. Ranges default to the last 30 days and are capped at 366.
+
+TOP_DISHES_DEFAULT = 10
+TOP_DISHES_MAX = 100
+
+
+def _range(start: date | None, end: date | None):
+    try:
+        return report_range(start, end)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+
+
+"""GET /reports/revenue
+Logic Flow:
+
+Resolve the date range
+Read one daily_sales row per day in range
+Return revenue, orders and average basket per day"""
+
+def _revenue(db: Session, start: date, end: date):
+    days = revenue_by_day(db, start, end)
+    return {"start": start, "end": end, "days": days}
+
+@router.get("/revenue")
+@query_budget(1)
+async def revenue_report(
+    start: date | None = None,
+    end: date | None = None,
+    db: SessionRunner = Depends(get_runner)
+):
+    start, end = _range(start, end)
+    return await db.run(_revenue, start, end)
+
+
+"""GET /reports/top-dishes
+Logic Flow:
+
+Resolve the date range
+Sum daily_food_sales per dish over the range
+Return the best sellers by quantity, then revenue"""
+
+def _top_dishes(db: Session, start: date, end: date, limit: int):
+    return {"start": start, "end": end, "dishes": top_dishes(db, start, end, limit)}
+
+@router.get("/top-dishes")
+@query_budget(1)
+async def top_dishes_report(
+    start: date | None = None,
+    end: date | None = None,
+    limit: int = Query(TOP_DISHES_DEFAULT, ge=1, le=TOP_DISHES_MAX),
+    db: SessionRunner = Depends(get_runner)
+):
+    start, end = _range(start, end)
+    return await db.run(_top_dishes, start, end, limit)
+
+
+"""GET /reports/average-basket
+Logic Flow:
+
+Resolve the date range
+Sum daily_sales over the range
+Return revenue / paid orders"""
+
+@router.get("/average-basket")
+@query_budget(1)
+async def average_basket_report(
+    start: date | None = None,
+    end: date | None = None,
+    db: SessionRunner = Depends(get_runner)
+):
+    start, end = _range(start, end)
+    return await db.run(average_basket, start, end)
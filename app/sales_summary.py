@@ -0,0 +1,276 @@
+import sys
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from app.models import DailyFoodSales, DailySales, Food, Order, OrderItem, Payment
+
+#Sales summary: per-day totals (daily_sales) and per-day, per-food totals
+#(daily_food_sales). pay_for_order and cancel_order add to them in their own
+#transaction, so reports never touch orders, order_items or payments and
+#cost the same however long the order history gets: they read at most
+#(days in range) x (dishes on the menu) rows.
+#Rows are added to with INSERT ... ON CONFLICT DO UPDATE SET col = col + ?,
+#so concurrent payments on the same day never overwrite each other. Other
+#databases get the portable equivalent, one row at a time: UPDATE SET
+#col = col + ?, and if no row matched, INSERT in a SAVEPOINT, going back to
+#the UPDATE if a concurrent payment inserted the row first.
+#
+#rebuild_sales_summary recomputes everything from history in keyset
+#batches; run it with
+#    python -m app.sales_summary
+#Payments made while it runs may be missed, so run it when the kitchen is
+#closed.
+
+BACKFILL_BATCH_SIZE = 5000
+MAX_REPORT_DAYS = 366
+DEFAULT_REPORT_DAYS = 30
+
+
+# INSERT ... ON CONFLICT DO UPDATE, per dialect
+UPSERT_INSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+
+def _dialect_name(db) -> str:
+    return db.get_bind().dialect.name if hasattr(db, "get_bind") else db.dialect.name
+
+
+def _add_to_each(db, table, keys, rows):
+    #Portable fallback for _add_to: a statement or three per row
+    for row in rows:
+        match = [table.c[key] == row[key] for key in keys]
+        added = {column: table.c[column] + value for column, value in row.items() if column not in keys}
+        if db.execute(update(table).where(*match).values(added)).rowcount:
+            continue
+        try:
+            with db.begin_nested():
+                db.execute(insert(table).values(row))
+        except IntegrityError:
+            # Another transaction inserted it since our UPDATE
+            db.execute(update(table).where(*match).values(added))
+
+
+def _add_to(db, model, keys, rows):
+    #Upsert rows, adding every non-key column to what is already stored
+    if not rows:
+        return
+    table = model.__table__
+    upsert_insert = UPSERT_INSERTS.get(_dialect_name(db))
+    if upsert_insert is None:
+        _add_to_each(db, table, keys, rows)
+        return
+    statement = upsert_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=keys,
+        set_={
+            column: table.c[column] + statement.excluded[column]
+            for column in rows[0] if column not in keys
+        }
+    )
+    db.execute(statement, rows)
+
+
+def _per_food(items) -> dict:
+    #food_id -> [quantity, revenue]
+    totals = defaultdict(lambda: [0, 0.0])
+    for item in items:
+        totals[item.food_id][0] += item.quantity
+        totals[item.food_id][1] += item.quantity * item.price_at_purchase
+    return totals
+
+
+def record_sale(db, day: date, items):
+    #items: the paid order's OrderItems
+    per_food = _per_food(items)
+    _add_to(db, DailySales, ["day"], [{
+        "day": day,
+        "orders_paid": 1,
+        "items_sold": sum(quantity for quantity, _ in per_food.values()),
+        "revenue": sum(revenue for _, revenue in per_food.values()),
+    }])
+    _add_to(db, DailyFoodSales, ["day", "food_id"], [
+        {"day": day, "food_id": food_id, "quantity": quantity, "revenue": revenue}
+        for food_id, (quantity, revenue) in per_food.items()
+    ])
+
+
+def record_cancellation(db, day: date, items):
+    #Only pending (unpaid) orders can be cancelled, so revenue is untouched
+    per_food = _per_food(items)
+    record_cancellations(db, {day: 1}, {
+        (day, food_id): quantity for food_id, (quantity, _) in per_food.items()
+    })
+
+
+def record_cancellations(db, orders_by_day: dict, quantities: dict):
+    #Many cancellations at once: {day: orders}, {(day, food_id): quantity}
+    _add_to(db, DailySales, ["day"], [
+        {"day": day, "orders_cancelled": orders} for day, orders in orders_by_day.items()
+    ])
+    _add_to(db, DailyFoodSales, ["day", "food_id"], [
+        {"day": day, "food_id": food_id, "quantity_cancelled": quantity}
+        for (day, food_id), quantity in quantities.items()
+    ])
+
+
+def rebuild_sales_summary(db, batch_size: int = BACKFILL_BATCH_SIZE) -> dict:
+    """Recompute both summary tables from order history.
+
+    Orders are read in keyset batches of batch_size (by id), each batch's
+    items with one IN (...) query, and folded into per-day totals, so memory
+    holds one batch plus the summary itself. The tables are then replaced in
+    one go. Works on a Session or a Connection; the caller commits. Paid
+    orders count on their payment's day, cancelled ones on the order's day.
+    """
+    daily = defaultdict(lambda: {"orders_paid": 0, "items_sold": 0, "revenue": 0.0, "orders_cancelled": 0})
+    per_food = defaultdict(lambda: {"quantity": 0, "revenue": 0.0, "quantity_cancelled": 0})
+    orders_read = 0
+    after = 0
+
+    while True:
+        batch = db.execute(
+            select(Order.id, Order.status, func.coalesce(Payment.created_at, Order.created_at))
+            .outerjoin(Payment, (Payment.order_id == Order.id) & (Payment.status == "success"))
+            .where(Order.id > after, Order.status.in_(("paid", "cancelled")))
+            .order_by(Order.id)
+            .limit(batch_size)
+        ).all()
+        if not batch:
+            break
+
+        day_by_order = {}
+        for order_id, status, happened_at in batch:
+            if happened_at is None:
+                continue
+            day = happened_at.date()
+            day_by_order[order_id] = (day, status)
+            daily[day]["orders_paid" if status == "paid" else "orders_cancelled"] += 1
+
+        items = db.execute(
+            select(OrderItem.order_id, OrderItem.food_id, OrderItem.quantity, OrderItem.price_at_purchase)
+            .where(OrderItem.order_id.in_(day_by_order.keys()))
+        )
+        for order_id, food_id, quantity, price in items:
+            day, status = day_by_order[order_id]
+            line = per_food[(day, food_id)]
+            if status == "paid":
+                line["quantity"] += quantity
+                line["revenue"] += quantity * price
+                daily[day]["items_sold"] += quantity
+                daily[day]["revenue"] += quantity * price
+            else:
+                line["quantity_cancelled"] += quantity
+
+        orders_read += len(batch)
+        after = batch[-1][0]
+
+    db.execute(delete(DailyFoodSales))
+    db.execute(delete(DailySales))
+
+    daily_rows = [{"day": day, **totals} for day, totals in daily.items()]
+    food_rows = [{"day": day, "food_id": food_id, **totals} for (day, food_id), totals in per_food.items()]
+    for start in range(0, len(daily_rows), batch_size):
+        db.execute(DailySales.__table__.insert(), daily_rows[start:start + batch_size])
+    for start in range(0, len(food_rows), batch_size):
+        db.execute(DailyFoodSales.__table__.insert(), food_rows[start:start + batch_size])
+
+    return {"orders": orders_read, "days": len(daily_rows), "day_food_rows": len(food_rows)}
+
+
+def report_range(start: date | None, end: date | None):
+    #Defaults to the last DEFAULT_REPORT_DAYS days; raises ValueError when too wide
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=DEFAULT_REPORT_DAYS - 1)
+    if start > end:
+        raise ValueError("start must not be after end")
+    if (end - start).days + 1 > MAX_REPORT_DAYS:
+        raise ValueError(f"report range is limited to {MAX_REPORT_DAYS} days")
+    return start, end
+
+
+def _average(revenue, orders):
+    return round(revenue / orders, 2) if orders else 0.0
+
+
+def revenue_by_day(db, start: date, end: date) -> list:
+    rows = db.execute(
+        select(DailySales)
+        .where(DailySales.day.between(start, end))
+        .order_by(DailySales.day)
+    ).scalars()
+    return [
+        {
+            "day": row.day,
+            "orders_paid": row.orders_paid,
+            "items_sold": row.items_sold,
+            "revenue": round(row.revenue, 2),
+            "orders_cancelled": row.orders_cancelled,
+            "average_basket": _average(row.revenue, row.orders_paid),
+        }
+        for row in rows
+    ]
+
+
+def top_dishes(db, start: date, end: date, limit: int) -> list:
+    quantity = func.sum(DailyFoodSales.quantity).label("quantity")
+    revenue = func.sum(DailyFoodSales.revenue).label("revenue")
+    ranked = (
+        select(DailyFoodSales.food_id, quantity, revenue)
+        .where(DailyFoodSales.day.between(start, end))
+        .group_by(DailyFoodSales.food_id)
+        .having(quantity > 0)
+        .order_by(quantity.desc(), revenue.desc(), DailyFoodSales.food_id)
+        .limit(limit)
+        .subquery()
+    )
+    rows = db.execute(
+        select(ranked.c.food_id, Food.name, ranked.c.quantity, ranked.c.revenue)
+        .join(Food, Food.id == ranked.c.food_id)
+        .order_by(ranked.c.quantity.desc(), ranked.c.revenue.desc(), ranked.c.food_id)
+    )
+    return [
+        {"food_id": food_id, "name": name, "quantity": quantity, "revenue": round(revenue, 2)}
+        for food_id, name, quantity, revenue in rows
+    ]
+
+
+def average_basket(db, start: date, end: date) -> dict:
+    orders, items, revenue = db.execute(
+        select(
+            func.coalesce(func.sum(DailySales.orders_paid), 0),
+            func.coalesce(func.sum(DailySales.items_sold), 0),
+            func.coalesce(func.sum(DailySales.revenue), 0.0),
+        ).where(DailySales.day.between(start, end))
+    ).one()
+    return {
+        "start": start,
+        "end": end,
+        "orders_paid": orders,
+        "revenue": round(revenue, 2),
+        "average_basket": _average(revenue, orders),
+        "average_items": round(items / orders, 2) if orders else 0.0,
+    }
+
+
+def main() -> int:
+    from app.database import engine
+    from app import migrations
+
+    migrations.ensure_schema(engine)
+
+    with engine.begin() as conn:
+        result = rebuild_sales_summary(conn)
+
+    print(f"rebuilt from {result['orders']} orders: {result['days']} days, "
+          f"{result['day_food_rows']} day/dish rows")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
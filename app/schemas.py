@@ -1,4 +1,7 @@
-from pydantic import BaseModel, EmailStr
+from datetime import datetime
+from typing import Literal
+
+from pydantic import AliasChoices, AliasPath, BaseModel, ConfigDict, EmailStr, Field, computed_field
 
 class UserCreate(BaseModel): 
     email: EmailStr
@@ -23,22 +26,118 @@ class FoodCreate(BaseModel):
     description: str
     price: float
 
+class FoodImportRow(FoodCreate):
+    stock: int | None = Field(default=None, ge=0)  # None keeps the default / current stock
+
 class FoodResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     name: str
     description: str
     price: float
     is_available: bool
 
-class Config:
-        orm_mode = True
-
 class cartAdd(BaseModel):
-    user_id: int
     food_id: int
     quantity: int
 
-#class getCart(BaseModel):
+class CartOperation(BaseModel):
+    op: Literal["add", "update", "remove"]
+    food_id: int
+    quantity: int = 1  # add: amount to add, update: new quantity, remove: ignored
+
+class CartBatch(BaseModel):
+    operations: list[CartOperation] = Field(min_length=1, max_length=200)
+
+#Response schemas. Routes return these (built from the ORM objects with
+#model_validate, inside the session) and declare them as response_model,
+#so FastAPI serializes straight to JSON bytes with pydantic-core instead of
+#walking plain dicts through jsonable_encoder. The aliases read nested ORM
+#attributes (item.food.name) and, for payloads replayed from storage (see
+#app/idempotency.py), the plain field names as well.
+
+def _food_field(name: str):
+    return Field(validation_alias=AliasChoices(f"food_{name}", AliasPath("food", name)))
+
+class CartItemResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    food_name: str = _food_field("name")
+    price: float = Field(validation_alias=AliasChoices("price", AliasPath("food", "price")))
+    quantity: int
+
+    @computed_field
+    @property
+    def subtotal(self) -> float:
+        return self.price * self.quantity
+
+class CartResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    items: list[CartItemResponse]
+    item_count: int
+    total: float
+
+class CartSummary(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    item_count: int
+    total: float
+
+class OrderCreated(BaseModel):
+    message: str
+    order_id: int
+    total_price: float
+    status: str
+
+class OrderLine(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    food_id: int
+    food_name: str = _food_field("name")
+    quantity: int
+    price_at_purchase: float
+
+    @computed_field
+    @property
+    def subtotal(self) -> float:
+        return self.quantity * self.price_at_purchase
+
+class OrderHistoryEntry(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    order_id: int = Field(validation_alias=AliasChoices("order_id", "id"))
+    status: str
+    total_price: float
+    created_at: datetime | None
+    items: list[OrderLine]
+
+class OrderCancelled(BaseModel):
+    message: str
+    order_id: int
+    status: str
+
+class ReceiptLine(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    food_name: str = _food_field("name")
+    quantity: int
+    price_per_unit: float = Field(validation_alias=AliasChoices("price_per_unit", "price_at_purchase"))
+
+    @computed_field
+    @property
+    def subtotal(self) -> float:
+        return self.quantity * self.price_per_unit
+
+class Receipt(BaseModel):
+    message: str
+    transaction_reference: str
+    order_id: int
+    items_paid_for: list[ReceiptLine]
+    total_paid: float
+    status: str
+
 
 #FastAPI receives JSON 
 #JSON → dictionary
@@ -0,0 +1,273 @@
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from sqlalchemy import and_, bindparam, case, literal, literal_column, or_, select, text, tuple_
+from sqlalchemy.orm import Session
+
+from app.models import Food
+from app.pagination import encode_search_cursor, decode_search_cursor
+
+#Menu search (GET /foods/search?q=).
+#On SQLite, foods_fts is an FTS5 index over foods.name and foods.description
+#("external content": it stores only the index, rows come from foods). The
+#triggers below keep it in step with every write to foods, whoever makes
+#it: create_food, the bulk import, or a manual fix. Updates only touch it
+#when name or description change, so stock and price updates cost nothing.
+#Every word of the query must match, as a prefix, as you type: "jol ri"
+#finds "Jollof Rice". Results are ranked by BM25 with name matches weighing
+#NAME_WEIGHT times more than description matches, then by id.
+#
+#Ranking is the expensive part: bm25() costs ~2us per matching dish and a
+#common word ("rice") can match thousands of them, while finding the
+#matches is well under a millisecond. So the full ranking of a query,
+#(score, id) for every match, is kept in ranking_cache, and each page is
+#one primary key lookup of the next ids in it. The cache holds rankings
+#only, not dishes: availability, prices and stock are read fresh for every
+#page, so orders and stock updates never invalidate it. create_food and the
+#bulk import clear it; other worker processes (and writes made outside the
+#app) converge within RANKING_CACHE_TTL, like the menu cache.
+#
+#Other databases fall back to LIKE: a dish matches when every word starts
+#a word of its name or description, and name matches rank first.
+#
+#Pages are keyset on (score, id), like the other lists: pass X-Next-Cursor
+#back as ?after=.
+
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+MAX_TERMS = 8
+MAX_SEARCH_PAGE_SIZE = 100
+DEFAULT_SEARCH_PAGE_SIZE = 20
+
+RANKING_CACHE_TTL = 30
+# Total (score, id) pairs held across all cached queries, 16 bytes each
+RANKING_CACHE_MAX_MATCHES = 1_000_000
+
+FTS_DDL = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS foods_fts USING fts5(
+        name, description,
+        content='foods', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS foods_fts_insert AFTER INSERT ON foods BEGIN
+        INSERT INTO foods_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS foods_fts_delete AFTER DELETE ON foods BEGIN
+        INSERT INTO foods_fts(foods_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS foods_fts_update AFTER UPDATE OF name, description ON foods BEGIN
+        INSERT INTO foods_fts(foods_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO foods_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+)
+
+_WORD = re.compile(r"\w+")
+
+
+def create_search_index(conn):
+    #Create foods_fts and its triggers and index every existing dish (SQLite only)
+    if conn.dialect.name != "sqlite":
+        return
+    for statement in FTS_DDL:
+        conn.execute(text(statement))
+    conn.execute(text("INSERT INTO foods_fts(foods_fts) VALUES ('rebuild')"))
+
+
+def search_terms(q: str) -> list:
+    #Lower-cased words of the query; punctuation and FTS5 syntax are dropped
+    return _WORD.findall(q.lower())[:MAX_TERMS]
+
+
+def match_expression(terms) -> str:
+    #Each word quoted (so nothing in it is FTS5 syntax) and prefix-matched
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def fts_matches(terms):
+    return select(
+        literal_column("foods_fts.rowid").label("food_id"),
+        literal_column(f"bm25(foods_fts, {NAME_WEIGHT}, {DESCRIPTION_WEIGHT})").label("score"),
+    ).select_from(text("foods_fts")).where(
+        text("foods_fts MATCH :match").bindparams(match=match_expression(terms))
+    ).subquery()
+
+
+@dataclass(frozen=True)
+class Ranking:
+    #Every match of one query, best first: parallel arrays sorted by (score, id)
+    version: int
+    scores: array
+    ids: array
+    stored_at: float
+
+    def position_after(self, score: float, last_id: int) -> int:
+        return bisect_right(range(len(self.ids)), (score, last_id), key=lambda i: (self.scores[i], self.ids[i]))
+
+
+class RankingCache:
+    """Rankings of recent queries: LRU, bounded by total matches, with a TTL.
+
+    Versioned like MenuCache, so a ranking computed before invalidate() is
+    never stored after it.
+    """
+
+    def __init__(self, max_matches: int = RANKING_CACHE_MAX_MATCHES, ttl: float = RANKING_CACHE_TTL):
+        self.max_matches = max_matches
+        self.ttl = ttl
+        self.version = 0
+        self._entries = OrderedDict()
+        self._matches = 0
+        self._lock = threading.Lock()
+
+    def get(self, match: str):
+        with self._lock:
+            entry = self._entries.get(match)
+            if entry is None:
+                return None
+            if entry.version != self.version or time.monotonic() - entry.stored_at > self.ttl:
+                self._drop(match)
+                return None
+            self._entries.move_to_end(match)
+            return entry
+
+    def store(self, version: int, match: str, scores: array, ids: array) -> Ranking:
+        entry = Ranking(version, scores, ids, time.monotonic())
+        if len(ids) > self.max_matches:
+            return entry
+
+        with self._lock:
+            if version == self.version:
+                self._drop(match)
+                self._entries[match] = entry
+                self._matches += len(ids)
+                while self._matches > self.max_matches:
+                    self._drop(next(iter(self._entries)))
+
+        return entry
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            self._matches = 0
+
+    def _drop(self, match: str):
+        entry = self._entries.pop(match, None)
+        if entry is not None:
+            self._matches -= len(entry.ids)
+
+
+ranking_cache = RankingCache()
+
+
+def _ranking(db: Session, terms) -> Ranking:
+    match = match_expression(terms)
+    cached = ranking_cache.get(match)
+    if cached is not None:
+        return cached
+
+    version = ranking_cache.version
+    matches = fts_matches(terms)
+    scores, ids = array("d"), array("q")
+    for score, food_id in db.execute(
+        select(matches.c.score, matches.c.food_id).order_by(matches.c.score, matches.c.food_id)
+    ):
+        scores.append(score)
+        ids.append(food_id)
+    return ranking_cache.store(version, match, scores, ids)
+
+
+def _ranked_page(db: Session, terms, after: str, limit: int):
+    cursor = decode_search_cursor(after)
+    ranking = _ranking(db, terms)
+    position = 0 if cursor is None else ranking.position_after(*cursor)
+
+    # Walk the ranking in chunks, keeping dishes that are still available;
+    # one chunk is enough unless much of the menu is switched off
+    page = []
+    chunk_size = max(2 * (limit + 1), 50)
+    while len(page) <= limit and position < len(ranking.ids):
+        chunk = ranking.ids[position:position + chunk_size]
+        found = {
+            food.id: food for food in db.scalars(
+                select(Food).where(Food.id.in_(bindparam("ids", expanding=True)), Food.is_available == True),
+                {"ids": chunk.tolist()}
+            )
+        }
+        for offset, food_id in enumerate(chunk):
+            if food_id in found:
+                page.append((ranking.scores[position + offset], found[food_id]))
+        position += len(chunk)
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_search_cursor(page[-1][0], page[-1][1].id)
+
+    return [food for _, food in page], next_cursor
+
+
+def _like_word_start(column, term):
+    #term at the start of the column or of any word in it
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return or_(
+        column.ilike(f"{escaped}%", escape="\\"),
+        column.ilike(f"% {escaped}%", escape="\\"),
+    )
+
+
+def like_matches(terms):
+    in_name = [_like_word_start(Food.name, term) for term in terms]
+    in_either = [or_(name, _like_word_start(Food.description, term)) for name, term in zip(in_name, terms)]
+    score = case((and_(*in_name), 0), else_=1)
+    return select(Food.id.label("food_id"), score.label("score")).where(*in_either).subquery()
+
+
+def search_page(db: Session, matches, after: str, limit: int):
+    #One page of available dishes straight from a matches subquery (food_id, score)
+    query = (
+        select(Food, matches.c.score)
+        .join(matches, Food.id == matches.c.food_id)
+        .where(Food.is_available == True)
+    )
+
+    cursor = decode_search_cursor(after)
+    if cursor is not None:
+        score, last_id = cursor
+        query = query.where(tuple_(matches.c.score, Food.id) > tuple_(literal(score), literal(last_id)))
+
+    rows = db.execute(query.order_by(matches.c.score, Food.id).limit(limit + 1)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_search_cursor(rows[-1].score, rows[-1].Food.id)
+
+    return [row.Food for row in rows], next_cursor
+
+
+def search_foods(db: Session, q: str, after: str, limit: int):
+    #Returns (foods, next_cursor)
+    terms = search_terms(q)
+    if not terms:
+        return [], None
+
+    if db.get_bind().dialect.name == "sqlite":
+        return _ranked_page(db, terms, after, limit)
+    return search_page(db, like_matches(terms), after, limit)
@@ -0,0 +1,56 @@
+from sqlalchemy import case, update
+from sqlalchemy.orm import Session
+
+from app.models import Food, Order
+
+#Stock and order-status changes done as single conditional UPDATEs, so two
+#concurrent payments can never both pass a stock check made in Python and
+#oversell, and no row is read-modified-written (no lost updates).
+
+
+def order_quantities(items) -> dict:
+    #food_id -> total quantity, for order or cart items
+    quantities = {}
+    for item in items:
+        quantities[item.food_id] = quantities.get(item.food_id, 0) + item.quantity
+    return quantities
+
+
+def reserve_stock(db: Session, quantities: dict) -> bool:
+    """Take stock for every food in one statement.
+
+    UPDATE foods SET stock = stock - q(id) WHERE id IN (...) AND stock >= q(id)
+    Returns False if any food is short; the caller must then roll back,
+    since the foods that did have enough were already decremented.
+    """
+    if not quantities:
+        return True
+
+    needed = case(quantities, value=Food.id)
+    result = db.execute(
+        update(Food)
+        .where(Food.id.in_(quantities.keys()), Food.stock >= needed)
+        .values(stock=Food.stock - needed)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == len(quantities)
+
+
+def first_short_food(db: Session, quantities: dict):
+    #Name of the first food (by id) that cannot cover its quantity
+    needed = case(quantities, value=Food.id)
+    return db.query(Food.name).filter(
+        Food.id.in_(quantities.keys()),
+        Food.stock < needed
+    ).order_by(Food.id).limit(1).scalar()
+
+
+def transition_order(db: Session, order_id: int, from_status: str, to_status: str) -> bool:
+    #Only one caller can move an order out of from_status
+    result = db.execute(
+        update(Order)
+        .where(Order.id == order_id, Order.status == from_status)
+        .values(status=to_status)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
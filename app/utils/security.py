@@ -1,16 +1,93 @@
 # security.py
-from passlib.context import CryptContext
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-# Create a password context for hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from functools import cache
 
-# Function to hash a plain password
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+from fastapi import HTTPException
+
+from app.config import settings
+
+# Create a password context for hashing with the given work factor.
+# Hashes made with a different work factor are flagged by verify_and_update,
+# so changing BCRYPT_ROUNDS upgrades accounts on their next login.
+# passlib and bcrypt are imported on the first hash, not at startup.
+@cache
+def pwd_context(rounds: int):
+    from passlib.context import CryptContext
+
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__rounds=rounds
+    )
+
+
+class HashingBusy(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=503,
+            detail="Server busy, please retry",
+            headers={"Retry-After": "1"}
+        )
+
+
+class HashingPool:
+    """Size-limited executor for bcrypt work.
+
+    bcrypt releases the GIL, so a couple of threads keep the CPU busy
+    without taking FastAPI's request threadpool or blocking the event loop.
+    At most max_pending hashes may be running or queued; anything beyond
+    that is rejected immediately with HashingBusy (503). A slot is freed when
+    the hash finishes, not when its request goes away: a client that
+    disconnects mid-hash still holds its slot until the thread is done.
+    Hashes use rounds, the app's BCRYPT_ROUNDS.
+    """
+
+    def __init__(self, workers: int, max_pending: int, rounds: int):
+        self.rounds = rounds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hashing")
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    async def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def build_hashing_pool(config=settings) -> HashingPool:
+    return HashingPool(config.hash_workers, config.hash_queue_limit, config.bcrypt_rounds)
+
+# Function to hash a plain password (outside an app, e.g. seeding)
+def hash_password(password: str, rounds: int = None) -> str:
+    return pwd_context(rounds or settings.bcrypt_rounds).hash(password)
 
 # Function to verify a password against the hash
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+def verify_password(plain_password: str, hashed_password: str, rounds: int = None) -> bool:
+    return pwd_context(rounds or settings.bcrypt_rounds).verify(plain_password, hashed_password)
+
+# Verify, and rehash when the stored hash uses a work factor other than rounds
+def _verify_and_update(plain_password: str, hashed_password: str, rounds: int):
+    return pwd_context(rounds).verify_and_update(plain_password, hashed_password)
+
+# Async versions used by the routes: the work runs on the app's hashing pool,
+# with the app's work factor
+async def hash_password_async(pool: HashingPool, password: str) -> str:
+    return await pool.run(hash_password, password, pool.rounds)
+
+# Returns (is_valid, new_hash); new_hash is set when the stored hash uses an outdated cost
+async def verify_and_update_password(pool: HashingPool, plain_password: str, hashed_password: str):
+    return await pool.run(_verify_and_update, plain_password, hashed_password, pool.rounds)
 
 """INITIAL ISSUES: Bcrypt package and passlib was initial incompatible and could hash password effectively, giving 'password should not exceed 72 bytes errors'. pip uninstall bcrypt -y and pip uninstall passlib -y done and new packages, pip install bcrypt==4.0.1
 pip install passlib[bcrypt]==1.7.4 solved it"""
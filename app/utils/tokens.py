@@ -0,0 +1,219 @@
+# tokens.py
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi import Depends, HTTPException, Request
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from app.config import settings
+
+# Signed session tokens (JWT, HS256) issued by /login and /verify.
+# The token carries the user id and whether the account is verified, so the
+# cart/order/pay routes check the caller with an HMAC instead of a users
+# query. Validation is pure CPU: signature, expiry and an in-memory
+# revocation lookup.
+#
+# Key rotation: TOKEN_KEYS is "kid:secret,kid:secret,..."; the first key
+# signs, every listed key verifies (picked by the token's "kid" header).
+# Add the new key first, keep the old one listed until TOKEN_TTL_SECONDS
+# have passed, then drop it.
+#
+# Without TOKEN_KEYS each process makes up a random key: fine for one
+# development server, but tokens would fail on every other worker and after
+# a restart. So the app refuses to start without TOKEN_KEYS unless APP_ENV
+# is development and WEB_CONCURRENCY asks for one worker, and logs an error
+# when it runs as a spawned worker (uvicorn --workers, or --reload).
+
+logger = logging.getLogger("app.tokens")
+
+
+class InvalidToken(HTTPException):
+    def __init__(self, detail: str = "Invalid or expired token"):
+        super().__init__(
+            status_code=401,
+            detail=detail,
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
+
+@dataclass(frozen=True)
+class TokenUser:
+    id: int
+    verified: bool
+    token_id: str
+    expires_at: int
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def parse_keys(value: str) -> dict:
+    #"kid:secret,kid:secret" -> {kid: secret bytes}, in the order given
+    keys = {}
+    for entry in value.split(","):
+        if not entry.strip():
+            continue
+        kid, sep, secret = entry.strip().partition(":")
+        if not sep or not kid or not secret:
+            raise ValueError("TOKEN_KEYS entries must look like kid:secret")
+        keys[kid] = secret.encode("utf-8")
+    return keys
+
+
+class RevocationList:
+    """Revoked token ids, kept only until the token would have expired anyway.
+
+    Bounded: past max_size the oldest revocations are dropped first. This
+    lives in process memory, so with several workers a revocation is only
+    seen by the worker that made it.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._revoked = OrderedDict()  # token id -> expires_at
+        self._lock = threading.Lock()
+
+    def revoke(self, token_id: str, expires_at: int):
+        with self._lock:
+            self._revoked[token_id] = expires_at
+            self._revoked.move_to_end(token_id)
+            self._purge(int(time.time()))
+
+    def is_revoked(self, token_id: str) -> bool:
+        return token_id in self._revoked
+
+    def _purge(self, now: int):
+        while self._revoked:
+            token_id, expires_at = next(iter(self._revoked.items()))
+            if expires_at > now and len(self._revoked) <= self.max_size:
+                break
+            del self._revoked[token_id]
+
+    def __len__(self):
+        return len(self._revoked)
+
+
+class TokenSigner:
+    def __init__(self, keys: dict, ttl_seconds: int, revoked: RevocationList):
+        if not keys:
+            raise ValueError("TokenSigner needs at least one key")
+        self.keys = keys
+        self.active_kid = next(iter(keys))
+        self.ttl_seconds = ttl_seconds
+        self.revoked = revoked
+        self._headers = {
+            kid: _b64encode(json.dumps({"alg": "HS256", "typ": "JWT", "kid": kid}, separators=(",", ":")).encode())
+            for kid in keys
+        }
+
+    def _sign(self, kid: str, signing_input: str) -> bytes:
+        return hmac.new(self.keys[kid], signing_input.encode("ascii"), hashlib.sha256).digest()
+
+    def issue(self, user_id: int, verified: bool) -> str:
+        now = int(time.time())
+        payload = {
+            "sub": str(user_id),
+            "ver": verified,
+            "iat": now,
+            "exp": now + self.ttl_seconds,
+            "jti": secrets.token_hex(8),
+        }
+        signing_input = self._headers[self.active_kid] + "." + _b64encode(
+            json.dumps(payload, separators=(",", ":")).encode()
+        )
+        return signing_input + "." + _b64encode(self._sign(self.active_kid, signing_input))
+
+    def verify(self, token: str) -> TokenUser:
+        try:
+            header_part, payload_part, signature_part = token.split(".")
+            header = json.loads(_b64decode(header_part))
+            kid = header.get("kid")
+
+            if header.get("alg") != "HS256" or kid not in self.keys:
+                raise InvalidToken()
+
+            expected = self._sign(kid, header_part + "." + payload_part)
+            if not hmac.compare_digest(expected, _b64decode(signature_part)):
+                raise InvalidToken()
+
+            claims = json.loads(_b64decode(payload_part))
+            user = TokenUser(
+                id=int(claims["sub"]),
+                verified=bool(claims["ver"]),
+                token_id=str(claims["jti"]),
+                expires_at=int(claims["exp"]),
+            )
+        except InvalidToken:
+            raise
+        except (ValueError, KeyError, TypeError, AttributeError):
+            raise InvalidToken()
+
+        if user.expires_at <= time.time():
+            raise InvalidToken()
+
+        if self.revoked.is_revoked(user.token_id):
+            raise InvalidToken("Token has been revoked")
+
+        return user
+
+    def revoke(self, user: TokenUser):
+        self.revoked.revoke(user.token_id, user.expires_at)
+
+
+def build_token_signer(config=settings) -> TokenSigner:
+    keys = parse_keys(config.token_keys)
+    if not keys:
+        if config.app_env != "development":
+            raise ValueError(f"TOKEN_KEYS must be set when APP_ENV is {config.app_env!r}")
+        if _web_concurrency() > 1:
+            raise ValueError("TOKEN_KEYS must be set to run several workers: each would sign with its own key")
+        if multiprocessing.parent_process() is not None:
+            logger.error("TOKEN_KEYS is not set and this is a spawned worker process: with "
+                         "uvicorn --workers, tokens issued by one worker fail on the others")
+        else:
+            logger.warning("TOKEN_KEYS is not set: signing with a random key, tokens end with this process")
+        keys = {"dev": secrets.token_bytes(32)}
+    return TokenSigner(keys, config.token_ttl_seconds, RevocationList(config.token_revocation_size))
+
+
+def _web_concurrency() -> int:
+    #Worker count gunicorn and uvicorn take by default
+    try:
+        return int(os.getenv("WEB_CONCURRENCY") or 1)
+    except ValueError:
+        return 1
+
+
+bearer_scheme = HTTPBearer(auto_error=False)
+
+
+# async def on purpose: validation is a few microseconds of CPU, not worth a
+# trip through the threadpool
+async def current_user(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials | None = Depends(bearer_scheme)
+) -> TokenUser:
+    if credentials is None:
+        raise InvalidToken("Not authenticated")
+    return request.app.state.token_signer.verify(credentials.credentials)
+
+
+async def verified_user(user: TokenUser = Depends(current_user)) -> TokenUser:
+    if not user.verified:
+        raise HTTPException(status_code=400, detail="User not verified")
+    return user
@@ -0,0 +1,209 @@
+import asyncio
+import contextvars
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.metrics import registry
+
+#Optional serial writer for SQLite (SQLITE_SERIAL_WRITES=1), to bound write
+#latency under contention.
+#SQLite has one write lock per database file. When many requests write at
+#once, each waits for the lock in SQLite's busy handler, which sleeps and
+#retries: who gets the lock next is luck, so a few writes wait far longer
+#than the rest (p99 in whole seconds in benchmarks.write_queue). With the
+#serial writer, routes submit their write as a unit of work (the same
+#fn(db, *args) they would pass to db.run) with SessionRunner.write, and
+#one writer thread serves the units in arrival order. It does not add
+#throughput: measured writes/s are about the same as without it (0.8x to
+#1.8x on local disks, where a COMMIT costs little); what it buys is a p99
+#close to the median. The writer, on its own connection, runs the units in
+#batches:
+#  BEGIN IMMEDIATE
+#    SAVEPOINT; unit 1; RELEASE    (or ROLLBACK TO it if the unit raised)
+#    SAVEPOINT; unit 2; RELEASE
+#    ...                           up to write_batch_size units
+#  COMMIT
+#and then resolves each caller's future with its own return value or
+#exception. A batch is whatever queued up while the last one ran, so an
+#idle server still commits a lone write straight away.
+#Units run on a Session joined to the batch with
+#join_transaction_mode="create_savepoint": the db.commit() and
+#db.rollback() inside route code release or roll back that unit's own
+#SAVEPOINT only. Anything that must wait for the real COMMIT (waking job
+#workers, say) registers itself with on_durable_commit(db, callback). A
+#unit must only use the session it is given: a second connection would
+#wait for the lock the writer holds.
+#Reads (db.run) keep using the request's pooled connections, which WAL
+#lets run alongside the writer. If the COMMIT itself fails, every caller
+#in the batch gets that error and none of the batch is kept.
+#Each unit runs in its caller's context, so request metrics and
+#diagnostics count its queries against the route as before (they skip
+#SAVEPOINT statements, see diagnostics.is_savepoint_statement).
+
+logger = logging.getLogger("app.write_queue")
+
+_BATCH_CALLBACKS = "write_queue_after_commit"
+
+
+def on_durable_commit(db, callback):
+    #Run callback once db's changes are committed: after this commit for a
+    #normal session, after the batch COMMIT for a write queue unit
+    callbacks = db.info.get(_BATCH_CALLBACKS)
+    if callbacks is None:
+        callback()
+    elif callback not in callbacks:
+        callbacks.append(callback)
+
+
+@dataclass
+class _Unit:
+    fn: object
+    args: tuple
+    kwargs: dict
+    context: contextvars.Context
+    future: Future = field(default_factory=Future)
+
+
+def _writer_engine(engine_settings):
+    from app.database import build_engine
+
+    engine = build_engine(engine_settings, pool_size=1, max_overflow=0)
+
+    # pysqlite opens transactions on its own and breaks SAVEPOINT; take
+    # over (SQLAlchemy's documented recipe) and take the write lock up front
+    @event.listens_for(engine, "connect")
+    def _manual_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _begin_immediate(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    return engine
+
+
+class WriteQueue:
+    #One per app (app.state.write_queue, see create_app); start() opens its
+    #connection and writer thread, stop() closes them
+    def __init__(self, engine_settings):
+        from sqlalchemy.engine import make_url
+        from app.database import _is_memory_sqlite, _is_sqlite
+
+        url = make_url(engine_settings.database_url)
+        if not _is_sqlite(url) or _is_memory_sqlite(url):
+            raise ValueError("SQLITE_SERIAL_WRITES needs a SQLite database file")
+        self.engine_settings = engine_settings
+        self.batch_size = max(1, engine_settings.write_batch_size)
+        self._queue = queue.SimpleQueue()
+        self._engine = None
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._engine = _writer_engine(self.engine_settings)
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        #Units already queued are still written
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+        self._engine.dispose()
+        self._engine = None
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        #fn(db, *args, **kwargs) in the next batch; the Future resolves after COMMIT
+        unit = _Unit(fn, args, kwargs, contextvars.copy_context())
+        self._queue.put(unit)
+        return unit.future
+
+    async def write(self, fn, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            unit = self._queue.get()
+            if unit is None:
+                break
+            batch = [unit]
+            while len(batch) < self.batch_size:
+                try:
+                    unit = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if unit is None:
+                    stopping = True
+                    break
+                batch.append(unit)
+            try:
+                self.run_batch(batch)
+            except Exception:
+                logger.exception("write batch failed")
+
+    def run_batch(self, batch):
+        start = time.perf_counter()
+        callbacks = []
+        outcomes = []
+        try:
+            with self._engine.connect() as conn:
+                transaction = conn.begin()
+                for unit in batch:
+                    outcomes.append(self._run_unit(conn, unit, callbacks))
+                transaction.commit()
+        except BaseException as error:
+            # Nothing in the batch was kept
+            for unit in batch:
+                if not unit.future.done():
+                    unit.future.set_exception(error)
+            raise
+
+        registry.record_write_batch(len(batch), time.perf_counter() - start)
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                logger.exception("after-commit callback failed")
+
+        for unit, (ok, value) in zip(batch, outcomes):
+            if ok:
+                unit.future.set_result(value)
+            else:
+                unit.future.set_exception(value)
+
+    def _run_unit(self, conn, unit, callbacks):
+        #Returns (True, result) or (False, exception); the unit's SAVEPOINT
+        #is rolled back on close unless the unit committed it
+        session = Session(
+            bind=conn,
+            join_transaction_mode="create_savepoint",
+            autoflush=False,
+            info={_BATCH_CALLBACKS: callbacks},
+        )
+        try:
+            return True, unit.context.run(unit.fn, session, *unit.args, **unit.kwargs)
+        except Exception as error:
+            return False, error
+        finally:
+            session.close()
+
+
+def build_write_queue(config) -> WriteQueue | None:
+    #None unless SQLITE_SERIAL_WRITES is on; db.write then runs like db.run
+    return WriteQueue(config) if config.sqlite_serial_writes else None
@@ -0,0 +1,127 @@
+"""Cold start benchmark.
+
+Launches `uvicorn app.main:app --workers N` against a scratch database and
+measures, per launch:
+
+  first response: from spawning uvicorn until GET / answers 200
+  all workers:    until every worker has logged "Application startup complete"
+
+Two scenarios are run --runs times each:
+
+  first deploy: empty database, the first worker creates the schema
+  restart:      schema already current, the case every later deploy or
+                worker restart hits
+
+    python -m benchmarks.cold_start --workers 4 --runs 5
+"""
+import argparse
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.common import REPO_ROOT
+
+STARTUP_LINE = "Application startup complete"
+STARTUP_TIMEOUT = 60
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def prepare_schema(database_url: str):
+    #Bring the scratch database up to date in a child process, so this one
+    #never imports the app
+    subprocess.run(
+        [sys.executable, "-m", "app.migrations"],
+        cwd=REPO_ROOT, env={**os.environ, "DATABASE_URL": database_url},
+        check=True, stdout=subprocess.DEVNULL
+    )
+
+
+def responds(port: int) -> bool:
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=0.5) as sock:
+            sock.sendall(b"GET / HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n")
+            return sock.recv(16).startswith(b"HTTP/1.1 200")
+    except OSError:
+        return False
+
+
+def launch(database_url: str, workers: int) -> dict:
+    port = free_port()
+    env = {**os.environ, "DATABASE_URL": database_url, "ORDER_SWEEP_INTERVAL_SECONDS": "0"}
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "info", "--no-access-log"],
+        cwd=REPO_ROOT, env=env, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL,
+        text=True, start_new_session=True
+    )
+
+    started = []
+    all_started = threading.Event()
+
+    def watch_log():
+        for line in server.stderr:
+            if STARTUP_LINE in line:
+                started.append(time.perf_counter() - start)
+                if len(started) == workers:
+                    all_started.set()
+
+    threading.Thread(target=watch_log, daemon=True).start()
+
+    try:
+        first_response = None
+        deadline = start + STARTUP_TIMEOUT
+        while time.perf_counter() < deadline:
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with {server.returncode}")
+            if responds(port):
+                first_response = time.perf_counter() - start
+                break
+            time.sleep(0.005)
+        if first_response is None or not all_started.wait(max(deadline - time.perf_counter(), 0)):
+            raise RuntimeError("server did not start in time")
+        return {"first_response": first_response, "all_workers": started[-1]}
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait(timeout=30)
+
+
+def run(label: str, workers: int, runs: int, prepared: bool):
+    results = []
+    for _ in range(runs):
+        scratch_dir = tempfile.mkdtemp(prefix="chuks_cold_start_")
+        database_url = f"sqlite:///{scratch_dir}/cold.db"
+        if prepared:
+            prepare_schema(database_url)
+        results.append(launch(database_url, workers))
+
+    first = [result["first_response"] * 1000 for result in results]
+    everyone = [result["all_workers"] * 1000 for result in results]
+    print(f"{label:<14} first response p50={statistics.median(first):7.1f}ms "
+          f"max={max(first):7.1f}ms | all {workers} workers p50={statistics.median(everyone):7.1f}ms "
+          f"max={max(everyone):7.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    run("first deploy", args.workers, args.runs, prepared=False)
+    run("restart", args.workers, args.runs, prepared=True)
+
+
+if __name__ == "__main__":
+    main()
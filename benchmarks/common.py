@@ -0,0 +1,45 @@
+import os
+import statistics
+import sys
+import tempfile
+
+#Shared helpers for the benchmark scripts.
+#Benchmarks must never touch the local chuks_database.db: use_scratch_database
+#points DATABASE_URL at a scratch file before anything imports app.database.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+def use_scratch_database(database_url: str = None) -> str:
+    if database_url is None:
+        database_url = os.environ.get("DATABASE_URL")
+    if database_url is None:
+        scratch_dir = tempfile.mkdtemp(prefix="chuks_bench_")
+        database_url = f"sqlite:///{scratch_dir}/bench.db"
+
+    os.environ["DATABASE_URL"] = database_url
+    return database_url
+
+
+def without_rate_limits():
+    #Load scenarios send everything from one client; see app/rate_limit.py
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples_ms, elapsed_s: float) -> dict:
+    return {
+        "count": len(samples_ms),
+        "throughput_rps": round(len(samples_ms) / elapsed_s, 2) if elapsed_s else 0.0,
+        "p50_ms": round(statistics.median(samples_ms), 3),
+        "p95_ms": round(percentile(samples_ms, 95), 3),
+        "p99_ms": round(percentile(samples_ms, 99), 3),
+    }
@@ -0,0 +1,96 @@
+"""Login storm benchmark.
+
+Measures /foods latency on its own and again while a burst of concurrent
+/login calls is hammering bcrypt. With hashing on its own bounded pool the
+p99 for /foods should stay roughly flat, and excess logins get a fast 503.
+
+Run from the repository root:
+    python -m benchmarks.login_storm --logins 200 --reads 500
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from benchmarks.common import percentile, use_scratch_database, without_rate_limits
+
+# Run against a scratch database, never the local chuks_database.db
+use_scratch_database()
+# The storm comes from one client: let it reach bcrypt
+without_rate_limits()
+
+from app.main import app  # noqa: E402
+
+EMAIL = "storm@example.com"
+PASSWORD = "storm-password"
+
+
+async def timed_get(client, path, samples):
+    start = time.perf_counter()
+    response = await client.get(path)
+    samples.append((time.perf_counter() - start) * 1000)
+    response.raise_for_status()
+
+
+async def read_phase(client, reads, concurrency):
+    samples = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await timed_get(client, "/foods", samples)
+
+    await asyncio.gather(*(one() for _ in range(reads)))
+    return samples
+
+
+async def login_storm(client, logins):
+    statuses = await asyncio.gather(*(
+        client.post("/login", json={"email": EMAIL, "password": PASSWORD})
+        for _ in range(logins)
+    ))
+    counts = {}
+    for response in statuses:
+        counts[response.status_code] = counts.get(response.status_code, 0) + 1
+    return counts
+
+
+def report(label, samples):
+    print(
+        f"{label:<16} n={len(samples):<5} "
+        f"p50={statistics.median(samples):7.2f}ms "
+        f"p95={percentile(samples, 95):7.2f}ms "
+        f"p99={percentile(samples, 99):7.2f}ms"
+    )
+
+
+async def main(args):
+    transport = httpx.ASGITransport(app=app)
+    # The lifespan creates the schema and starts the background job workers
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/signup", json={"email": EMAIL, "phone": "0800", "password": PASSWORD})
+        for i in range(args.foods):
+            await client.post("/food", json={"name": f"dish {i}", "description": "bench", "price": 10 + i})
+
+        quiet = await read_phase(client, args.reads, args.concurrency)
+
+        storm = asyncio.create_task(login_storm(client, args.logins))
+        await asyncio.sleep(0)
+        loaded = await read_phase(client, args.reads, args.concurrency)
+        login_counts = await storm
+
+    report("/foods quiet", quiet)
+    report("/foods storm", loaded)
+    print("login statuses:", login_counts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--reads", type=int, default=500)
+    parser.add_argument("--foods", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,131 @@
+"""Metrics overhead benchmark.
+
+Splits the cost of METRICS_ENABLED into its two parts and measures each
+A/B in one process, interleaved, since run-to-run noise between processes
+is larger than the overhead itself:
+
+  middleware:    the same requests sent through the full app and straight
+                 to the app below MetricsMiddleware
+  engine events: the same session + query on an instrumented engine and on
+                 a plain one
+
+Per-route overhead is then middleware + queries per request x per-query
+cost, with the query counts read back from the registry.
+
+    python -m benchmarks.metrics_overhead --requests 2000
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+from benchmarks.common import use_scratch_database
+
+ROUTES = (
+    ("GET", "/foods", {}),
+    ("GET", "/cart", {}),  # authenticated as user 1, see main()
+    ("GET", "/users", {"params": {"limit": 20}}),
+)
+
+
+def find_metrics_middleware(app):
+    from app.metrics import MetricsMiddleware
+
+    layer = app.middleware_stack
+    while not isinstance(layer, MetricsMiddleware):
+        layer = layer.app
+    return layer
+
+
+async def middleware_cost(app, requests: int) -> dict:
+    import httpx
+
+    def client_for(asgi_app):
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=asgi_app), base_url="http://bench")
+
+    inner = None
+
+    async def bare_app(scope, receive, send):
+        # Starlette sets scope["app"] on the way in; routes read app.state from it
+        scope["app"] = app
+        await inner(scope, receive, send)
+
+    async with client_for(app) as full:
+        await full.get("/")  # builds the middleware stack
+        inner = find_metrics_middleware(app).app
+        async with client_for(bare_app) as bare:
+            results = {}
+            for method, path, kwargs in ROUTES:
+                samples = {full: [], bare: []}
+                for index in range(requests):
+                    # alternate which side goes first so neither gets a warmer cache
+                    order = (full, bare) if index % 2 else (bare, full)
+                    for client in order:
+                        start = time.perf_counter()
+                        response = await client.request(method, path, **kwargs)
+                        samples[client].append(time.perf_counter() - start)
+                        response.raise_for_status()
+                results[path] = (statistics.median(samples[bare]), statistics.median(samples[full]))
+    return results
+
+
+def query_cost(database_url: str, rounds: int) -> float:
+    from sqlalchemy import create_engine, select
+    from sqlalchemy.orm import Session
+    from app.metrics import instrument_engine
+    from app.models import Food
+
+    plain = create_engine(database_url)
+    instrumented = instrument_engine(create_engine(database_url))
+    statement = select(Food).limit(1)
+
+    timings = {plain: [], instrumented: []}
+    for index in range(rounds):
+        for engine in ((plain, instrumented) if index % 2 else (instrumented, plain)):
+            start = time.perf_counter()
+            for _ in range(50):
+                with Session(engine) as db:
+                    db.execute(statement).all()
+            timings[engine].append((time.perf_counter() - start) / 50)
+
+    return statistics.median(timings[instrumented]) - statistics.median(timings[plain])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    database_url = use_scratch_database(f"sqlite:///{tempfile.mkdtemp(prefix='chuks_bench_')}/metrics.db")
+
+    import os
+    os.environ["METRICS_ENABLED"] = "1"
+
+    from app.main import app
+    from app.database import engine
+    from app.metrics import registry
+    from app.migrations import ensure_schema
+    from benchmarks.seed import seed
+
+    ensure_schema(engine)
+    seed(engine, users=100, foods=100, orders=100)
+
+    ROUTES[1][2]["headers"] = {"Authorization": f"Bearer {app.state.token_signer.issue(1, True)}"}
+
+    routes = asyncio.run(middleware_cost(app, args.requests))
+    per_query = query_cost(database_url, rounds=max(args.requests // 50, 20))
+
+    print(f"engine events: {per_query * 1e6:+.1f}us per query (session checkout + execute)")
+    print(f"{'route':<8} {'bare p50':>10} {'full p50':>10} {'queries':>8} {'overhead':>10}")
+    for method, path, _ in ROUTES:
+        bare, full = routes[path]
+        histogram = registry.queries[(method, path)]
+        queries = histogram.sum / histogram.count
+        overhead = (full - bare) + queries * per_query
+        print(f"{path:<8} {bare * 1e3:>8.3f}ms {full * 1e3:>8.3f}ms {queries:>8.1f} "
+              f"{overhead * 1e6:>+8.0f}us ({overhead / bare:+.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""End-to-end scenario runner.
+
+Drives app.main:app in-process over httpx's ASGI transport. Each virtual
+user logs in, then loops: browse /foods, add dishes with /cart/add, place
+an order with /order/create and pay for it with /pay. Latency is recorded
+per endpoint and written as a JSON baseline; pass --baseline to diff a run
+against an earlier one (exit status 1 when an endpoint regressed).
+
+    python -m benchmarks.seed --database-url sqlite:///./bench.db --users 100000 --foods 5000 --orders 1000000
+    python -m benchmarks.run --database-url sqlite:///./bench.db --output baseline.json
+    python -m benchmarks.run --database-url sqlite:///./bench.db --baseline baseline.json
+
+An empty database is seeded with a small dataset first.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sys
+import time
+from datetime import datetime
+
+import httpx
+
+from benchmarks.common import summarize, use_scratch_database, without_rate_limits
+from benchmarks.seed import BENCH_PASSWORD, bench_email
+
+SMALL_DATASET = {"users": 1_000, "foods": 200, "orders": 5_000}
+ENDPOINTS = ("POST /login", "GET /foods", "POST /cart/add", "POST /order/create", "POST /pay")
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {endpoint: [] for endpoint in ENDPOINTS}
+        self.errors = {endpoint: {} for endpoint in ENDPOINTS}
+
+    async def call(self, endpoint: str, request):
+        start = time.perf_counter()
+        response = await request
+        self.samples[endpoint].append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 400:
+            status = str(response.status_code)
+            self.errors[endpoint][status] = self.errors[endpoint].get(status, 0) + 1
+        return response
+
+
+async def virtual_user(client, recorder: Recorder, user_id: int, food_ids, iterations: int, login_every: int, rng):
+    headers = None
+    for iteration in range(iterations):
+        if headers is None or iteration % login_every == 0:
+            logged_in = await recorder.call("POST /login", client.post(
+                "/login", json={"email": bench_email(user_id), "password": BENCH_PASSWORD}
+            ))
+            if logged_in.status_code == 200:
+                headers = {"Authorization": f"Bearer {logged_in.json()['access_token']}"}
+            if headers is None:
+                continue
+
+        await recorder.call("GET /foods", client.get("/foods"))
+
+        for food_id in rng.sample(food_ids, k=min(3, len(food_ids))):
+            await recorder.call("POST /cart/add", client.post(
+                "/cart/add", json={"food_id": food_id, "quantity": rng.randint(1, 2)}, headers=headers
+            ))
+
+        created = await recorder.call("POST /order/create", client.post("/order/create", headers=headers))
+        if created.status_code != 200:
+            continue
+
+        await recorder.call("POST /pay", client.post("/pay", headers=headers, params={
+            "order_id": created.json()["order_id"], "payment_method": "card",
+        }))
+
+
+def dataset_info(engine):
+    from sqlalchemy import func, select
+    from app.models import Food, Order, User
+
+    with engine.connect() as conn:
+        return {
+            "users": conn.scalar(select(func.count()).select_from(User)),
+            "foods": conn.scalar(select(func.count()).select_from(Food)),
+            "orders": conn.scalar(select(func.count()).select_from(Order)),
+        }
+
+
+def pick_users_and_foods(engine, virtual_users: int, rng):
+    from sqlalchemy import select
+    from app.models import Food, User
+
+    with engine.connect() as conn:
+        food_ids = list(conn.scalars(
+            select(Food.id).where(Food.is_available == True).order_by(Food.id).limit(1000)
+        ))
+        max_user = conn.scalar(select(User.id).order_by(User.id.desc()).limit(1))
+
+    # Distinct users so no two virtual users fight over the same cart
+    user_ids = rng.sample(range(1, max_user + 1), k=min(virtual_users, max_user))
+    return user_ids, food_ids
+
+
+async def run_scenario(args) -> dict:
+    from app.database import engine
+    from app.main import app
+    from app.migrations import ensure_schema
+    from benchmarks.seed import seed
+
+    ensure_schema(engine)
+    if dataset_info(engine)["users"] == 0:
+        print(f"empty database, seeding {SMALL_DATASET}")
+        seed(engine, **SMALL_DATASET)
+
+    rng = random.Random(args.seed)
+    user_ids, food_ids = pick_users_and_foods(engine, args.virtual_users, rng)
+    recorder = Recorder()
+
+    transport = httpx.ASGITransport(app=app)
+    # The lifespan starts the background job workers that send receipts after /pay
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            virtual_user(client, recorder, user_id, food_ids, args.iterations, args.login_every,
+                         random.Random(f"{args.seed}-{user_id}"))
+            for user_id in user_ids
+        ))
+        elapsed = time.perf_counter() - start
+
+    endpoints = {}
+    for endpoint in ENDPOINTS:
+        samples = recorder.samples[endpoint]
+        if samples:
+            endpoints[endpoint] = {**summarize(samples, elapsed), "errors": recorder.errors[endpoint]}
+
+    return {
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "database": engine.dialect.name,
+        "dataset": dataset_info(engine),
+        "scenario": {
+            "virtual_users": len(user_ids),
+            "iterations": args.iterations,
+            "login_every": args.login_every,
+            "seed": args.seed,
+        },
+        "elapsed_s": round(elapsed, 3),
+        "endpoints": endpoints,
+    }
+
+
+def compare(result: dict, baseline: dict, threshold: float) -> list:
+    #An endpoint regressed when its p95 grew, or its throughput fell,
+    #by more than threshold (a fraction) against the baseline
+    regressions = []
+    print(f"\n{'endpoint':<20} {'p95 base':>10} {'p95 now':>10} {'change':>8}  {'rps base':>9} {'rps now':>9}")
+
+    for endpoint, now in result["endpoints"].items():
+        base = baseline.get("endpoints", {}).get(endpoint)
+        if base is None:
+            print(f"{endpoint:<20} {'-':>10} {now['p95_ms']:>10.2f} {'new':>8}")
+            continue
+
+        change = (now["p95_ms"] - base["p95_ms"]) / base["p95_ms"] if base["p95_ms"] else 0.0
+        print(
+            f"{endpoint:<20} {base['p95_ms']:>10.2f} {now['p95_ms']:>10.2f} {change:>+8.1%}  "
+            f"{base['throughput_rps']:>9.1f} {now['throughput_rps']:>9.1f}"
+        )
+
+        if change > threshold:
+            regressions.append(f"{endpoint}: p95 {base['p95_ms']}ms -> {now['p95_ms']}ms")
+        if now["throughput_rps"] < base["throughput_rps"] * (1 - threshold):
+            regressions.append(f"{endpoint}: throughput {base['throughput_rps']} -> {now['throughput_rps']} rps")
+
+    return regressions
+
+
+def print_result(result: dict):
+    print(f"dataset {result['dataset']}, {result['scenario']['virtual_users']} virtual users, "
+          f"{result['elapsed_s']}s")
+    for endpoint, stats in result["endpoints"].items():
+        errors = sum(stats["errors"].values())
+        print(
+            f"{endpoint:<20} n={stats['count']:<6} {stats['throughput_rps']:>8.1f} rps "
+            f"p50={stats['p50_ms']:8.2f}ms p95={stats['p95_ms']:8.2f}ms p99={stats['p99_ms']:8.2f}ms"
+            + (f" errors={stats['errors']}" if errors else "")
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run the end-to-end HTTP benchmark")
+    parser.add_argument("--database-url")
+    parser.add_argument("--virtual-users", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--login-every", type=int, default=10, help="log in again every N iterations")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the result JSON here")
+    parser.add_argument("--baseline", help="compare against an earlier result JSON")
+    parser.add_argument("--threshold", type=float, default=0.20, help="allowed regression, as a fraction")
+    args = parser.parse_args()
+
+    use_scratch_database(args.database_url)
+    without_rate_limits()
+    result = asyncio.run(run_scenario(args))
+    print_result(result)
+
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(result, fh, indent=2)
+        print(f"wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            regressions = compare(result, json.load(fh), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
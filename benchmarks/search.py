@@ -0,0 +1,131 @@
+"""Menu search benchmark.
+
+Fills a scratch database with --dishes generated dishes (names and
+descriptions drawn from a small menu vocabulary, so words repeat the way
+they do on a real menu), then times search_foods for a mix of queries:
+
+  word:        one whole, common word ("rice")
+  prefix:      the first 2-3 letters of a word, as typed ("ji", "pep")
+  two words:   "jollof chi"
+  rare:        a word that appears on few dishes
+  next page:   the second page of a word query, via its cursor
+
+each three ways:
+
+  cold: ranking cache cleared before every query, so each one ranks all
+        its matches with bm25()
+  warm: ranking cached, as for every page after the first and every repeat
+        of a query within RANKING_CACHE_TTL
+  like: the LIKE fallback used on other databases, for comparison
+
+Inserts go through the foods_fts triggers, so the seed time includes
+indexing.
+
+    python -m benchmarks.search --dishes 50000 --queries 200
+"""
+import argparse
+import random
+import time
+
+from benchmarks.common import percentile, use_scratch_database
+
+STYLES = ["Spicy", "Smoky", "Grilled", "Fried", "Peppered", "Creamy", "Crispy", "Native", "Party", "Village"]
+BASES = ["Jollof", "Fried", "Coconut", "Ofada", "Banga", "Egusi", "Ogbono", "Okra", "Efo", "Nsala", "Afang", "Edikang"]
+DISHES = ["Rice", "Soup", "Stew", "Beans", "Yam", "Plantain", "Noodles", "Porridge", "Pepper Soup", "Moi Moi"]
+SIDES = ["Chicken", "Beef", "Goat Meat", "Fish", "Turkey", "Prawns", "Snail", "Ponmo", "Egg", "Suya"]
+NOTES = ["slow cooked", "with fresh peppers", "in palm oil", "with crayfish", "served hot",
+         "with plantain", "mildly spiced", "extra pepper", "with dodo", "family size"]
+
+QUERIES = {
+    "word": ["rice", "soup", "chicken", "spicy", "beef"],
+    "prefix": ["ji", "jo", "pep", "eg", "sn", "gr"],
+    "two words": ["jollof chi", "egusi go", "spicy fi", "pepper soup"],
+    "rare": ["edikang suya", "ofada snail", "nsala prawns"],
+}
+PAGE_SIZE = 20
+
+
+def dish(rng, food_id: int) -> dict:
+    name = f"{rng.choice(STYLES)} {rng.choice(BASES)} {rng.choice(DISHES)} with {rng.choice(SIDES)}"
+    return {
+        "name": f"{name} #{food_id}",  # names are unique
+        "description": f"{rng.choice(NOTES).capitalize()}, {rng.choice(NOTES)}",
+        "price": round(rng.uniform(500, 5000), 2),
+        "stock": 100,
+        "is_available": rng.random() > 0.1,
+    }
+
+
+def seed_dishes(engine, dishes: int, random_seed: int = 42) -> float:
+    from app import models
+
+    rng = random.Random(random_seed)
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        for first in range(1, dishes + 1, 5000):
+            conn.execute(models.Food.__table__.insert(), [
+                dish(rng, food_id) for food_id in range(first, min(first + 5000, dishes + 1))
+            ])
+    return time.perf_counter() - start
+
+
+def time_queries(db, search, queries: int) -> dict:
+    #search(db, q, after) -> (foods, next_cursor)
+    results = {}
+    for kind, texts in list(QUERIES.items()) + [("next page", QUERIES["word"])]:
+        samples = []
+        for i in range(queries):
+            q = texts[i % len(texts)]
+            after = None
+            if kind == "next page":
+                _, after = search(db, q, None)
+            start = time.perf_counter()
+            search(db, q, after)
+            samples.append((time.perf_counter() - start) * 1000)
+            db.rollback()
+        results[kind] = samples
+    return results
+
+
+def report(label: str, results: dict):
+    for kind, samples in results.items():
+        print(f"{label:<5} {kind:<10} p50={percentile(samples, 50):7.2f}ms "
+              f"p95={percentile(samples, 95):7.2f}ms p99={percentile(samples, 99):7.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--dishes", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--skip-like", action="store_true", help="only time the FTS5 paths")
+    args = parser.parse_args()
+
+    use_scratch_database(args.database_url)
+
+    from app.database import engine, SessionLocal
+    from app import migrations
+    from app.search import like_matches, ranking_cache, search_foods, search_page, search_terms
+
+    migrations.ensure_schema(engine)
+    print(f"seeded {args.dishes} dishes (indexed by triggers) in {seed_dishes(engine, args.dishes):.1f}s")
+
+    def cold(db, q, after):
+        ranking_cache.invalidate()
+        return search_foods(db, q, after, PAGE_SIZE)
+
+    def warm(db, q, after):
+        return search_foods(db, q, after, PAGE_SIZE)
+
+    def like(db, q, after):
+        return search_page(db, like_matches(search_terms(q)), after, PAGE_SIZE)
+
+    with SessionLocal() as db:
+        report("cold", time_queries(db, cold, args.queries))
+        report("warm", time_queries(db, warm, args.queries))
+        if not args.skip_like:
+            report("like", time_queries(db, like, max(args.queries // 10, 5)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Synthetic dataset generator.
+
+Bulk-seeds an empty scratch database with users (each with a cart), foods,
+and an order history with order items and payments, using Core executemany
+batches. Every user shares the password BENCH_PASSWORD.
+
+    python -m benchmarks.seed --database-url sqlite:///./bench.db \\
+        --users 100000 --foods 5000 --orders 1000000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import use_scratch_database
+
+BENCH_PASSWORD = "bench-password"
+BATCH_SIZE = 10_000
+BENCH_STOCK = 10 ** 9  # effectively unlimited so runs never fail on stock
+
+
+def bench_email(user_id: int) -> str:
+    return f"bench{user_id}@example.com"
+
+
+def _batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert(conn, table, rows) -> int:
+    count = 0
+    for batch in _batches(rows):
+        conn.execute(table.insert(), batch)
+        count += len(batch)
+    return count
+
+
+def seed(engine, users: int, foods: int, orders: int, items_per_order: int = 3, random_seed: int = 42) -> dict:
+    from app import models
+    from app.utils.security import hash_password
+
+    rng = random.Random(random_seed)
+    password_hash = hash_password(BENCH_PASSWORD)
+    now = datetime.utcnow()
+
+    with engine.connect() as conn:
+        if conn.execute(models.User.__table__.select().limit(1)).first():
+            raise SystemExit("refusing to seed: database already has users")
+
+    # A fresh database hands out ids 1..n in insert order, which the
+    # order/item/payment rows below rely on
+    prices = [round(rng.uniform(500, 5000), 2) for _ in range(foods)]
+
+    def order_rows():
+        for order_id in range(1, orders + 1):
+            lines = [
+                (rng.randint(1, foods), rng.randint(1, 3))
+                for _ in range(rng.randint(1, items_per_order * 2 - 1))
+            ]
+            status = rng.choices(("paid", "cancelled"), weights=(85, 15))[0]
+            yield order_id, rng.randint(1, users), status, lines
+
+    counts = {}
+    with engine.begin() as conn:
+        counts["users"] = _insert(conn, models.User.__table__, (
+            {
+                "email": bench_email(user_id),
+                "phone": f"bench-{user_id}",
+                "hashed_password": password_hash,
+                "is_verified": True,
+                "created_at": now,
+            }
+            for user_id in range(1, users + 1)
+        ))
+        counts["carts"] = _insert(conn, models.Cart.__table__, (
+            {"user_id": user_id, "is_active": True} for user_id in range(1, users + 1)
+        ))
+        counts["foods"] = _insert(conn, models.Food.__table__, (
+            {
+                "name": f"Dish {food_id}",
+                "description": f"Synthetic dish number {food_id}",
+                "price": prices[food_id - 1],
+                "is_available": True,
+                "created_at": now,
+                "stock": BENCH_STOCK,
+            }
+            for food_id in range(1, foods + 1)
+        ))
+
+        counts.update(orders=0, order_items=0, payments=0)
+        order_batch, item_batch, payment_batch = [], [], []
+
+        def flush():
+            conn.execute(models.Order.__table__.insert(), order_batch)
+            conn.execute(models.OrderItem.__table__.insert(), item_batch)
+            if payment_batch:
+                conn.execute(models.Payment.__table__.insert(), payment_batch)
+            counts["orders"] += len(order_batch)
+            counts["order_items"] += len(item_batch)
+            counts["payments"] += len(payment_batch)
+            order_batch.clear(), item_batch.clear(), payment_batch.clear()
+
+        for order_id, user_id, status, lines in order_rows():
+            total = 0.0
+            for food_id, quantity in lines:
+                price = prices[food_id - 1]
+                total += price * quantity
+                item_batch.append({
+                    "order_id": order_id, "food_id": food_id,
+                    "quantity": quantity, "price_at_purchase": price,
+                })
+
+            # one order a minute, the newest just now
+            created_at = now - timedelta(minutes=orders - order_id)
+            order_batch.append({
+                "id": order_id, "user_id": user_id, "total_price": total,
+                "status": status, "created_at": created_at,
+            })
+
+            if status == "paid":
+                payment_batch.append({
+                    "order_id": order_id, "user_id": user_id, "payment_method": "card",
+                    "transaction_ref": f"bench-{order_id}", "amount": total, "status": "success",
+                    "created_at": created_at,
+                })
+
+            if len(order_batch) == BATCH_SIZE:
+                flush()
+
+        if order_batch:
+            flush()
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a scratch database for benchmarks")
+    parser.add_argument("--database-url")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--foods", type=int, default=5_000)
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    parser.add_argument("--items-per-order", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    database_url = use_scratch_database(args.database_url)
+
+    from app.database import engine
+    from app import migrations
+
+    migrations.ensure_schema(engine)
+
+    start = time.perf_counter()
+    counts = seed(engine, args.users, args.foods, args.orders, args.items_per_order, args.seed)
+    elapsed = time.perf_counter() - start
+
+    print(f"seeded {database_url} in {elapsed:.1f}s")
+    for table, count in counts.items():
+        print(f"  {table:<12} {count:>10,}")
+
+
+if __name__ == "__main__":
+    main()
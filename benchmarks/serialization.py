@@ -0,0 +1,157 @@
+"""Response serialization benchmark.
+
+Measures what FastAPI spends turning a route's return value into response
+bytes, per response, for a 50-item cart (GET /cart) and a 2,000-dish menu
+(GET /foods), four ways:
+
+  dict + JSONResponse:   hand-built dicts, no response_model (how /cart
+                         worked before): jsonable_encoder, then json.dumps
+  dict + orjson:         the same dicts with ORJSON_RESPONSES=1
+  typed:                 response schema built with model_validate from the
+                         ORM objects, response_model set: FastAPI validates
+                         it and pydantic-core writes the JSON bytes
+  typed + orjson:        the same with ORJSON_RESPONSES=1, which makes
+                         FastAPI dump the model to Python objects for render()
+
+Building the payload (the dicts, or model_validate) is included, the
+database is not: the ORM objects are built in memory. Serialization goes
+through fastapi.routing.serialize_response with each route's real response
+field, as in a request.
+
+    python -m benchmarks.serialization --repeat 200
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from benchmarks.common import use_scratch_database
+
+CART_ITEMS = 50
+MENU_DISHES = 2_000
+
+
+def build_menu(dishes: int):
+    from app.models import Food
+
+    return [
+        Food(id=food_id, name=f"Dish {food_id}", description=f"Dish number {food_id}, served hot",
+             price=500 + food_id * 1.25, stock=100, is_available=True)
+        for food_id in range(1, dishes + 1)
+    ]
+
+
+def build_cart(menu, items: int):
+    from app.models import Cart, CartItem
+
+    cart_items = [CartItem(food_id=food.id, food=food, quantity=1 + i % 3) for i, food in enumerate(menu[:items])]
+    return Cart(
+        id=1, user_id=1, items=cart_items,
+        item_count=sum(item.quantity for item in cart_items),
+        total=sum(item.quantity * item.food.price for item in cart_items),
+    )
+
+
+def legacy_cart(cart) -> dict:
+    #GET /cart's hand-built dicts, as before the response schemas
+    items_response = []
+    for item in cart.items:
+        items_response.append({
+            "food_name": item.food.name,
+            "price": item.food.price,
+            "quantity": item.quantity,
+            "subtotal": item.food.price * item.quantity
+        })
+    return {"items": items_response, "item_count": cart.item_count, "total": cart.total}
+
+
+def legacy_menu(menu) -> list:
+    return [
+        {"id": food.id, "name": food.name, "description": food.description,
+         "price": food.price, "is_available": food.is_available}
+        for food in menu
+    ]
+
+
+def response_field(router, path: str):
+    return next(route.response_field for route in router.routes if route.path == path)
+
+
+async def render(field, content, response_class) -> bytes:
+    #The serialization step of fastapi.routing.get_request_handler
+    from fastapi import Response
+    from fastapi.routing import serialize_response
+
+    if field is not None and response_class is None:
+        body = await serialize_response(field=field, response_content=content, dump_json=True)
+        return Response(content=body, media_type="application/json").body
+    body = await serialize_response(field=field, response_content=content)
+    return response_class(body).body
+
+
+async def time_case(build, field, response_class, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = await render(field, build(), response_class)
+        samples.append((time.perf_counter() - start) * 1_000_000)
+    return statistics.median(samples), body
+
+
+async def run(repeat: int):
+    from fastapi.responses import JSONResponse
+
+    from app import schemas
+    from app.responses import ORJSONResponse
+    from app.routes.auth import router
+
+    menu = build_menu(MENU_DISHES)
+    cart = build_cart(menu, CART_ITEMS)
+
+    payloads = {
+        f"{CART_ITEMS}-item cart": (
+            lambda: legacy_cart(cart),
+            lambda: schemas.CartResponse.model_validate(cart),
+            response_field(router, "/cart"),
+        ),
+        f"{MENU_DISHES}-dish menu": (
+            lambda: legacy_menu(menu),
+            lambda: menu,  # the route returns the ORM rows, FastAPI validates them
+            response_field(router, "/foods"),
+        ),
+    }
+
+    for label, (legacy, typed, field) in payloads.items():
+        cases = {
+            "dict + JSONResponse": (legacy, None, JSONResponse),
+            "dict + orjson": (legacy, None, ORJSONResponse),
+            "typed": (typed, field, None),
+            "typed + orjson": (typed, field, ORJSONResponse),
+        }
+        baseline = None
+        expected = None
+        for name, (build, case_field, response_class) in cases.items():
+            median_us, body = await time_case(build, case_field, response_class, repeat)
+            # Every path must produce the same document
+            document = json.loads(body)
+            if expected is None:
+                expected = document
+            assert document == expected, f"{label}: {name} differs"
+            baseline = baseline or median_us
+            print(f"{label:<16} {name:<20} {median_us:9.1f}us/response  "
+                  f"{baseline / median_us:5.2f}x  {len(body):>7} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    # Nothing here connects, but keep the real database out of reach
+    use_scratch_database()
+    asyncio.run(run(args.repeat))
+
+
+if __name__ == "__main__":
+    main()
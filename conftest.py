@@ -0,0 +1,11 @@
+import os
+import tempfile
+
+#Test setup, applied before anything imports the app. Tests build their own
+#app and database (tests/conftest.py); the global settings still point at a
+#scratch file so nothing can reach the local chuks_database.db.
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='chuks_test_')}/global.db"
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+# Query budgets, stub transport and the sent_messages fixture
+pytest_plugins = ["app.pytest_plugin"]
@@ -0,0 +1,96 @@
+import itertools
+from dataclasses import replace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+
+from app import database
+from app.cache import menu_cache
+from app.config import settings as default_settings
+from app.main import create_app
+from app.models import Food
+from app.search import ranking_cache
+
+#Every test gets its own app (create_app) on a fresh SQLite file, once per
+#DB_MODE: sync sessions in the threadpool and async sessions on aiosqlite.
+#Background job workers and the order sweeper are off: tests run jobs with
+#sent_messages(app) and sweeps by calling sweep().
+
+_dish_numbers = itertools.count(1)  # dish names are unique
+
+
+@pytest.fixture(params=["sync", "async"])
+def db_mode(request):
+    return request.param
+
+
+@pytest.fixture
+def settings(tmp_path, db_mode):
+    return replace(
+        default_settings,
+        database_url=f"sqlite:///{tmp_path}/test.db",
+        db_mode=db_mode,
+        job_workers=0,
+        order_sweep_interval_seconds=0,
+        rate_limit_enabled=False,
+        notify_transport="stub",
+        db_diagnostics=True,
+    )
+
+
+@pytest.fixture
+def app(settings):
+    # The menu and search caches are process-wide; don't serve another test's menu
+    menu_cache.invalidate()
+    ranking_cache.invalidate()
+    return create_app(settings)
+
+
+@pytest.fixture
+def client(app):
+    with TestClient(app) as client:
+        yield client
+    database.get_engine().dispose()
+
+
+@pytest.fixture
+def make_user(client, app, sent_messages):
+    #Signs up and verifies a user; returns its Authorization header
+    def make(email="diner@example.com", password="secret-password"):
+        response = client.post("/signup", json={"email": email, "phone": email, "password": password})
+        assert response.status_code == 200, response.text
+        otp = [message for message in sent_messages(app) if message.to == email][-1].body.split()[-1]
+        response = client.post("/verify", json={"email": email, "otp": otp})
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+    return make
+
+
+@pytest.fixture
+def make_foods(client):
+    #Creates count dishes through POST /food; returns their ids
+    def make(count=1, price=100.0, stock=20):
+        ids = []
+        for _ in range(count):
+            response = client.post("/food", json={
+                "name": f"Dish {next(_dish_numbers)}", "description": "test dish", "price": price,
+            })
+            assert response.status_code == 200, response.text
+            ids.append(response.json()["id"])
+        if stock != 20:  # the column default
+            with database.SessionLocal() as db:
+                db.execute(update(Food).where(Food.id.in_(ids)).values(stock=stock))
+                db.commit()
+        return ids
+    return make
+
+
+@pytest.fixture
+def fill_cart(client):
+    #Adds quantity of every food to the cart of the user behind headers
+    def fill(headers, food_ids, quantity=1):
+        for food_id in food_ids:
+            response = client.post("/cart/add", json={"food_id": food_id, "quantity": quantity}, headers=headers)
+            assert response.status_code == 200, response.text
+    return fill
@@ -0,0 +1,169 @@
+from sqlalchemy import event, select
+
+from app import database, schemas
+from app.models import Cart, CartItem, Food, User
+from app.routes.auth import _add_to_cart, _cart_batch
+
+
+def batch(client, headers, *operations):
+    response = client.post("/cart/batch", headers=headers, json={"operations": [
+        {"op": op, "food_id": food_id, "quantity": quantity} for op, food_id, quantity in operations
+    ]})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def cart_lines(client, headers):
+    #({food_id: quantity}, item_count, total) as GET /cart shows it
+    cart = client.get("/cart", headers=headers).json()
+    with database.SessionLocal() as db:
+        ids = dict(db.execute(select(Food.name, Food.id)).all())
+    return {ids[item["food_name"]]: item["quantity"] for item in cart["items"]}, cart["item_count"], cart["total"]
+
+
+def stored_totals(email):
+    with database.SessionLocal() as db:
+        return tuple(db.execute(
+            select(Cart.item_count, Cart.total).join(User, User.id == Cart.user_id).where(User.email == email)
+        ).one())
+
+
+def test_batch_reports_bad_lines_and_applies_the_rest(client, make_user, make_foods, fill_cart):
+    diner = make_user()
+    pie, soup, rice = make_foods(3, price=10.0)
+    fill_cart(diner, [soup])
+
+    result = batch(client, diner,
+                   ("add", pie, 2),
+                   ("add", 999_999, 1),
+                   ("update", rice, 4),
+                   ("remove", rice, 1),
+                   ("add", pie, 0),
+                   ("update", soup, 3))
+
+    assert (result["applied"], result["errors"]) == (2, 4)
+    assert [(line["line"], line["status"], line.get("detail", line.get("quantity"))) for line in result["lines"]] == [
+        (1, "ok", 2),
+        (2, "error", "Food not found"),
+        (3, "error", "Item not found"),
+        (4, "error", "Item not in cart"),
+        (5, "error", "Quantity must be greater than zero"),
+        (6, "ok", 3),
+    ]
+    assert cart_lines(client, diner) == ({pie: 2, soup: 3}, 5, 50.0)
+
+
+def test_add_after_remove_of_the_same_food(client, make_user, make_foods, fill_cart):
+    diner = make_user()
+    pie, soup = make_foods(2, price=10.0)
+    fill_cart(diner, [pie, soup], quantity=3)
+
+    result = batch(client, diner, ("remove", pie, 1), ("add", pie, 1), ("remove", soup, 1))
+
+    assert [line["status"] for line in result["lines"]] == ["ok", "ok", "ok"]
+    assert [line["quantity"] for line in result["lines"]] == [None, 1, None]
+    assert cart_lines(client, diner) == ({pie: 1}, 1, 10.0)
+
+
+def test_stock_is_checked_against_the_running_quantity(client, make_user, make_foods, fill_cart):
+    diner = make_user()
+    pie = make_foods(1, price=10.0, stock=5)[0]
+    fill_cart(diner, [pie], quantity=2)
+
+    result = batch(client, diner, ("add", pie, 2), ("add", pie, 2), ("update", pie, 5), ("add", pie, 1))
+
+    assert [(line["status"], line.get("detail")) for line in result["lines"]] == [
+        ("ok", None),
+        ("error", "Not enough stock available"),  # 2 + 2 + 2 > 5
+        ("ok", None),
+        ("error", "Not enough stock available"),  # 5 + 1 > 5
+    ]
+    assert cart_lines(client, diner) == ({pie: 5}, 5, 50.0)
+
+
+def test_batch_moves_the_cart_totals_by_the_net_change(client, make_user, make_foods, fill_cart):
+    diner = make_user()
+    cheap, dear, other = make_foods(3, price=4.0)
+    with database.SessionLocal() as db:
+        db.get(Food, dear).price = 25.0
+        db.commit()
+    fill_cart(diner, [cheap, dear], quantity=2)  # 2 x 4 + 2 x 25
+    assert stored_totals("diner@example.com") == (4, 58.0)
+
+    batch(client, diner, ("update", cheap, 5), ("remove", dear, 1), ("add", other, 3), ("add", cheap, 1))
+
+    # 6 x 4 + 3 x 4
+    assert stored_totals("diner@example.com") == (9, 36.0)
+    assert cart_lines(client, diner) == ({cheap: 6, other: 3}, 9, 36.0)
+
+
+def user_id_of(email):
+    with database.SessionLocal() as db:
+        return db.execute(select(User.id).where(User.email == email)).scalar_one()
+
+
+def interfere_once(session, event_name, other_write, when=lambda *args: True):
+    #Runs other_write on its own session (a concurrent request) the first
+    #time event_name fires on session with when(*event args) true
+    done = []
+
+    def hook(*args):
+        if not done and when(*args):
+            done.append(True)
+            with database.SessionLocal() as other:
+                other_write(other)
+
+    event.listen(session, event_name, hook)
+
+
+def test_add_retries_after_losing_the_insert_race(client, make_user, make_foods, fill_cart):
+    diner = make_user()
+    pie, soup = make_foods(2, price=10.0)
+    fill_cart(diner, [pie])  # the cart exists, soup has no line yet
+    user_id = user_id_of("diner@example.com")
+
+    with database.SessionLocal() as db:
+        interfere_once(db, "before_flush",
+                       lambda other: _add_to_cart(other, user_id, schemas.cartAdd(food_id=soup, quantity=1)))
+        assert _add_to_cart(db, user_id, schemas.cartAdd(food_id=soup, quantity=2)) == {"message": "Item added to cart"}
+
+    assert cart_lines(client, diner) == ({pie: 1, soup: 3}, 4, 40.0)
+    assert stored_totals("diner@example.com") == (4, 40.0)
+
+
+def test_batch_retries_after_losing_the_insert_race(client, make_user, make_foods, fill_cart):
+    diner = make_user()
+    pie, soup = make_foods(2, price=10.0)
+    fill_cart(diner, [pie])
+    user_id = user_id_of("diner@example.com")
+
+    with database.SessionLocal() as db:
+        # Right before our INSERT of the new line, after we read the cart
+        interfere_once(db, "do_orm_execute",
+                       lambda other: _add_to_cart(other, user_id, schemas.cartAdd(food_id=soup, quantity=1)),
+                       when=lambda state: state.is_insert)
+        result = _cart_batch(db, user_id, schemas.CartBatch(operations=[
+            schemas.CartOperation(op="add", food_id=soup, quantity=2),
+        ]))
+
+    assert result["applied"] == 1
+    assert result["lines"][0]["quantity"] == 3
+    assert cart_lines(client, diner) == ({pie: 1, soup: 3}, 4, 40.0)
+    with database.SessionLocal() as db:
+        assert db.execute(select(CartItem.quantity).where(CartItem.food_id == soup)).scalars().all() == [3]
+
+
+def test_batch_remove_of_a_deleted_food_rebuilds_the_totals(client, make_user, make_foods, fill_cart, caplog):
+    diner = make_user()
+    pie, soup = make_foods(2, price=10.0)
+    fill_cart(diner, [pie], quantity=2)
+    fill_cart(diner, [soup], quantity=1)
+    with database.SessionLocal() as db:
+        db.delete(db.get(Food, soup))
+        db.commit()
+
+    result = batch(client, diner, ("remove", soup, 1))
+
+    assert result["lines"][0]["status"] == "ok"
+    assert stored_totals("diner@example.com") == (2, 20.0)
+    assert "not found, recomputing cart totals" in caplog.text
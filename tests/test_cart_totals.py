@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+
+from sqlalchemy import event, update
+
+from app import database
+from app.cart_totals import reconcile_cart_totals
+from app.models import Cart
+
+
+def corrupt_totals():
+    with database.SessionLocal() as db:
+        db.execute(update(Cart).values(item_count=99, total=1.0))
+        db.commit()
+
+
+def all_totals():
+    with database.SessionLocal() as db:
+        return db.query(Cart.item_count, Cart.total).order_by(Cart.id).all()
+
+
+def carts_of_three(make_user, make_foods, fill_cart):
+    pie, soup = make_foods(2, price=10.0)
+    for n in range(3):
+        fill_cart(make_user(f"diner{n}@example.com"), [pie, soup], quantity=n + 1)
+    return [(2, 20.0), (4, 40.0), (6, 60.0)]
+
+
+def test_reconcile_repairs_drifted_carts_in_batches(client, make_user, make_foods, fill_cart):
+    expected = carts_of_three(make_user, make_foods, fill_cart)
+    corrupt_totals()
+
+    statements = []
+    engine = database.get_engine()
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        with database.SessionLocal() as db:
+            result = reconcile_cart_totals(db, batch_size=2)
+            db.commit()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert result == {"checked": 3, "repaired": 3}
+    assert all_totals() == expected
+    # One repair UPDATE per batch of two carts
+    assert len([s for s in statements if s.startswith("UPDATE carts")]) == 2
+
+    with database.SessionLocal() as db:
+        assert reconcile_cart_totals(db) == {"checked": 3, "repaired": 0}
+
+
+def test_reconcile_leaves_carts_that_match(client, make_user, make_foods, fill_cart):
+    expected = carts_of_three(make_user, make_foods, fill_cart)
+    with database.SessionLocal() as db:
+        db.execute(update(Cart).where(Cart.id == 2).values(total=0))
+        db.commit()
+        assert reconcile_cart_totals(db, batch_size=1) == {"checked": 3, "repaired": 1}
+        db.commit()
+
+    assert all_totals() == expected
+
+
+def test_cart_totals_command(client, settings, make_user, make_foods, fill_cart):
+    expected = carts_of_three(make_user, make_foods, fill_cart)
+    corrupt_totals()
+
+    result = subprocess.run(
+        [sys.executable, "-m", "app.cart_totals"],
+        env={**os.environ, "DATABASE_URL": settings.database_url},
+        capture_output=True, text=True, check=True,
+    )
+
+    assert result.stdout.strip() == "checked 3 carts, repaired 3"
+    assert all_totals() == expected
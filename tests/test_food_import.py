@@ -0,0 +1,24 @@
+def test_import_rejects_a_body_that_is_not_utf8(client):
+    body = "name,description,price\nJollof,rice,10\nDodo,plantain,5\n".encode("utf-8")
+    body = body.replace(b"Dodo", b"Dod\xf3")  # latin-1 accent
+
+    response = client.post("/food/import", content=body, headers={"Content-Type": "text/csv"})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Upload must be UTF-8 encoded (invalid byte at offset 41)"
+    assert client.get("/foods").json() == []
+
+
+def test_import_accepts_utf8_with_a_bom(client):
+    body = "\ufeffname,description,price\nDodo,fried plantain,5\n".encode("utf-8")
+
+    response = client.post("/food/import", content=body, headers={"Content-Type": "text/csv"})
+
+    assert response.status_code == 200, response.text
+    assert [food["name"] for food in client.get("/foods").json()] == ["Dodo"]
+
+
+def test_import_rejects_other_media_types_before_reading_them(client):
+    response = client.post("/food/import", content=b"\xff\xfe", headers={"Content-Type": "application/pdf"})
+
+    assert response.status_code == 415
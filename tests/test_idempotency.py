@@ -0,0 +1,148 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+from fastapi import Response
+from sqlalchemy import func, select, update
+
+from app import database
+from app.database import SyncSessionRunner
+from app.idempotency import (IdempotencyCache, IdempotentRequest, REPLAYED_HEADER, purge_expired,
+                             remember, run_idempotent)
+from app.models import IdempotencyRecord, Order
+
+
+def with_key(headers, key):
+    return {**headers, "Idempotency-Key": key}
+
+
+def count_orders():
+    with database.SessionLocal() as db:
+        return db.execute(select(func.count()).select_from(Order)).scalar()
+
+
+def test_retry_replays_the_first_result(client, make_user, make_foods, fill_cart):
+    diner = make_user()
+    fill_cart(diner, make_foods(1))
+
+    first = client.post("/order/create", headers=with_key(diner, "order-1"))
+    retry = client.post("/order/create", headers=with_key(diner, "order-1"))
+
+    assert first.status_code == retry.status_code == 200
+    assert REPLAYED_HEADER not in first.headers
+    assert retry.headers[REPLAYED_HEADER] == "true"
+    assert retry.json() == first.json()
+    assert count_orders() == 1
+
+
+def test_reusing_a_key_with_other_parameters_is_a_422(client, make_user, make_foods, fill_cart):
+    diner = make_user()
+    fill_cart(diner, make_foods(1))
+    order_id = client.post("/order/create", headers=diner).json()["order_id"]
+
+    paid = client.post("/pay", params={"order_id": order_id, "payment_method": "card"},
+                       headers=with_key(diner, "pay-1"))
+    other = client.post("/pay", params={"order_id": order_id, "payment_method": "transfer"},
+                        headers=with_key(diner, "pay-1"))
+
+    assert paid.status_code == 200
+    assert other.status_code == 422
+    assert other.json()["detail"] == "Idempotency-Key was already used with different parameters"
+
+
+def test_stored_result_is_replayed_after_the_memory_cache_forgets_it(client, app, make_user, make_foods,
+                                                                     fill_cart, query_reports):
+    diner = make_user()
+    fill_cart(diner, make_foods(1))
+    first = client.post("/order/create", headers=with_key(diner, "order-1"))
+
+    # A restart, or another process: only the idempotency_keys table knows the key
+    app.state.idempotency_cache = IdempotencyCache(10, 600, 86400)
+    query_reports.clear()
+    retry = client.post("/order/create", headers=with_key(diner, "order-1"))
+
+    assert retry.headers[REPLAYED_HEADER] == "true"
+    assert retry.json() == first.json()
+    assert query_reports[-1].queries == 1  # the key lookup only
+    assert count_orders() == 1
+
+
+def test_stored_results_expire_with_the_apps_ttl(client, app, make_user, make_foods, fill_cart):
+    diner = make_user()
+    fill_cart(diner, make_foods(1))
+    client.post("/order/create", headers=with_key(diner, "order-1"))
+    with database.SessionLocal() as db:
+        db.execute(update(IdempotencyRecord).values(created_at=datetime.utcnow() - timedelta(seconds=120)))
+        db.commit()
+
+    app.state.idempotency_cache = IdempotencyCache(10, 600, stored_ttl=60)
+    retry = client.post("/order/create", headers=with_key(diner, "order-1"))
+    # Expired: the key runs again, and finds the first order still pending
+    assert retry.status_code == 400
+    assert REPLAYED_HEADER not in retry.headers
+
+    with database.SessionLocal() as db:
+        assert purge_expired(db, ttl_seconds=60) == 1
+
+
+def run_keyed(cache, request, fn):
+    #run_idempotent on its own session, as a route would; returns (body, response)
+    async def call():
+        with database.SessionLocal() as db:
+            response = Response()
+            body = await run_idempotent(SyncSessionRunner(db), cache, request, response, fn)
+            return body, response
+    return call()
+
+
+def test_duplicate_in_flight_waits_for_the_first(client):
+    cache = IdempotencyCache(10, 600, 86400)
+    request = IdempotentRequest(1, "/test", "key-1", "fingerprint")
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow(db, idempotent):
+        calls.append(idempotent.key)
+        started.set()
+        release.wait(5)
+        body = {"result": len(calls)}
+        remember(db, idempotent, body)
+        db.commit()
+        return body
+
+    async def both():
+        first = asyncio.ensure_future(run_keyed(cache, request, slow))
+        await asyncio.to_thread(started.wait, 5)
+        second = asyncio.ensure_future(run_keyed(cache, request, slow))
+        await asyncio.sleep(0.05)
+        assert not second.done()  # waiting on the first, not running again
+        release.set()
+        return await first, await second
+
+    (first_body, first_response), (second_body, second_response) = asyncio.run(both())
+
+    assert calls == ["key-1"]
+    assert first_body == second_body == {"result": 1}
+    assert REPLAYED_HEADER not in first_response.headers
+    assert second_response.headers[REPLAYED_HEADER] == "true"
+
+
+def test_key_stored_first_by_another_process_wins(client):
+    cache = IdempotencyCache(10, 600, 86400)
+    request = IdempotentRequest(1, "/test", "key-1", "fingerprint")
+
+    def raced(db, idempotent):
+        # Another process finishes the same key between our lookup and our insert
+        with database.SessionLocal() as other:
+            remember(other, idempotent, {"result": "theirs"})
+            other.commit()
+        remember(db, idempotent, {"result": "ours"})
+        db.commit()
+        return {"result": "ours"}
+
+    body, response = asyncio.run(run_keyed(cache, request, raced))
+
+    assert body == {"result": "theirs"}
+    assert response.headers[REPLAYED_HEADER] == "true"
+    with database.SessionLocal() as db:
+        assert db.execute(select(func.count()).select_from(IdempotencyRecord)).scalar() == 1
@@ -0,0 +1,78 @@
+from app.cache import menu_cache
+
+
+def menu(client, etag=None):
+    headers = {"If-None-Match": etag} if etag else {}
+    return client.get("/foods", headers=headers)
+
+
+def menu_queries(query_reports):
+    #Queries run by each GET /foods so far
+    return [report.queries for report in query_reports if (report.method, report.route) == ("GET", "/foods")]
+
+
+def test_unchanged_menu_is_304(client, make_foods):
+    make_foods(2)
+    first = menu(client)
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and len(first.json()) == 2
+
+    for if_none_match in [etag, f"W/{etag}", f'"other", {etag}', "*"]:
+        response = menu(client, if_none_match)
+        assert response.status_code == 304, if_none_match
+        assert response.content == b""
+        assert response.headers["ETag"] == etag
+
+    assert menu(client, '"other"').status_code == 200
+
+
+def test_etag_changes_after_create_food(client, make_foods):
+    make_foods(1)
+    etag = menu(client).headers["ETag"]
+
+    make_foods(1)
+
+    response = menu(client, etag)
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert len(response.json()) == 2
+
+
+def test_etag_changes_after_import(client, make_foods):
+    make_foods(1)
+    etag = menu(client).headers["ETag"]
+
+    # Repricing an existing dish changes the menu as much as a new one
+    body = "name,description,price\nJollof,rice,10\n"
+    assert client.post("/food/import", content=body, headers={"Content-Type": "text/csv"}).status_code == 200
+    response = menu(client, etag)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    body = "name,description,price\nJollof,rice,12\n"
+    response = client.post("/food/import", params={"mode": "upsert"}, content=body, headers={"Content-Type": "text/csv"})
+    assert response.status_code == 200, response.text
+    response = menu(client, etag)
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert [food["price"] for food in response.json() if food["name"] == "Jollof"] == [12.0]
+
+
+def test_pay_drops_the_cached_menu(client, make_user, make_foods, fill_cart, query_reports):
+    diner = make_user()
+    food_ids = make_foods(2, stock=5)
+    etag = menu(client).headers["ETag"]
+    assert menu(client, etag).status_code == 304
+    assert menu_queries(query_reports) == [1, 0]  # the second is served from the cache
+
+    fill_cart(diner, food_ids, quantity=2)
+    order_id = client.post("/order/create", headers=diner).json()["order_id"]
+    assert client.post("/pay", params={"order_id": order_id, "payment_method": "card"}, headers=diner).status_code == 200
+    assert menu_cache.get() is None
+
+    # The menu is read again after the stock change. It does not list stock,
+    # so the body and its ETag are the same and the client's copy stays valid
+    response = menu(client, etag)
+    assert menu_queries(query_reports)[-1] == 1
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
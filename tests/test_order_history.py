@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from app import database
+from app.models import Order
+from app.pagination import NEXT_CURSOR_HEADER, encode_time_cursor
+
+NOON = datetime(2026, 1, 5, 12, 0)
+
+
+@pytest.fixture
+def place_orders(client, make_foods, fill_cart):
+    #Creates count cancelled orders for headers (one pending order at a time
+    #is allowed); returns their ids, oldest first
+    food_id, = make_foods(1, stock=1000)
+
+    def place(headers, count):
+        ids = []
+        for _ in range(count):
+            fill_cart(headers, [food_id])
+            response = client.post("/order/create", headers=headers)
+            assert response.status_code == 200, response.text
+            ids.append(response.json()["order_id"])
+            response = client.post("/order/cancel", params={"order_id": ids[-1]}, headers=headers)
+            assert response.status_code == 200, response.text
+        return ids
+    return place
+
+
+def set_orders(ids, **values):
+    with database.SessionLocal() as db:
+        db.execute(update(Order).where(Order.id.in_(ids)).values(**values))
+        db.commit()
+
+
+def walk(client, headers, limit, **params):
+    #Follows X-Next-Cursor; returns each page's order ids
+    pages, after = [], None
+    while True:
+        query = {"limit": limit, **params, **({"after": after} if after else {})}
+        response = client.get("/orders", params=query, headers=headers)
+        assert response.status_code == 200, response.text
+        pages.append([order["order_id"] for order in response.json()])
+        after = response.headers.get(NEXT_CURSOR_HEADER)
+        if after is None:
+            return pages
+
+
+def test_orders_with_one_timestamp_page_by_id(client, make_user, place_orders):
+    diner = make_user()
+    ids = place_orders(diner, 5)
+    set_orders(ids, created_at=NOON)
+
+    pages = walk(client, diner, limit=2)
+
+    # Newest first; equal times fall back to id, nothing repeated or skipped
+    assert pages == [[ids[4], ids[3]], [ids[2], ids[1]], [ids[0]]]
+
+
+def test_page_boundary_inside_a_run_of_equal_timestamps(client, make_user, place_orders):
+    diner = make_user()
+    ids = place_orders(diner, 5)
+    set_orders(ids[:2], created_at=NOON - timedelta(hours=1))
+    set_orders(ids[2:], created_at=NOON)
+
+    pages = walk(client, diner, limit=2)
+
+    assert [order_id for page in pages for order_id in page] == ids[::-1]
+    assert [len(page) for page in pages] == [2, 2, 1]
+
+
+def test_cursor_resumes_after_the_order_it_names(client, make_user, place_orders):
+    diner = make_user()
+    ids = place_orders(diner, 4)
+    set_orders(ids, created_at=NOON)
+
+    response = client.get("/orders", params={"after": encode_time_cursor(NOON, ids[2])}, headers=diner)
+
+    assert [order["order_id"] for order in response.json()] == [ids[1], ids[0]]
+
+
+def test_status_filter(client, make_user, place_orders):
+    diner = make_user()
+    ids = place_orders(diner, 5)
+    set_orders(ids, created_at=NOON)
+    set_orders([ids[0], ids[3]], status="paid")
+    set_orders([ids[2], ids[4]], status="pending")
+
+    assert walk(client, diner, limit=1, status="paid") == [[ids[3]], [ids[0]]]
+    assert walk(client, diner, limit=10, status="cancelled") == [[ids[1]]]
+    assert walk(client, diner, limit=10, status="pending") == [[ids[4], ids[2]]]
+    history = client.get("/orders", params={"status": "paid"}, headers=diner).json()
+    assert {order["status"] for order in history} == {"paid"}
+
+    response = client.get("/orders", params={"status": "shipped"}, headers=diner)
+    assert response.status_code == 422
+
+
+def test_only_the_callers_orders(client, make_user, place_orders):
+    diner = make_user()
+    other = make_user("other@example.com")
+    mine = place_orders(diner, 2)
+    place_orders(other, 2)
+
+    assert walk(client, diner, limit=10) == [mine[::-1]]
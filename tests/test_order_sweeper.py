@@ -0,0 +1,46 @@
+from sqlalchemy import select
+
+from app import database
+from app.models import Food, Order
+from app.order_sweeper import sweep
+
+
+def stock_of(food_ids):
+    with database.SessionLocal() as db:
+        return dict(db.execute(select(Food.id, Food.stock).where(Food.id.in_(food_ids))).all())
+
+
+def test_sweep_cancels_stale_pending_orders_without_touching_stock(client, make_user, make_foods, fill_cart):
+    diner = make_user()
+    food_ids = make_foods(2, stock=20)
+    fill_cart(diner, food_ids, quantity=3)
+    order_id = client.post("/order/create", headers=diner).json()["order_id"]
+
+    assert sweep(ttl_seconds=0) == 1
+
+    with database.SessionLocal() as db:
+        assert db.get(Order, order_id).status == "cancelled"
+    # A pending order never took stock, so expiring it must not add any
+    assert stock_of(food_ids) == {food_id: 20 for food_id in food_ids}
+    assert sweep(ttl_seconds=0) == 0
+
+    # The user can order again
+    assert client.post("/order/create", headers=diner).status_code == 200
+
+
+def test_sweep_leaves_fresh_and_paid_orders(client, make_user, make_foods, fill_cart):
+    first, second = make_user("first@example.com"), make_user("second@example.com")
+    food_id = make_foods(1, stock=20)[0]
+    fill_cart(first, [food_id], quantity=2)
+    fill_cart(second, [food_id], quantity=2)
+    paid = client.post("/order/create", headers=first).json()["order_id"]
+    fresh = client.post("/order/create", headers=second).json()["order_id"]
+    assert client.post("/pay", params={"order_id": paid, "payment_method": "card"}, headers=first).status_code == 200
+
+    assert sweep(ttl_seconds=3600) == 0
+    assert sweep(ttl_seconds=0) == 1
+
+    with database.SessionLocal() as db:
+        assert db.get(Order, paid).status == "paid"
+        assert db.get(Order, fresh).status == "cancelled"
+    assert stock_of([food_id]) == {food_id: 18}
@@ -0,0 +1,119 @@
+import base64
+import json
+
+import pytest
+from sqlalchemy import update
+
+from app import database
+from app.models import Food
+from app.pagination import NEXT_CURSOR_HEADER, encode_cursor, stream_json_array
+from app.routes.auth import food_list_adapter
+
+
+def walk(client, path, limit):
+    #Follows X-Next-Cursor from the first page; returns each page's ids
+    pages, after = [], None
+    while True:
+        params = {"limit": limit} if after is None else {"limit": limit, "after": after}
+        response = client.get(path, params=params)
+        assert response.status_code == 200, response.text
+        pages.append([row["id"] for row in response.json()])
+        after = response.headers.get(NEXT_CURSOR_HEADER)
+        if after is None:
+            return pages
+
+
+def signup(client, count):
+    for n in range(count):
+        response = client.post("/signup", json={
+            "email": f"user{n}@example.com", "phone": f"080{n}", "password": "secret-password",
+        })
+        assert response.status_code == 200, response.text
+
+
+def test_foods_pages_end_without_a_cursor(client, make_foods):
+    ids = make_foods(5)
+
+    assert walk(client, "/foods", limit=2) == [ids[0:2], ids[2:4], ids[4:5]]
+    # A full last page still ends the walk, with no empty page after it
+    assert walk(client, "/foods", limit=5) == [ids]
+    assert walk(client, "/foods", limit=10) == [ids]
+
+
+def test_users_pages_follow_the_cursor(client):
+    signup(client, 3)
+
+    pages = walk(client, "/users", limit=2)
+
+    assert [len(page) for page in pages] == [2, 1]
+    assert pages[0] + pages[1] == sorted(pages[0] + pages[1])
+
+
+def test_pages_start_after_the_cursor(client, make_foods):
+    ids = make_foods(4)
+
+    response = client.get("/foods", params={"after": encode_cursor(ids[1]), "limit": 10})
+
+    assert [food["id"] for food in response.json()] == ids[2:]
+    assert NEXT_CURSOR_HEADER not in response.headers
+
+
+@pytest.mark.parametrize("cursor", [
+    "not-a-cursor",
+    base64.urlsafe_b64encode(b'{"id": "seven"}').decode(),
+    base64.urlsafe_b64encode(b'{"at": 1}').decode(),
+    base64.urlsafe_b64encode(b"[1, 2]").decode(),
+    encode_cursor(3)[:-2],
+])
+@pytest.mark.parametrize("path", ["/foods", "/users"])
+def test_invalid_cursor_is_400(client, path, cursor):
+    response = client.get(path, params={"after": cursor, "limit": 2})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_stream_foods_is_the_whole_available_menu(client, make_foods):
+    ids = make_foods(5)
+    with database.SessionLocal() as db:
+        db.execute(update(Food).where(Food.id == ids[1]).values(is_available=False))
+        db.commit()
+
+    response = client.get("/foods", params={"stream": "true"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert [food["id"] for food in response.json()] == [ids[0]] + ids[2:]
+
+    response = client.get("/foods", params={"stream": "true", "after": encode_cursor(ids[2])})
+    assert [food["id"] for food in response.json()] == ids[3:]
+
+
+def test_stream_users(client):
+    signup(client, 3)
+
+    users = client.get("/users", params={"stream": "true"}).json()
+
+    assert [user["email"] for user in users] == [f"user{n}@example.com" for n in range(3)]
+    assert set(users[0]) == {"id", "email", "phone"}
+
+
+def test_stream_joins_chunks_into_one_array(client, make_foods):
+    ids = make_foods(5)
+    chunks = stream_json_array(Food, Food.id, food_list_adapter, chunk_size=2)
+
+    async def collect():
+        return [chunk async for chunk in chunks]
+
+    # An async generator under DB_MODE=async; run it on the app's event loop
+    body = client.portal.call(collect) if hasattr(chunks, "__aiter__") else list(chunks)
+
+    assert len(body) == 5  # "[", three chunks, "]"
+    assert [food["id"] for food in json.loads(b"".join(body))] == ids
+
+
+def test_stream_of_nothing_is_an_empty_array(client):
+    response = client.get("/users", params={"stream": "true"})
+
+    assert response.status_code == 200
+    assert response.json() == []
@@ -0,0 +1,109 @@
+import asyncio
+import threading
+from dataclasses import replace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from app import database
+from app.main import create_app
+from app.models import User
+from app.utils.security import HashingBusy, HashingPool
+
+
+class Blocker:
+    #A stand-in hash job that runs until released
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.started.set()
+        self.release.wait(5)
+
+
+def occupy(pool, blocker):
+    #Runs blocker on pool from another thread (its own event loop)
+    thread = threading.Thread(target=asyncio.run, args=(pool.run(blocker),))
+    thread.start()
+    assert blocker.started.wait(5)
+    return thread
+
+
+@pytest.fixture
+def pool():
+    pool = HashingPool(workers=1, max_pending=1, rounds=4)
+    yield pool
+    pool.shutdown()
+
+
+def test_pool_rejects_work_beyond_its_bound(pool):
+    blocker = Blocker()
+    thread = occupy(pool, blocker)
+
+    with pytest.raises(HashingBusy) as busy:
+        asyncio.run(pool.run(lambda: None))
+    assert busy.value.status_code == 503
+    assert busy.value.headers == {"Retry-After": "1"}
+
+    blocker.release.set()
+    thread.join(5)
+    assert asyncio.run(pool.run(lambda: "free again")) == "free again"
+
+
+def test_cancelled_request_keeps_its_slot_until_the_hash_finishes(pool):
+    blocker = Blocker()
+
+    async def disconnect_mid_hash():
+        request = asyncio.ensure_future(pool.run(blocker))
+        await asyncio.to_thread(blocker.started.wait, 5)
+        request.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await request
+        # The thread is still hashing, so the slot is still taken
+        with pytest.raises(HashingBusy):
+            await pool.run(lambda: None)
+
+    asyncio.run(disconnect_mid_hash())
+    blocker.release.set()
+    pool._executor.submit(lambda: None).result(5)  # the blocker has finished
+    assert asyncio.run(pool.run(lambda: "free again")) == "free again"
+
+
+def test_signup_answers_503_when_the_hashing_pool_is_full(settings, client, app):
+    app.state.hashing_pool.shutdown()
+    app.state.hashing_pool = HashingPool(workers=1, max_pending=1, rounds=4)
+    blocker = Blocker()
+    thread = occupy(app.state.hashing_pool, blocker)
+    try:
+        response = client.post("/signup", json={"email": "busy@example.com", "phone": "0801",
+                                                "password": "secret-password"})
+    finally:
+        blocker.release.set()
+        thread.join(5)
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def stored_hash(email):
+    with database.SessionLocal() as db:
+        return db.execute(select(User.hashed_password).where(User.email == email)).scalar_one()
+
+
+def test_login_rehashes_with_the_apps_work_factor(settings, client, make_user):
+    make_user("rounds@example.com", "secret-password")
+    assert stored_hash("rounds@example.com").startswith("$2b$04$")
+
+    stronger = create_app(replace(settings, bcrypt_rounds=5))
+    with TestClient(stronger) as upgraded:
+        response = upgraded.post("/login", json={"email": "rounds@example.com", "password": "secret-password"})
+        assert response.status_code == 200, response.text
+        assert stored_hash("rounds@example.com").startswith("$2b$05$")
+
+        # Already current: nothing to upgrade
+        before = stored_hash("rounds@example.com")
+        assert upgraded.post("/login", json={"email": "rounds@example.com",
+                                             "password": "secret-password"}).status_code == 200
+        assert stored_hash("rounds@example.com") == before
@@ -0,0 +1,33 @@
+def pay(client, headers, order_id):
+    return client.post("/pay", params={"order_id": order_id, "payment_method": "card"}, headers=headers)
+
+
+def test_pay_empties_the_cart_in_its_own_transaction(client, make_user, make_foods, fill_cart):
+    diner = make_user()
+    food_ids = make_foods(2)
+    fill_cart(diner, food_ids, quantity=2)
+    order_id = client.post("/order/create", headers=diner).json()["order_id"]
+
+    assert pay(client, diner, order_id).status_code == 200
+
+    # No background job has run, and the paid cart is already gone
+    cart = client.get("/cart", headers=diner).json()
+    assert cart == {"items": [], "item_count": 0, "total": 0}
+    response = client.post("/order/create", headers=diner)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Cart is empty"
+
+
+def test_items_added_after_pay_are_kept(client, app, make_user, make_foods, fill_cart, sent_messages):
+    diner = make_user()
+    paid_food, later_food = make_foods(2, price=50.0)
+    fill_cart(diner, [paid_food])
+    order_id = client.post("/order/create", headers=diner).json()["order_id"]
+    assert pay(client, diner, order_id).status_code == 200
+
+    fill_cart(diner, [later_food], quantity=3)
+    sent_messages(app)  # runs the receipt job queued by /pay
+
+    cart = client.get("/cart", headers=diner).json()
+    assert [(item["quantity"], item["price"]) for item in cart["items"]] == [(3, 50.0)]
+    assert (cart["item_count"], cart["total"]) == (3, 150.0)
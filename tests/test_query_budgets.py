@@ -0,0 +1,154 @@
+import pytest
+
+#One request per budgeted route, so app/pytest_plugin.py checks each
+#route's @query_budget against what it actually runs. The plugin fails the
+#test on its own; report_for also makes sure the request was seen.
+#Requests made in fixtures run before the plugin starts listening, so each
+#test makes the request it checks itself.
+
+
+def report_for(query_reports, method, route):
+    reports = [report for report in query_reports if (report.method, report.route) == (method, route)]
+    assert reports, f"no request to {method} {route} was recorded"
+    report = reports[-1]
+    assert report.budget is not None, f"{method} {route} has no @query_budget"
+    assert report.queries <= report.budget, report
+    return report
+
+
+@pytest.fixture
+def diner(make_user):
+    return make_user()
+
+
+@pytest.fixture
+def cart(client, diner, make_foods, fill_cart):
+    food_ids = make_foods(3)
+    fill_cart(diner, food_ids, quantity=2)
+    return food_ids
+
+
+@pytest.fixture
+def order_id(client, diner, cart):
+    response = client.post("/order/create", headers=diner)
+    assert response.status_code == 200, response.text
+    return response.json()["order_id"]
+
+
+def test_signup(client, query_reports):
+    response = client.post("/signup", json={"email": "new@example.com", "phone": "0801", "password": "secret-password"})
+    assert response.status_code == 200, response.text
+    report_for(query_reports, "POST", "/signup")
+
+
+def test_verify(make_user, query_reports):
+    make_user()
+    report_for(query_reports, "POST", "/verify")
+
+
+def test_login(client, make_user, query_reports):
+    make_user("login@example.com", "secret-password")
+    response = client.post("/login", json={"email": "login@example.com", "password": "secret-password"})
+    assert response.status_code == 200, response.text
+    report_for(query_reports, "POST", "/login")
+
+
+def test_users(client, make_user, query_reports):
+    make_user()
+    assert client.get("/users").status_code == 200
+    report_for(query_reports, "GET", "/users")
+
+
+def test_create_food(make_foods, query_reports):
+    make_foods(1)
+    report_for(query_reports, "POST", "/food")
+
+
+def test_foods(client, make_foods, query_reports):
+    make_foods(5)
+    response = client.get("/foods")
+    assert response.status_code == 200 and len(response.json()) == 5
+    report_for(query_reports, "GET", "/foods")
+
+
+def test_food_search(client, make_foods, query_reports):
+    make_foods(5)
+    response = client.get("/foods/search", params={"q": "dish"})
+    assert response.status_code == 200 and len(response.json()) == 5
+    report_for(query_reports, "GET", "/foods/search")
+
+
+def test_cart_add(client, diner, cart, query_reports):
+    response = client.post("/cart/add", json={"food_id": cart[0], "quantity": 1}, headers=diner)
+    assert response.status_code == 200, response.text
+    report_for(query_reports, "POST", "/cart/add")
+
+
+def test_cart_remove_item(client, diner, cart, query_reports):
+    assert client.delete("/cart/item", params={"food_id": cart[0]}, headers=diner).status_code == 200
+    report_for(query_reports, "DELETE", "/cart/item")
+
+
+def test_cart_update(client, diner, cart, query_reports):
+    response = client.put("/cart/update", params={"food_id": cart[0], "quantity": 5}, headers=diner)
+    assert response.status_code == 200, response.text
+    report_for(query_reports, "PUT", "/cart/update")
+
+
+def test_cart_batch(client, diner, cart, make_foods, query_reports):
+    new_food = make_foods(1)[0]
+    response = client.post("/cart/batch", headers=diner, json={"operations": [
+        {"op": "add", "food_id": new_food, "quantity": 1},
+        {"op": "update", "food_id": cart[0], "quantity": 4},
+        {"op": "remove", "food_id": cart[1]},
+    ]})
+    assert response.status_code == 200, response.text
+    report_for(query_reports, "POST", "/cart/batch")
+
+
+def test_cart_clear(client, diner, cart, query_reports):
+    assert client.delete("/cart/clear", headers=diner).status_code == 200
+    report_for(query_reports, "DELETE", "/cart/clear")
+
+
+def test_cart(client, diner, cart, query_reports):
+    response = client.get("/cart", headers=diner)
+    assert response.status_code == 200 and len(response.json()["items"]) == 3
+    report_for(query_reports, "GET", "/cart")
+
+
+def test_cart_summary(client, diner, cart, query_reports):
+    response = client.get("/cart/summary", headers=diner)
+    assert response.json() == {"item_count": 6, "total": 600.0}
+    report_for(query_reports, "GET", "/cart/summary")
+
+
+def test_order_create(client, diner, cart, query_reports):
+    response = client.post("/order/create", headers=diner)
+    assert response.status_code == 200, response.text
+    report_for(query_reports, "POST", "/order/create")
+
+
+def test_orders(client, diner, order_id, query_reports):
+    response = client.get("/orders", headers=diner)
+    assert [order["order_id"] for order in response.json()] == [order_id]
+    report_for(query_reports, "GET", "/orders")
+
+
+def test_order_cancel(client, diner, order_id, query_reports):
+    response = client.post("/order/cancel", params={"order_id": order_id}, headers=diner)
+    assert response.status_code == 200, response.text
+    report_for(query_reports, "POST", "/order/cancel")
+
+
+def test_pay(client, diner, order_id, query_reports):
+    response = client.post("/pay", params={"order_id": order_id, "payment_method": "card"}, headers=diner)
+    assert response.status_code == 200, response.text
+    report_for(query_reports, "POST", "/pay")
+
+
+@pytest.mark.parametrize("path", ["/reports/revenue", "/reports/top-dishes", "/reports/average-basket"])
+def test_reports(client, diner, order_id, path, query_reports):
+    client.post("/pay", params={"order_id": order_id, "payment_method": "card"}, headers=diner)
+    assert client.get(path).status_code == 200
+    report_for(query_reports, "GET", path)
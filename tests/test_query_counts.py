@@ -0,0 +1,36 @@
+#The cart and order routes load every line with a fixed number of
+#statements, so their query counts must not grow with the cart.
+
+SMALL, LARGE = 1, 45
+ROUTES = [("GET", "/cart"), ("POST", "/order/create"), ("POST", "/pay")]
+
+
+def checkout(client, headers):
+    assert client.get("/cart", headers=headers).status_code == 200
+    response = client.post("/order/create", headers=headers)
+    assert response.status_code == 200, response.text
+    response = client.post("/pay", params={"order_id": response.json()["order_id"], "payment_method": "card"},
+                           headers=headers)
+    assert response.status_code == 200, response.text
+
+
+def queries_by_route(query_reports):
+    counts = {(report.method, report.route): report.queries for report in query_reports}
+    return {route: counts[route] for route in ROUTES}
+
+
+def test_query_counts_do_not_grow_with_the_cart(client, make_user, make_foods, fill_cart, query_reports):
+    food_ids = make_foods(LARGE)
+    small, large = make_user("small@example.com"), make_user("large@example.com")
+    fill_cart(small, food_ids[:SMALL])
+    fill_cart(large, food_ids, quantity=2)
+
+    query_reports.clear()
+    checkout(client, small)
+    small_counts = queries_by_route(query_reports)
+
+    query_reports.clear()
+    checkout(client, large)
+    large_counts = queries_by_route(query_reports)
+
+    assert large_counts == small_counts
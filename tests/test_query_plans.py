@@ -0,0 +1,43 @@
+from dataclasses import replace
+
+import pytest
+
+from app import migrations
+from app.config import settings as default_settings
+from app.database import build_engine
+from app.query_plans import HOT_QUERIES, check_query_plans, explain, is_full_scan
+
+
+@pytest.fixture(scope="module")
+def engine(tmp_path_factory):
+    #A fresh SQLite database migrated to the current schema
+    path = tmp_path_factory.mktemp("plans") / "plans.db"
+    engine = build_engine(replace(default_settings, database_url=f"sqlite:///{path}"))
+    migrations.ensure_schema(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.parametrize("name", list(HOT_QUERIES))
+def test_hot_query_uses_an_index(engine, name):
+    with engine.connect() as conn:
+        plan = explain(conn, HOT_QUERIES[name])
+    assert plan
+    assert not [detail for detail in plan if is_full_scan(detail)], plan
+
+
+def alter_schema(engine, sql):
+    with engine.begin() as conn:
+        conn.exec_driver_sql(sql)
+    # Pooled connections keep prepared EXPLAINs, which never see schema changes
+    engine.dispose()
+
+
+def test_check_query_plans_reports_a_dropped_index(engine):
+    assert check_query_plans(engine) == {}
+
+    alter_schema(engine, "DROP INDEX ix_payments_order_id")
+    try:
+        assert list(check_query_plans(engine)) == ["payment by order"]
+    finally:
+        alter_schema(engine, "CREATE INDEX ix_payments_order_id ON payments (order_id)")
@@ -0,0 +1,125 @@
+import asyncio
+from dataclasses import replace
+
+import pytest
+
+from app.rate_limit import MemoryBuckets
+from app.utils.security import HashingPool
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def take(buckets, key, rate=1.0, burst=2):
+    return asyncio.run(buckets.take(key, rate, burst))
+
+
+def test_bucket_allows_a_burst_then_says_how_long_to_wait():
+    buckets = MemoryBuckets(max_keys=10, clock=Clock())
+    assert take(buckets, "a") == 0
+    assert take(buckets, "a") == 0
+    assert take(buckets, "a") == pytest.approx(1.0)
+
+
+def test_bucket_refills_over_time_up_to_its_burst():
+    clock = Clock()
+    buckets = MemoryBuckets(max_keys=10, clock=clock)
+    take(buckets, "a"), take(buckets, "a")
+
+    clock.now += 0.5
+    assert take(buckets, "a") == pytest.approx(0.5)
+    clock.now += 0.5
+    assert take(buckets, "a") == 0
+    assert take(buckets, "a") > 0
+
+    clock.now += 60  # long idle: back to burst, not more
+    assert take(buckets, "a") == 0
+    assert take(buckets, "a") == 0
+    assert take(buckets, "a") > 0
+    assert take(buckets, "b") == 0  # other keys have their own bucket
+
+
+def test_least_recently_used_buckets_are_evicted_at_max_keys():
+    buckets = MemoryBuckets(max_keys=2, clock=Clock())
+    take(buckets, "a", burst=1)
+    take(buckets, "b", burst=1)
+    assert take(buckets, "a", burst=1) > 0  # a is now the most recently used
+
+    take(buckets, "c", burst=1)
+
+    assert len(buckets) == 2
+    assert take(buckets, "a", burst=1) > 0  # kept, still empty
+    assert take(buckets, "b", burst=1) == 0  # evicted, starts full again
+
+
+@pytest.fixture
+def settings(settings):
+    return replace(
+        settings,
+        rate_limit_enabled=True,
+        rate_limit_ip_per_minute=1, rate_limit_ip_burst=3,
+        rate_limit_email_per_minute=1, rate_limit_email_burst=2,
+    )
+
+
+def login(client, email):
+    return client.post("/login", json={"email": email, "password": "secret-password"})
+
+
+def test_too_many_attempts_on_one_email_get_a_429(client):
+    assert [login(client, "a@example.com").status_code for _ in range(2)] == [404, 404]
+
+    response = login(client, "a@example.com")
+
+    assert response.status_code == 429
+    assert response.json()["detail"] == "Too many requests, please retry later"
+    assert 1 <= int(response.headers["Retry-After"]) <= 60
+
+
+def test_ip_and_email_buckets_are_separate(client):
+    # Email buckets: each address has its own
+    assert login(client, "a@example.com").status_code == 404
+    assert login(client, "b@example.com").status_code == 404
+    assert login(client, "c@example.com").status_code == 404
+    # IP bucket (3): spent by the three above, whatever the email
+    assert login(client, "d@example.com").status_code == 429
+    # Per route: /verify has its own buckets
+    assert client.post("/verify", json={"email": "d@example.com", "otp": "000000"}).status_code != 429
+
+
+def test_email_is_normalized_for_its_bucket(client):
+    login(client, "a@example.com")
+    login(client, " A@Example.com ")
+    assert login(client, "a@EXAMPLE.com").status_code == 429
+
+
+class CountingPool(HashingPool):
+    def __init__(self):
+        super().__init__(workers=1, max_pending=4, rounds=4)
+        self.runs = 0
+
+    async def run(self, fn, *args):
+        self.runs += 1
+        return await super().run(fn, *args)
+
+
+def test_limit_is_checked_before_any_query_or_hash(client, app, query_reports):
+    app.state.hashing_pool.shutdown()
+    app.state.hashing_pool = pool = CountingPool()
+    body = {"email": "new@example.com", "phone": "0801", "password": "secret-password"}
+    assert client.post("/signup", json=body).status_code == 200
+    assert client.post("/signup", json=body).status_code == 400  # taken, no hash
+    assert pool.runs == 1
+
+    query_reports.clear()
+    response = client.post("/signup", json=body)
+
+    assert response.status_code == 429
+    assert [report.queries for report in query_reports] == [0]
+    assert pool.runs == 1
+    pool.shutdown()
@@ -0,0 +1,36 @@
+import pytest
+from sqlalchemy import select
+
+from app import database, sales_summary
+from app.models import DailyFoodSales, DailySales
+
+
+# The route budgets assume native upserts; the fallback runs up to three
+# statements per summary row instead of one per table
+@pytest.fixture(params=["upsert", pytest.param("portable", marks=pytest.mark.query_budget(16))])
+def summary_path(request, monkeypatch):
+    #Native ON CONFLICT upserts, or the fallback other databases get
+    if request.param == "portable":
+        monkeypatch.setattr(sales_summary, "UPSERT_INSERTS", {})
+    return request.param
+
+
+def test_payments_and_cancellations_add_up(summary_path, client, make_user, make_foods, fill_cart):
+    food_id = make_foods(1, price=10.0)[0]
+    first, second, third = (make_user(f"diner{number}@example.com") for number in range(3))
+    for headers, quantity in ((first, 1), (second, 2), (third, 4)):
+        fill_cart(headers, [food_id], quantity=quantity)
+    orders = [client.post("/order/create", headers=headers).json()["order_id"] for headers in (first, second, third)]
+
+    for headers, order_id in zip((first, second), orders):
+        response = client.post("/pay", params={"order_id": order_id, "payment_method": "card"}, headers=headers)
+        assert response.status_code == 200, response.text
+    assert client.post("/order/cancel", params={"order_id": orders[2]}, headers=third).status_code == 200
+
+    with database.SessionLocal() as db:
+        daily = db.execute(select(DailySales.orders_paid, DailySales.items_sold, DailySales.revenue,
+                                  DailySales.orders_cancelled)).all()
+        per_food = db.execute(select(DailyFoodSales.food_id, DailyFoodSales.quantity, DailyFoodSales.revenue,
+                                     DailyFoodSales.quantity_cancelled)).all()
+    assert daily == [(2, 3, 30.0, 1)]
+    assert per_food == [(food_id, 3, 30.0, 4)]
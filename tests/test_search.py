@@ -0,0 +1,115 @@
+import pytest
+from sqlalchemy import update
+
+from app import database, search
+from app.models import Food
+from app.pagination import NEXT_CURSOR_HEADER
+
+DISHES = [
+    ("Jollof Rice", "smoky party rice"),
+    ("Fried Rice", "rice with mixed vegetables"),
+    ("Chicken Stew", "served with rice or yam"),
+    ("Egusi Soup", "melon seed soup"),
+    ("Ofada Sauce", "spicy pepper sauce with local rice"),
+    ("Riceberry Salad", "grain salad"),
+]
+
+
+@pytest.fixture
+def menu(client):
+    #Creates DISHES; returns {name: id}
+    ids = {}
+    for name, description in DISHES:
+        response = client.post("/food", json={"name": name, "description": description, "price": 10.0})
+        assert response.status_code == 200, response.text
+        ids[name] = response.json()["id"]
+    return ids
+
+
+def names(client, q, **params):
+    response = client.get("/foods/search", params={"q": q, **params})
+    assert response.status_code == 200, response.text
+    return [food["name"] for food in response.json()]
+
+
+def walk(pages):
+    #Follows X-Next-Cursor through pages(after); returns each page's names
+    result, after = [], None
+    while True:
+        foods, after = pages(after)
+        result.append(foods)
+        if after is None:
+            return result
+
+
+def test_every_word_matches_as_a_prefix(client, menu):
+    assert names(client, "jol ri") == ["Jollof Rice"]
+    assert names(client, "JOLLOF") == ["Jollof Rice"]
+    assert names(client, "egu soup") == ["Egusi Soup"]
+    # Only word starts match, and every word must
+    assert names(client, "llof") == []
+    assert names(client, "jollof soup") == []
+    # Punctuation and FTS syntax are just separators
+    assert names(client, '"jollof*') == ["Jollof Rice"]
+    assert names(client, "jollof OR egusi") == []
+
+
+def test_query_without_words_is_400(client, menu):
+    response = client.get("/foods/search", params={"q": "*!?"})
+
+    assert response.status_code == 400
+
+
+def test_name_matches_rank_before_description_matches(client, menu):
+    found = names(client, "rice")
+
+    by_name = {"Jollof Rice", "Fried Rice", "Riceberry Salad"}
+    assert set(found[:3]) == by_name
+    assert set(found[3:]) == {"Chicken Stew", "Ofada Sauce"}
+
+
+def test_paging_walks_the_same_ranking(client, menu):
+    everything = names(client, "rice")
+
+    def pages(after):
+        params = {"q": "rice", "limit": 2, **({"after": after} if after else {})}
+        response = client.get("/foods/search", params=params)
+        assert response.status_code == 200, response.text
+        return [food["name"] for food in response.json()], response.headers.get(NEXT_CURSOR_HEADER)
+
+    result = walk(pages)
+
+    assert [len(page) for page in result] == [2, 2, 1]
+    assert [name for page in result for name in page] == everything
+
+
+def test_unavailable_dishes_are_skipped_and_new_ones_found(client, menu):
+    assert "Fried Rice" in names(client, "rice")  # ranking now cached
+    with database.SessionLocal() as db:
+        db.execute(update(Food).where(Food.id == menu["Fried Rice"]).values(is_available=False))
+        db.commit()
+    client.post("/food", json={"name": "Coconut Rice", "description": "rice in coconut milk", "price": 10.0})
+
+    found = names(client, "rice")
+
+    assert "Fried Rice" not in found
+    assert "Coconut Rice" in found
+
+
+def test_like_fallback(client, menu):
+    # The query other databases run, here on SQLite
+    def like(q, after=None, limit=10):
+        with database.SessionLocal() as db:
+            foods, next_cursor = search.search_page(db, search.like_matches(search.search_terms(q)), after, limit)
+            return [food.name for food in foods], next_cursor
+
+    assert like("jol ri")[0] == ["Jollof Rice"]
+    assert like("llof")[0] == []
+    assert like("100%")[0] == []  # LIKE wildcards in the query are literal
+
+    # Name matches first, then by id
+    ranked = ["Jollof Rice", "Fried Rice", "Riceberry Salad", "Chicken Stew", "Ofada Sauce"]
+    assert like("rice")[0] == ranked
+
+    pages = walk(lambda after: like("rice", after, limit=2))
+    assert pages == [ranked[0:2], ranked[2:4], ranked[4:5]]
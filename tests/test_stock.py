@@ -0,0 +1,83 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import func, select
+
+from app import database
+from app.models import Food, Payment
+
+DINERS = 24
+
+
+def stock_of(food_id):
+    with database.SessionLocal() as db:
+        return db.execute(select(Food.stock).where(Food.id == food_id)).scalar_one()
+
+
+@pytest.fixture
+def hot_food_orders(client, make_user, make_foods, fill_cart):
+    #DINERS users with one pending order each for quantity of the same food
+    def make(stock, quantity):
+        food_id = make_foods(1, stock=stock)[0]
+        orders = []
+        for number in range(DINERS):
+            headers = make_user(f"diner{number}@example.com")
+            fill_cart(headers, [food_id], quantity=quantity)
+            response = client.post("/order/create", headers=headers)
+            assert response.status_code == 200, response.text
+            orders.append((headers, response.json()["order_id"]))
+        return food_id, orders
+    return make
+
+
+def pay_all_at_once(client, orders):
+    #Every /pay released together from its own thread; returns the responses
+    start = threading.Barrier(len(orders))
+
+    def pay(order):
+        headers, order_id = order
+        start.wait()
+        return client.post("/pay", params={"order_id": order_id, "payment_method": "card"}, headers=headers)
+
+    with ThreadPoolExecutor(len(orders)) as pool:
+        return list(pool.map(pay, orders))
+
+
+@pytest.mark.parametrize("stock, quantity", [(10, 1), (20, 3)])
+def test_concurrent_payments_never_oversell(client, hot_food_orders, stock, quantity):
+    food_id, orders = hot_food_orders(stock, quantity)
+
+    responses = pay_all_at_once(client, orders)
+
+    paid = [response for response in responses if response.status_code == 200]
+    refused = [response for response in responses if response.status_code != 200]
+    assert len(paid) == stock // quantity
+    assert all(response.status_code == 400 and "Not enough stock" in response.json()["detail"]
+               for response in refused)
+    assert stock_of(food_id) == stock - len(paid) * quantity
+    with database.SessionLocal() as db:
+        assert db.execute(select(func.count()).select_from(Payment)).scalar() == len(paid)
+
+
+def test_concurrent_payments_lose_no_updates(client, hot_food_orders):
+    food_id, orders = hot_food_orders(stock=100, quantity=3)
+
+    responses = pay_all_at_once(client, orders)
+
+    assert [response.status_code for response in responses] == [200] * DINERS
+    # Every decrement landed: a read-modify-write race would leave more behind
+    assert stock_of(food_id) == 100 - DINERS * 3
+
+
+def test_cancel_leaves_stock_alone(client, make_user, make_foods, fill_cart):
+    diner = make_user()
+    food_id = make_foods(1, stock=20)[0]
+    fill_cart(diner, [food_id], quantity=4)
+    order_id = client.post("/order/create", headers=diner).json()["order_id"]
+
+    response = client.post("/order/cancel", params={"order_id": order_id}, headers=diner)
+
+    assert response.status_code == 200, response.text
+    # Creating the order took no stock, so cancelling it must not add any
+    assert stock_of(food_id) == 20
@@ -0,0 +1,121 @@
+import base64
+import json
+from dataclasses import replace
+
+import pytest
+
+from app.utils.tokens import InvalidToken, RevocationList, TokenSigner, build_token_signer
+
+
+def signer(keys, ttl_seconds=3600):
+    return TokenSigner({kid: secret.encode() for kid, secret in keys.items()}, ttl_seconds, RevocationList(100))
+
+
+def reencode(part, **changes):
+    data = json.loads(base64.urlsafe_b64decode(part + "=" * (-len(part) % 4)))
+    data.update(changes)
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b"=").decode()
+
+
+def rejects(signer, token, detail="Invalid or expired token"):
+    with pytest.raises(InvalidToken) as error:
+        signer.verify(token)
+    assert error.value.status_code == 401
+    assert error.value.detail == detail
+    return True
+
+
+def test_issued_token_verifies():
+    tokens = signer({"k1": "secret"})
+    user = tokens.verify(tokens.issue(7, True))
+    assert (user.id, user.verified) == (7, True)
+
+
+def test_expired_token_is_rejected():
+    tokens = signer({"k1": "secret"}, ttl_seconds=0)
+    assert rejects(tokens, tokens.issue(7, True))
+
+
+def test_bad_signature_and_tampered_payload_are_rejected():
+    tokens = signer({"k1": "secret"})
+    header, payload, signature = tokens.issue(7, False).split(".")
+
+    forged = signer({"k1": "other secret"}).issue(7, False)
+    assert rejects(tokens, forged)
+    flipped = ("B" if signature[0] == "A" else "A") + signature[1:]
+    assert rejects(tokens, ".".join([header, payload, flipped]))
+    # Promote ourselves to verified, or to someone else, keeping the signature
+    assert rejects(tokens, ".".join([header, reencode(payload, ver=True), signature]))
+    assert rejects(tokens, ".".join([header, reencode(payload, sub="1"), signature]))
+    assert rejects(tokens, "not-a-token")
+
+
+def test_unknown_kid_is_rejected():
+    assert rejects(signer({"k1": "secret"}), signer({"k2": "secret"}).issue(7, True))
+
+
+def test_rotation_keeps_old_tokens_valid_while_the_new_key_signs():
+    old = signer({"k1": "old secret"})
+    rotated = signer({"k2": "new secret", "k1": "old secret"})
+    old_token = old.issue(7, True)
+
+    assert rotated.verify(old_token).id == 7
+    new_token = rotated.issue(7, True)
+    assert json.loads(base64.urlsafe_b64decode(new_token.split(".")[0] + "==="))["kid"] == "k2"
+    # Servers still on the old key list cannot check the new tokens
+    assert rejects(old, new_token)
+    # Once k1 is dropped, its tokens stop working
+    assert rejects(signer({"k2": "new secret"}), old_token)
+
+
+def test_logout_revokes_the_token(client, make_user):
+    diner = make_user()
+    assert client.get("/cart", headers=diner).status_code == 200
+
+    assert client.post("/logout", headers=diner).status_code == 200
+
+    response = client.get("/cart", headers=diner)
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Token has been revoked"
+    assert response.headers["WWW-Authenticate"] == "Bearer"
+
+
+def test_missing_token_is_a_401(client):
+    response = client.get("/cart")
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Not authenticated"
+
+
+def test_unverified_user_gets_a_400(client):
+    credentials = {"email": "new@example.com", "password": "secret-password"}
+    assert client.post("/signup", json={**credentials, "phone": "0801"}).status_code == 200
+    token = client.post("/login", json=credentials).json()["access_token"]
+
+    response = client.get("/cart", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "User not verified"
+
+
+def test_signer_needs_token_keys_outside_single_worker_development(settings, monkeypatch):
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    without_keys = replace(settings, token_keys="")
+
+    with pytest.raises(ValueError, match="APP_ENV is 'production'"):
+        build_token_signer(replace(without_keys, app_env="production"))
+
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    with pytest.raises(ValueError, match="several workers"):
+        build_token_signer(replace(without_keys, app_env="development"))
+
+    monkeypatch.setenv("WEB_CONCURRENCY", "1")
+    assert list(build_token_signer(replace(without_keys, app_env="development")).keys) == ["dev"]
+
+    configured = build_token_signer(replace(without_keys, app_env="production", token_keys="k2:new,k1:old"))
+    assert configured.active_kid == "k2"
+    assert configured.keys == {"k2": b"new", "k1": b"old"}
+
+
+def test_malformed_token_keys_are_refused(settings):
+    with pytest.raises(ValueError, match="kid:secret"):
+        build_token_signer(replace(settings, token_keys="no-secret-here"))
@@ -0,0 +1,110 @@
+import threading
+from dataclasses import replace
+
+import pytest
+from sqlalchemy import insert, select
+
+from fastapi.testclient import TestClient
+
+from app import migrations
+from app.database import build_engine
+from app.diagnostics import RequestTrace, current_trace, is_savepoint_statement
+from app.main import create_app
+from app.metrics import registry
+from app.models import Food
+from app.write_queue import WriteQueue, build_write_queue
+
+
+@pytest.fixture
+def queue(settings):
+    settings = replace(settings, sqlite_serial_writes=True, write_batch_size=8)
+    engine = build_engine(settings)
+    migrations.ensure_schema(engine)
+    queue = WriteQueue(settings)
+    queue.start()
+    yield queue, engine
+    queue.stop()
+    engine.dispose()
+
+
+def add_food(db, name, fail=False):
+    db.execute(insert(Food).values(name=name, description="test dish", price=1.0))
+    if fail:
+        raise ValueError(name)
+    db.commit()
+    return name
+
+
+def test_failed_unit_rolls_back_only_its_own_savepoint(queue):
+    queue, engine = queue
+    running, release = threading.Event(), threading.Event()
+
+    def block(db):
+        running.set()
+        release.wait(5)
+
+    first = queue.submit(block)
+    running.wait(5)
+    # Queued while the writer is busy, so these three share one batch
+    futures = [queue.submit(add_food, "kept 1"), queue.submit(add_food, "lost", fail=True),
+               queue.submit(add_food, "kept 2")]
+    release.set()
+
+    first.result(5)
+    assert futures[0].result(5) == "kept 1"
+    with pytest.raises(ValueError):
+        futures[1].result(5)
+    assert futures[2].result(5) == "kept 2"
+    with engine.connect() as conn:
+        assert conn.execute(select(Food.name).order_by(Food.name)).scalars().all() == ["kept 1", "kept 2"]
+
+
+def test_unit_queries_count_without_the_savepoints(queue):
+    queue, _ = queue
+    trace = RequestTrace()
+    token = current_trace.set(trace)
+    try:
+        future = queue.submit(add_food, "counted")
+    finally:
+        current_trace.reset(token)
+
+    future.result(5)
+    assert trace.queries == 1  # the INSERT; SAVEPOINT and RELEASE are the writer's
+
+
+@pytest.mark.parametrize("statement, expected", [
+    ("SAVEPOINT sa_savepoint_1", True),
+    ("RELEASE SAVEPOINT sa_savepoint_1", True),
+    ("ROLLBACK TO SAVEPOINT sa_savepoint_1", True),
+    ("SELECT savepoint FROM notes", False),
+    ("INSERT INTO foods (name) VALUES (?)", False),
+])
+def test_is_savepoint_statement(statement, expected):
+    assert is_savepoint_statement(statement) is expected
+
+
+def test_each_app_has_its_own_writer(settings):
+    settings = replace(settings, sqlite_serial_writes=False)
+    assert build_write_queue(settings) is None
+
+    serial = create_app(replace(settings, sqlite_serial_writes=True))
+    plain = create_app(settings)
+    assert serial.state.write_queue is not None and plain.state.write_queue is None
+
+    with TestClient(serial) as client:
+        assert serial.state.write_queue.running
+        batches = registry.write_batches
+        # Signup writes through db.write: on this app's writer thread
+        client.post("/signup", json={"email": "w@example.com", "phone": "0809", "password": "secret-password"})
+        assert registry.write_batches == batches + 1
+    assert not serial.state.write_queue.running
+
+    with TestClient(plain) as client:
+        batches = registry.write_batches
+        client.post("/signup", json={"email": "p@example.com", "phone": "0808", "password": "secret-password"})
+        assert registry.write_batches == batches
+
+
+def test_serial_writes_need_a_sqlite_file(settings):
+    with pytest.raises(ValueError, match="SQLite database file"):
+        build_write_queue(replace(settings, sqlite_serial_writes=True, database_url="sqlite://"))